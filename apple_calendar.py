@@ -3,34 +3,340 @@
 # dependencies = ["python-caldav"]
 # ///
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+import logging
+
 from caldav import DAVClient
+from caldav.elements import cdav, dav
+from caldav.lib import error
+
+from ics_extract import NotAnEvent, UnsupportedICS, extract_vevent
+from metrics import metrics, payload_size
+from ratelimit import RETRYABLE_STATUSES, RetryableResponse, caldav_scheduler
+from settings_utils import set_apple_sync_token
+
+
+class AppleCalendarChanged(RuntimeError):
+    """The cached Apple calendar is gone and no calendar on the account is known to be it."""
+
+
+class AppleChange:
+    """
+    Compact record of one changed or removed Apple calendar object: UID, href, etag, status
+    ("changed" or "removed") and the VEVENT fields extracted from its ICS. It is made as
+    soon as an object is fetched, so the caldav object and its text can be freed; only ICS
+    the fast extractor cannot handle is kept as data, and parsed with vobject on demand.
+    Removed objects only carry their href.
+    """
+    __slots__ = ("uid", "href", "etag", "status", "fields", "data")
+
+    def __init__(self, href, etag=None, status="changed", fields=None, data=None):
+        self.href = href
+        self.etag = etag
+        self.status = status
+        self.fields = fields
+        self.data = data
+        self.uid = fields["uid"] if fields else None
+
+    @classmethod
+    def from_object(cls, obj, etag=None):
+        data = obj.data
+        if etag is None:
+            etag = (obj.props or {}).get(dav.GetEtag.tag)
+        try:
+            return cls(obj.url.path, etag, fields=extract_vevent(data))
+        except (NotAnEvent, UnsupportedICS):
+            # CalendarSync.transform_event skips or falls back to vobject for these.
+            return cls(obj.url.path, etag, data=data)
+
+    @property
+    def vobject_instance(self):
+        import vobject
+        return vobject.readOne(self.data)
+
+
+class MeteredDAVClient(DAVClient):
+    """
+    DAVClient that sends requests through the CalDAV request scheduler, which retries
+    throttled (429, 503) and failed requests with backoff, and records request latency,
+    errors and bytes per CalDAV operation while metrics are enabled.
+    """
+    def request(self, url, method="GET", body="", headers=None):
+        def send():
+            response = self._send(url, method, body, headers)
+            if response.status == 429 or response.status in RETRYABLE_STATUSES:
+                raise RetryableResponse(response)
+            return response
+
+        try:
+            return caldav_scheduler.call(send)
+        except RetryableResponse as e:
+            # Out of retries: hand the response to caldav, which raises its usual error.
+            return e.response
+
+    def _send(self, url, method, body, headers):
+        if not metrics.enabled:
+            return super().request(url, method, body, headers)
+        operation = method
+        if method == "REPORT":
+            text = body.decode("utf-8", "replace") if isinstance(body, bytes) else body or ""
+            operation = next((f"REPORT {name}" for name in ("sync-collection", "calendar-multiget", "calendar-query")
+                              if name in text), method)
+        with metrics.timer("calsync_caldav_request_seconds", operation=operation):
+            response = super().request(url, method, body, headers)
+        metrics.inc("calsync_http_bytes_total", payload_size(body), service="caldav", direction="sent")
+        metrics.inc("calsync_http_bytes_total", payload_size(getattr(response, "_raw", None)),
+                    service="caldav", direction="received")
+        if response.status >= 400:
+            metrics.inc("calsync_http_errors_total", service="caldav", status=response.status)
+        return response
+
 
 class AppleCalendar:
-    def __init__(self, email, password, url, calendar_index=0):
+    def __init__(self, email, password, url, calendar_index=0, state=None, client=None):
         self.email = email
         self.password = password
         self.url = url
-        self.client = DAVClient(url, username=email, password=password)
-        self.principal = self.client.principal()
-        self.calendars = self.principal.calendars()
-        self.calendar = self.calendars[calendar_index]
+        self.calendar_index = calendar_index
+        # Optional state store used to cache the discovered principal and calendar URLs.
+        self.state = state
+        # Calendars on the same account can share one CalDAV connection.
+        self.client = client or MeteredDAVClient(url, username=email, password=password)
+        self._principal = None
+        self._calendars = None
+        self.calendar = self._cached_calendar() or self._discover()
+
+    @property
+    def principal(self):
+        if self._principal is None:
+            principal_url = self.state.get_token("apple_principal_url") if self._cache_valid() else None
+            self._principal = self.client.principal(url=principal_url) if principal_url else self.client.principal()
+        return self._principal
+
+    @property
+    def calendars(self):
+        if self._calendars is None:
+            self._calendars = self.principal.calendars()
+        return self._calendars
+
+    def _cache_key(self):
+        # The cached calendar is only valid for the account, server and calendar selection it was
+        # resolved for; which calendar it is, is recorded by its URL and display name.
+        return f"{self.url}|{self.email}|{self.calendar_index}"
+
+    def _cache_valid(self):
+        return self.state is not None and self.state.get_token("apple_calendar_key") == self._cache_key()
+
+    def _cached_calendar(self):
+        if not self._cache_valid():
+            return None
+        calendar_url = self.state.get_token("apple_calendar_url")
+        if not calendar_url:
+            return None
+        logging.debug(f"Opening cached Apple calendar {calendar_url}")
+        self.from_cache = True
+        return self.client.calendar(url=calendar_url)
+
+    def _discover(self, rediscover=False):
+        """
+        Resolve the principal and the calendar with PROPFINDs, and cache its URL and display
+        name. A first discovery takes the calendar at calendar_index. Rediscovery, after the
+        cached URL stopped working, looks for the cached calendar by URL and then by name
+        instead, as the calendars may have been reordered since.
+        """
+        logging.debug("Discovering Apple CalDAV principal and calendars")
+        self.from_cache = False
+        self._principal = None
+        self._calendars = None
+        cached_url = cached_name = None
+        if self.state is not None:
+            cached_url = self.state.get_token("apple_calendar_url")
+            cached_name = self.state.get_token("apple_calendar_name")
+        if rediscover:
+            calendar = self._find_calendar(cached_url, cached_name)
+        else:
+            if self.state is not None:
+                self.state.set_token("apple_calendar_key", None)
+            calendar = self.calendars[self.calendar_index]
+        if self.state is not None:
+            with self.state.transaction():
+                if cached_url and str(calendar.url) != cached_url:
+                    # The Apple sync token belongs to the previous collection.
+                    logging.warning(f"Apple calendar is now {calendar.url} (was {cached_url}), performing full sync.")
+                    set_apple_sync_token(None, self.state)
+                self.state.set_token("apple_principal_url", str(self.principal.url))
+                self.state.set_token("apple_calendar_url", str(calendar.url))
+                self.state.set_token("apple_calendar_name", calendar.name)
+                self.state.set_token("apple_calendar_key", self._cache_key())
+        return calendar
+
+    def _find_calendar(self, url, name):
+        """
+        Return the account's calendar with the given URL, or else the only one with the
+        given display name. Raises AppleCalendarChanged (and drops the Apple sync token) if
+        there is none, rather than falling back to whatever is at calendar_index now. The
+        cache stays as it is, so every run fails the same way until the calendar is chosen
+        again with `cli.py configure`.
+        """
+        for calendar in self.calendars:
+            if url and str(calendar.url) == url:
+                return calendar
+        named = [calendar for calendar in self.calendars if name and calendar.name == name]
+        if len(named) == 1:
+            return named[0]
+        if self.state is not None:
+            set_apple_sync_token(None, self.state)
+        raise AppleCalendarChanged(
+            f"Apple calendar {name or '(unnamed)'} at {url} no longer exists"
+            + (" or its name is ambiguous" if named else "")
+            + "; choose the calendar again with `cli.py configure`"
+        )
+
+    def _with_rediscovery(self, request):
+        """
+        Run request against the calendar; if a cached calendar URL turns out to be gone or
+        forbidden, rediscover the calendar once and retry.
+        """
+        try:
+            return request()
+        except (error.NotFoundError, error.AuthorizationError, error.ReportError) as e:
+            message = str(e)
+            stale = isinstance(e, (error.NotFoundError, error.AuthorizationError)) or '403' in message or '404' in message
+            if not self.from_cache or not stale or 'sync-token' in message:
+                raise
+            logging.warning(f"Cached Apple calendar URL failed ({e}), rediscovering")
+            metrics.inc("calsync_retries_total", reason="caldav_rediscovery")
+            self.calendar = self._discover(rediscover=True)
+            return request()
 
     def get_events(self):
         return self.calendar.events()
 
+    def event_by_uid(self, uid):
+        """Return the calendar object with the given UID, or None if the calendar has none."""
+        def lookup():
+            # An unknown UID is an answer, not a sign of a stale calendar URL to rediscover.
+            try:
+                return self.calendar.object_by_uid(uid)
+            except error.NotFoundError:
+                return None
+
+        return self._with_rediscovery(lookup)
+
     def changes(self, sync_token=None):
-        coll = self.calendar.objects_by_sync_token(sync_token=sync_token, load_objects=True)
+        """
+        Return (new_token, changes). The sync-collection REPORT lists the changed hrefs and
+        etags, and changes yields an AppleChange for each, loading the changed objects one at
+        a time as it is consumed.
+        """
+        new_token, members, removed = self._sync_report(sync_token, call="changes")
+        return new_token, self._load_changes(members, removed)
+
+    def changes_in_chunks(self, sync_token=None, chunk_size=100, max_workers=1):
+        """
+        Variant of changes() that fetches the changed objects with calendar-multiget REPORTs
+        of chunk_size hrefs, up to max_workers at a time. Changes are yielded as soon as
+        their chunk has been fetched.
+        """
+        new_token, members, removed = self._sync_report(sync_token)
+        logging.debug(f"Apple sync report: {len(members)} changed, {len(removed)} removed")
+        return new_token, self._fetch_chunks(members, removed, chunk_size, max_workers)
+
+    def changes_in_range(self, start, end, chunk_size=100, max_workers=1):
+        """
+        Full-sync variant of changes() limited to a time range: the sync-collection REPORT
+        only provides the new sync token, and the objects come from events_in_range.
+        """
+        with metrics.timer("calsync_apple_seconds", call="sync_report"):
+            coll = self._with_rediscovery(
+                lambda: self.calendar.objects_by_sync_token(sync_token=None, load_objects=False)
+            )
+        new_token = getattr(coll, 'sync_token', None)
+        return new_token, self.events_in_range(start, end, chunk_size, max_workers)
+
+    def events_in_range(self, start, end, chunk_size=100, max_workers=1):
+        """
+        Yield AppleChanges for the events overlapping [start, end); either bound may be None.
+        A calendar-query REPORT with a time-range filter, which includes recurring series
+        overlapping the range, lists their hrefs and etags, and the objects are fetched in
+        calendar-multiget chunks like changes_in_chunks() does.
+        """
+        with metrics.timer("calsync_apple_seconds", call="time_range"):
+            members = self._with_rediscovery(lambda: self._range_report(start, end))
+        logging.debug(f"Apple time-range query {start} - {end}: {len(members)} events")
+        return self._fetch_chunks(members, [], chunk_size, max_workers)
+
+    def _range_report(self, start, end):
+        """Run the time-range calendar-query REPORT for etags only; returns (object, etag) pairs."""
+        vevent = cdav.CompFilter("VEVENT")
+        if start is not None or end is not None:
+            vevent += cdav.TimeRange(start, end)
+        query = cdav.CalendarQuery() + [dav.Prop() + dav.GetEtag(),
+                                        cdav.Filter() + (cdav.CompFilter("VCALENDAR") + vevent)]
+        _, objects = self.calendar._request_report_build_resultlist(query, props=[dav.GetEtag()],
+                                                                     no_calendardata=True)
+        return [(obj, (obj.props or {}).get(dav.GetEtag.tag)) for obj in objects]
+
+    def _sync_report(self, sync_token, call="sync_report"):
+        """
+        Run the sync-collection REPORT without loading objects. Returns (new_token, members,
+        removed): (object, etag) pairs for changed members and AppleChanges for deleted ones.
+        """
+        with metrics.timer("calsync_apple_seconds", call=call):
+            coll = self._with_rediscovery(
+                lambda: self.calendar.objects_by_sync_token(sync_token=sync_token, load_objects=False)
+            )
         new_token = getattr(coll, 'sync_token', None)
-        added, changed, removed = [], [], []
+        members, removed = [], []
         for obj in coll:
-            status = getattr(obj, '_status', None)
-            if status == 'deleted':
-                removed.append(obj)
-            elif status == 'changed':
-                changed.append(obj)
+            etag = (obj.props or {}).get(dav.GetEtag.tag)
+            # Deleted members come back from the report with a 404 status and no etag.
+            if etag is None:
+                removed.append(AppleChange(obj.url.path, status="removed"))
             else:
-                added.append(obj)
-        return added, changed, removed, new_token
+                members.append((obj, etag))
+        return new_token, members, removed
+
+    @staticmethod
+    def _load_changes(members, removed):
+        yield from removed
+        members = deque(members)
+        while members:
+            obj, etag = members.popleft()
+            try:
+                obj.load()
+            except error.NotFoundError:
+                logging.debug(f"Apple object {obj.url} disappeared before it could be fetched")
+                continue
+            yield AppleChange.from_object(obj, etag)
+
+    def _fetch_chunks(self, members, removed, chunk_size, max_workers):
+        yield from removed
+        etags = {obj.url.path: etag for obj, etag in members}
+        urls = [obj.url for obj, _ in members]
+        chunks = [urls[i:i + chunk_size] for i in range(0, len(urls), chunk_size)]
+        if max_workers <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                yield from self._multiget(chunk, etags)
+            return
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='calsync-caldav') as executor:
+            pending = set()
+            for chunk in chunks:
+                pending.add(executor.submit(self._multiget, chunk, etags))
+                if len(pending) >= max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            for future in as_completed(pending):
+                yield from future.result()
+
+    def _multiget(self, urls, etags):
+        with metrics.timer("calsync_apple_seconds", call="multiget"):
+            objects = list(self.calendar.multiget(urls))
+        if len(objects) < len(urls):
+            logging.debug(f"{len(urls) - len(objects)} Apple objects disappeared before they could be fetched")
+        return [AppleChange.from_object(obj, etags.get(obj.url.path)) for obj in objects]
 
     def get_calendar_names(self):
         return [cal.name for cal in self.calendars]
@@ -0,0 +1,129 @@
+"""
+CLI startup benchmark: wall time of whole `cli.py` processes, interpreter start to exit.
+
+    python -m benchmarks.bench_startup --size 1000 --repeat 5 --output startup.json
+
+Times `cli.py --help`, then `cli.py sync` against local fake CalDAV and Google Calendar
+servers: once for the initial full sync and `--repeat` times for no-change syncs, the
+case a cron job runs every few minutes. Sync runs go through the real CLI in a worker
+process whose Google discovery document points at the fake server.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# The worker process times the CLI's own imports, so this module imports nothing else of
+# calsync at load time.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_worker(args):
+    """Run `cli.py sync` in this process with Google requests sent to the fake server."""
+    import google_calendar
+
+    load_document = google_calendar._discovery_document
+    # Patched lazily, so a no-change sync still does not load the Google client.
+    google_calendar._discovery_document = lambda: dict(load_document(), rootUrl=args.google_url)
+    import cli
+    cli.app(["sync"])
+
+
+def write_settings(directory, caldav_url):
+    from benchmarks.bench_sync import CALENDAR_ID
+
+    with open(os.path.join(directory, "settings.toml"), "w") as f:
+        f.write(
+            'apple_email = "bench@example.com"\n'
+            'apple_password = "bench"\n'
+            f'apple_caldav_url = "{caldav_url}"\n'
+            "apple_calendar_index = 0\n"
+            'google_credentials = "credentials.json"\n'
+            f'google_calendar_id = "{CALENDAR_ID}"\n'
+            "\n[sync]\n"
+            "# The fake server has no quota.\n"
+            "google_qps = 0\n"
+        )
+    # A token that is valid for long enough that no OAuth flow or refresh is attempted.
+    with open(os.path.join(directory, "token.json"), "w") as f:
+        json.dump({
+            "token": "bench", "refresh_token": "bench", "client_id": "bench", "client_secret": "bench",
+            "scopes": ["https://www.googleapis.com/auth/calendar"], "expiry": "2999-01-01T00:00:00Z",
+        }, f)
+
+
+def timed(command, directory):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get("PYTHONPATH")))))
+    start = time.perf_counter()
+    subprocess.run(command, cwd=directory, env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def summarize(name, samples):
+    result = {
+        "command": name,
+        "runs": len(samples),
+        "min_seconds": round(min(samples), 3),
+        "median_seconds": round(statistics.median(samples), 3),
+        "max_seconds": round(max(samples), 3),
+    }
+    print(f"{name:<10} min {result['min_seconds']:>6.3f}s  median {result['median_seconds']:>6.3f}s  "
+          f"max {result['max_seconds']:>6.3f}s  ({len(samples)} runs)", file=sys.stderr)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command")
+    parser.add_argument("--size", type=int, default=1000, help="number of events in the calendar (default: 1000)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per timed command (default: 5)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    worker = subparsers.add_parser("worker", help="run `cli.py sync` against the fake servers (used internally)")
+    worker.add_argument("--google-url", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        run_worker(args)
+        return
+
+    from benchmarks.fake_caldav import FakeCalDAVServer
+    from benchmarks.fake_google import FakeGoogleCalendarServer
+
+    caldav = FakeCalDAVServer().start()
+    google = FakeGoogleCalendarServer().start()
+    caldav.populate(args.size)
+    cli = os.path.join(ROOT, "cli.py")
+    sync_command = [sys.executable, "-m", "benchmarks.bench_startup", "worker", "--google-url", google.url]
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="calsync-startup-") as directory:
+            write_settings(directory, caldav.url)
+            results.append(summarize("help", [timed([sys.executable, cli, "--help"], directory)
+                                              for _ in range(args.repeat)]))
+            results.append(summarize("sync full", [timed(sync_command, directory)]))
+            results.append(summarize("sync noop", [timed(sync_command, directory) for _ in range(args.repeat)]))
+    finally:
+        caldav.stop()
+        google.stop()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "size": args.size,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
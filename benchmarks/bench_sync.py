@@ -0,0 +1,223 @@
+"""
+Offline sync benchmark against local fake CalDAV and Google Calendar servers.
+
+    python -m benchmarks.bench_sync --sizes 1000,10000,100000 --output bench.json
+
+For every calendar size the fake servers are loaded with synthetic events and
+CalendarSync.sync runs in a fresh worker process per scenario (so peak RSS is per run):
+a full sync into empty state, an incremental sync after ~1% of the events changed,
+and a no-op sync. Results are printed and written as JSON for comparing runs.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_caldav import FakeCalDAVServer
+from benchmarks.fake_google import FakeGoogleCalendarServer
+
+CALENDAR_ID = "bench@group.calendar.google.com"
+SCENARIOS = ("full", "incremental", "noop", "expired")
+
+
+def bench_google_calendar(endpoint, **kwargs):
+    """Return a GoogleCalendar whose API and batch requests go to the fake server at endpoint."""
+    from google.oauth2.credentials import Credentials
+
+    import google_calendar
+
+    load_document = google_calendar._discovery_document
+    google_calendar._discovery_document = lambda: dict(load_document(), rootUrl=endpoint)
+    return google_calendar.GoogleCalendar(None, CALENDAR_ID, creds=Credentials(token="bench"), **kwargs)
+
+
+def google_options(settings):
+    """GoogleCalendar keyword arguments from the [sync] settings, as pairs.build_pair_syncs passes them."""
+    sync = settings["sync"]
+    return {
+        "use_import": sync.get("use_import", False),
+        "transport": sync.get("google_transport", "httplib2"),
+        "pool_size": int(sync.get("google_pool_size", 10)),
+        "timeout": float(sync.get("google_timeout", 60)),
+    }
+
+
+def parse_settings(pairs):
+    """Turn ["sync.batch_size=100", ...] into a nested settings dict with JSON-decoded values."""
+    settings = {"sync": {}}
+    for pair in pairs:
+        key, _, value = pair.partition("=")
+        section, _, name = key.rpartition(".")
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        settings.setdefault(section or "sync", {})[name] = value
+    return settings
+
+
+def run_worker(args):
+    """Run one sync in this process and print its measurements as JSON."""
+    from apple_calendar import AppleCalendar
+    from ratelimit import google_scheduler
+    from state_store import open_state_store
+    from sync import CalendarSync
+
+    logging.basicConfig(level=args.log_level.upper())
+    settings = parse_settings(args.set)
+    # The fake server has no quota, so only pace requests when asked to.
+    google_scheduler.configure(rate=settings["sync"].get("google_qps", 0), burst=60,
+                               max_retries=settings["sync"].get("max_retries", 5))
+    state = open_state_store(
+        "sqlite",
+        os.path.join(args.state_dir, "calsync.db"),
+        os.path.join(args.state_dir, "event_map.toml"),
+        os.path.join(args.state_dir, "sync_state.toml"),
+    )
+    start = time.perf_counter()
+    apple_calendar = AppleCalendar("bench@example.com", "bench", args.caldav_url, state=state)
+    google_calendar = bench_google_calendar(args.google_url, **google_options(settings))
+    calendar_sync = CalendarSync(apple_calendar, google_calendar, settings, state=state)
+    stats = calendar_sync.sync()
+    wall = time.perf_counter() - start
+    state.close()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+    events = sum(stats[key] for key in ("inserted", "updated", "deleted", "skipped", "failed"))
+    print(json.dumps({
+        "wall_seconds": round(wall, 3),
+        "events": events,
+        "events_per_second": round(events / wall, 1) if wall else None,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "stats": dict(stats),
+    }))
+
+
+def run_scenario(args, name, state_dir, caldav, google):
+    caldav_before, caldav_bytes = caldav.snapshot()
+    google_before, google_bytes = google.snapshot()
+    command = [
+        sys.executable, "-m", "benchmarks.bench_sync", "worker",
+        "--caldav-url", caldav.url, "--google-url", google.url,
+        "--state-dir", state_dir, "--log-level", args.log_level,
+    ]
+    for setting in args.set:
+        command += ["--set", setting]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(command, cwd=root, check=True, stdout=subprocess.PIPE, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    caldav_after, caldav_bytes_after = caldav.snapshot()
+    google_after, google_bytes_after = google.snapshot()
+    result["scenario"] = name
+    result["http_calls"] = {
+        "caldav": dict(caldav_after - caldav_before),
+        "google": dict(google_after - google_before),
+    }
+    result["http_calls"]["total"] = sum(result["http_calls"]["caldav"].values()) + sum(
+        v for k, v in result["http_calls"]["google"].items() if k != "batch part"
+    )
+    result["response_bytes"] = {
+        "caldav": caldav_bytes_after - caldav_bytes,
+        "google": google_bytes_after - google_bytes,
+    }
+    return result
+
+
+def run_size(args, size, caldav, google):
+    caldav.reset()
+    google.reset()
+    caldav.populate(size)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="calsync-bench-") as state_dir:
+        for scenario in args.scenarios:
+            if scenario == "incremental":
+                changes = caldav.mutate(args.change_fraction)
+            elif scenario == "expired":
+                # Google is only listed when there are Apple changes to send.
+                google.expire_sync_tokens()
+                changes = caldav.mutate(args.change_fraction)
+            else:
+                changes = None
+            result = run_scenario(args, scenario, state_dir, caldav, google)
+            result["size"] = size
+            if changes:
+                result["apple_changes"] = changes
+            results.append(result)
+            print(f"{size:>7} {scenario:<12} {result['wall_seconds']:>8.2f}s {result['events_per_second'] or 0:>9.1f} ev/s "
+                  f"{result['peak_rss_mb']:>7.1f} MB {result['http_calls']['total']:>6} HTTP calls", file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated calendar sizes (default: 1000,10000,100000)")
+    parser.add_argument("--scenarios", default="full,incremental,noop",
+                        help=f"comma-separated scenarios to run in order, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--change-fraction", type=float, default=0.01,
+                        help="fraction of Apple events changed before the incremental sync")
+    parser.add_argument("--caldav-latency", type=float, default=0.0, help="seconds added to every CalDAV request")
+    parser.add_argument("--google-latency", type=float, default=0.0, help="seconds added to every Google request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="probability that a Google request is answered with 429")
+    parser.add_argument("--google-quota", type=float, default=0.0,
+                        help="Google requests per second above which the fake server answers 403 rateLimitExceeded")
+    parser.add_argument("--set", action="append", default=[], metavar="SECTION.KEY=VALUE",
+                        help="settings override, e.g. --set sync.batch_size=100 (repeatable)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--log-level", default="warning")
+    worker = subparsers.add_parser("worker", help="run a single sync (used internally)")
+    worker.add_argument("--caldav-url", required=True)
+    worker.add_argument("--google-url", required=True)
+    worker.add_argument("--state-dir", required=True)
+    worker.add_argument("--set", action="append", default=[])
+    worker.add_argument("--log-level", default="warning")
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        run_worker(args)
+        return
+
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    caldav = FakeCalDAVServer(latency=args.caldav_latency).start()
+    google = FakeGoogleCalendarServer(latency=args.google_latency, throttle_rate=args.throttle_rate,
+                                      quota=args.google_quota).start()
+    try:
+        results = []
+        for size in (int(s) for s in args.sizes.split(",") if s):
+            results.extend(run_size(args, size, caldav, google))
+    finally:
+        caldav.stop()
+        google.stop()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": parse_settings(args.set),
+        "caldav_latency": args.caldav_latency,
+        "google_latency": args.google_latency,
+        "throttle_rate": args.throttle_rate,
+        "google_quota": args.google_quota,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Google transport benchmark: requests/sec of the httplib2 and pooled transports against the
+local fake Google Calendar server.
+
+    python -m benchmarks.bench_transport --requests 2000 --workers 8 --connect-latency 0.05
+
+The requests are event updates sent through ConcurrentMutations with --workers threads,
+split over --rounds rounds the way a sync sends one window of Apple changes at a time.
+Worker threads do not outlive their round, and neither do httplib2 connections.
+--connect-latency delays every new connection, standing in for the TCP and TLS
+handshakes with googleapis.com.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from benchmarks.bench_sync import bench_google_calendar
+from benchmarks.fake_google import FakeGoogleCalendarServer
+from ratelimit import google_scheduler
+
+TRANSPORTS = ("httplib2", "pooled")
+
+
+def run_transport(args, transport, google, event_ids):
+    google_calendar = bench_google_calendar(google.url, transport=transport, pool_size=args.workers)
+    failed = []
+
+    def on_result(op, guid, response, error):
+        if error is not None:
+            failed.append(error)
+
+    calls_before, _ = google.snapshot()
+    connections_before = google.connections
+    per_round = -(-len(event_ids) // args.rounds)
+    start = time.perf_counter()
+    for first in range(0, len(event_ids), per_round):
+        with google_calendar.concurrent(on_result, args.workers) as mutations:
+            for event_id in event_ids[first:first + per_round]:
+                mutations.update(event_id, {"summary": f"bench {transport}"}, event_id)
+    wall = time.perf_counter() - start
+    calls_after, _ = google.snapshot()
+    result = {
+        "transport": transport,
+        "requests": sum((calls_after - calls_before).values()),
+        "failed": len(failed),
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(len(event_ids) / wall, 1),
+        "connections": google.connections - connections_before,
+    }
+    print(f"{transport:<9} {result['wall_seconds']:>7.2f}s {result['requests_per_second']:>8.1f} req/s "
+          f"{result['connections']:>5} connections {result['failed']:>4} failed", file=sys.stderr)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000, help="event updates per transport (default: 2000)")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent worker threads (default: 8)")
+    parser.add_argument("--rounds", type=int, default=10, help="thread pools the requests are split over (default: 10)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every Google request")
+    parser.add_argument("--connect-latency", type=float, default=0.0, help="seconds added to every new connection")
+    parser.add_argument("--transports", default=",".join(TRANSPORTS),
+                        help=f"comma-separated transports to compare, from {', '.join(TRANSPORTS)}")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    transports = [t for t in args.transports.split(",") if t]
+    unknown = set(transports) - set(TRANSPORTS)
+    if unknown:
+        parser.error(f"unknown transports: {', '.join(sorted(unknown))}")
+    # Measure the transports, not the quota pacing.
+    google_scheduler.configure(rate=0)
+    google = FakeGoogleCalendarServer(latency=args.latency, connect_latency=args.connect_latency).start()
+    try:
+        event_ids = [json.loads(google._create({"iCalUID": f"bench-{i}", "summary": "bench"})[2])["id"]
+                     for i in range(args.requests)]
+        results = [run_transport(args, transport, google, event_ids) for transport in transports]
+    finally:
+        google.stop()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "workers": args.workers,
+        "rounds": args.rounds,
+        "latency": args.latency,
+        "connect_latency": args.connect_latency,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+from zoneinfo import ZoneInfo
+
+from dateutil.rrule import rrulestr
+
+from benchmarks.fake_server import FakeServer, overlaps
+
+DAV = "{DAV:}"
+CALDAV = "{urn:ietf:params:xml:ns:caldav}"
+
+PRINCIPAL = "/principals/bench/"
+HOME = "/calendars/bench/"
+CALENDAR = "/calendars/bench/bench/"
+# Keep CRLF line endings intact through XML end-of-line normalisation.
+CR = {"\r": "&#13;"}
+BERLIN = ZoneInfo("Europe/Berlin")
+
+VTIMEZONE = (
+    "BEGIN:VTIMEZONE\r\nTZID:Europe/Berlin\r\n"
+    "BEGIN:STANDARD\r\nDTSTART:19701025T030000\r\nRRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU\r\n"
+    "TZOFFSETFROM:+0200\r\nTZOFFSETTO:+0100\r\nTZNAME:CET\r\nEND:STANDARD\r\n"
+    "BEGIN:DAYLIGHT\r\nDTSTART:19700329T020000\r\nRRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU\r\n"
+    "TZOFFSETFROM:+0100\r\nTZOFFSETTO:+0200\r\nTZNAME:CEST\r\nEND:DAYLIGHT\r\nEND:VTIMEZONE\r\n"
+)
+
+
+def make_event(uid, revision=0, rng=random):
+    """
+    Return a synthetic ICS object shaped like an iCloud export: mostly timed events in a
+    named timezone, some all-day and recurring events, some with alarms and attendees.
+    """
+    start = datetime(2025, 1, 1, 8) + timedelta(hours=rng.randrange(0, 24 * 365), minutes=rng.choice((0, 15, 30)))
+    kind = rng.random()
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        "DTSTAMP:20250101T000000Z",
+        f"SEQUENCE:{revision}",
+        f"SUMMARY:Bench event {uid} rev {revision}",
+        "DESCRIPTION:Agenda:\\n1. Status\\, blockers\\n2. Next steps",
+        f"LOCATION:Room {rng.randrange(1, 40)}",
+    ]
+    if kind < 0.15:
+        lines += [f"DTSTART;VALUE=DATE:{start:%Y%m%d}", f"DTEND;VALUE=DATE:{start + timedelta(days=1):%Y%m%d}"]
+    else:
+        end = start + timedelta(minutes=rng.choice((30, 60, 90)))
+        lines += [f"DTSTART;TZID=Europe/Berlin:{start:%Y%m%dT%H%M%S}", f"DTEND;TZID=Europe/Berlin:{end:%Y%m%dT%H%M%S}"]
+        if kind > 0.9:
+            lines.append("RRULE:FREQ=WEEKLY;COUNT=10")
+    if rng.random() < 0.2:
+        lines += [
+            "ATTENDEE;CN=Alex Example;PARTSTAT=ACCEPTED:mailto:alex@example.com",
+            "ATTENDEE;CN=\"Doe, Sam\";PARTSTAT=NEEDS-ACTION:mailto:sam@example.com",
+            "BEGIN:VALARM", "ACTION:DISPLAY", "DESCRIPTION:Reminder", "TRIGGER:-PT15M", "END:VALARM",
+        ]
+    lines.append("END:VEVENT")
+    return ("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//calsync//bench//EN\r\n" + VTIMEZONE
+            + "\r\n".join(lines) + "\r\nEND:VCALENDAR\r\n")
+
+
+class FakeCalDAVServer(FakeServer):
+    """
+    Minimal CalDAV server with one calendar: principal and calendar discovery (PROPFIND),
+    GET of single objects, sync-collection, calendar-multiget and calendar-query REPORTs.
+    """
+    def __init__(self, latency=0.0, seed=0):
+        super().__init__(latency)
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.seq = 0
+            # uid -> (etag, ics, seq of last change); removed uids -> seq of the delete
+            self.objects = {}
+            self.removed = {}
+
+    def token(self, seq=None):
+        return f"http://calsync.bench/sync/{self.seq if seq is None else seq}"
+
+    def populate(self, count):
+        for idx in range(count):
+            self.put(f"bench-{idx}")
+
+    def put(self, uid, revision=0, ics=None):
+        """Store a generated object for uid, or the given ICS text."""
+        ics = ics or make_event(uid, revision, self.rng)
+        with self._lock:
+            self.seq += 1
+            self.objects[uid] = (f'"{self.seq}"', ics, self.seq)
+            self.removed.pop(uid, None)
+
+    def delete(self, uid):
+        with self._lock:
+            self.seq += 1
+            self.objects.pop(uid, None)
+            self.removed[uid] = self.seq
+
+    def mutate(self, fraction=0.01):
+        """Change, add and delete about `fraction` of the calendar; returns the counts."""
+        uids = list(self.objects)
+        n = max(1, int(len(uids) * fraction))
+        changed = self.rng.sample(uids, n // 2 or 1)
+        for uid in changed:
+            self.put(uid, revision=1)
+        deleted = [uid for uid in self.rng.sample(uids, n // 4) if uid not in changed]
+        for uid in deleted:
+            self.delete(uid)
+        added = n // 4
+        for idx in range(added):
+            self.put(f"bench-new-{self.seq}-{idx}")
+        return {"changed": len(changed), "added": added, "deleted": len(deleted)}
+
+    def classify(self, method, path, query, body):
+        if method == "REPORT":
+            if b"sync-collection" in body:
+                return "REPORT sync-collection"
+            if b"calendar-multiget" in body:
+                return "REPORT calendar-multiget"
+            return "REPORT calendar-query"
+        return method
+
+    @staticmethod
+    def span(ics):
+        """
+        (start, end) in UTC of an object made by make_event; the end of a recurring one is
+        the end of its last occurrence, or None if it never ends.
+        """
+        fields = {}
+        for line in ics.split("BEGIN:VEVENT", 1)[1].split("\r\n"):
+            name, _, value = line.partition(":")
+            fields[name.split(";")[0]] = (name, value)
+
+        def moment(key):
+            params, value = fields[key]
+            if "VALUE=DATE" in params:
+                return datetime.strptime(value, "%Y%m%d").replace(tzinfo=timezone.utc)
+            return datetime.strptime(value, "%Y%m%dT%H%M%S").replace(tzinfo=BERLIN)
+
+        start, end = moment("DTSTART"), moment("DTEND")
+        if "RRULE" in fields:
+            rule = fields["RRULE"][1]
+            if "COUNT=" not in rule and "UNTIL=" not in rule:
+                return start.astimezone(timezone.utc), None
+            # Weekly series keep their Berlin wall-clock time across DST changes.
+            last = list(rrulestr(rule, dtstart=start))[-1]
+            end = last + (end - start)
+        return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+
+    @staticmethod
+    def href(uid):
+        return f"{CALENDAR}{uid}.ics"
+
+    @staticmethod
+    def _multistatus(responses, extra=""):
+        return (207, {"Content-Type": "application/xml; charset=utf-8"},
+                '<?xml version="1.0" encoding="utf-8"?>\n'
+                '<d:multistatus xmlns:d="DAV:" xmlns:c="urn:ietf:params:xml:ns:caldav">'
+                + "".join(responses) + extra + "</d:multistatus>")
+
+    @staticmethod
+    def _response(href, props=None):
+        if props is None:
+            return f"<d:response><d:href>{href}</d:href><d:status>HTTP/1.1 404 Not Found</d:status></d:response>"
+        return (f"<d:response><d:href>{href}</d:href><d:propstat><d:prop>{props}</d:prop>"
+                "<d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>")
+
+    def handle(self, method, path, query, headers, body):
+        if method == "PROPFIND":
+            return self._propfind(path, headers.get("Depth", "0"))
+        if method == "REPORT" and path == CALENDAR:
+            return self._report(body)
+        if method == "GET" and path.startswith(CALENDAR):
+            uid = path[len(CALENDAR):].removesuffix(".ics")
+            obj = self.objects.get(uid)
+            if obj is None:
+                return 404, {}, ""
+            return 200, {"Content-Type": "text/calendar; charset=utf-8", "ETag": obj[0]}, obj[1]
+        if method == "OPTIONS":
+            return 200, {"DAV": "1, 2, 3, calendar-access", "Allow": "OPTIONS, GET, PROPFIND, REPORT"}, ""
+        return 404, {}, ""
+
+    def _propfind(self, path, depth):
+        principal = (f"<d:current-user-principal><d:href>{PRINCIPAL}</d:href></d:current-user-principal>"
+                     f"<c:calendar-home-set><d:href>{HOME}</d:href></c:calendar-home-set>")
+        calendar = (self._response(CALENDAR, "<d:resourcetype><d:collection/><c:calendar/></d:resourcetype>"
+                                   "<d:displayname>Bench</d:displayname>"
+                                   f"<d:sync-token>{self.token()}</d:sync-token>"
+                                   "<c:supported-calendar-component-set><c:comp name=\"VEVENT\"/>"
+                                   "</c:supported-calendar-component-set>"))
+        if path == HOME:
+            responses = [self._response(HOME, "<d:resourcetype><d:collection/></d:resourcetype>" + principal)]
+            if depth != "0":
+                responses.append(calendar)
+            return self._multistatus(responses)
+        if path == CALENDAR:
+            return self._multistatus([calendar])
+        resourcetype = "<d:resourcetype><d:principal/></d:resourcetype>" if path == PRINCIPAL else "<d:resourcetype/>"
+        return self._multistatus([self._response(path, resourcetype + principal)])
+
+    def _report(self, body):
+        root = ElementTree.fromstring(body)
+        if root.tag == f"{DAV}sync-collection":
+            token = root.findtext(f"{DAV}sync-token") or ""
+            return self._sync_collection(token.strip())
+        if root.tag == f"{CALDAV}calendar-multiget":
+            uids = [href.text.rsplit("/", 1)[-1].removesuffix(".ics") for href in root.iter(f"{DAV}href")]
+            return self._multiget(uids)
+        return self._calendar_query(root)
+
+    def _sync_collection(self, token):
+        with self._lock:
+            if token:
+                since = token.rsplit("/", 1)[-1]
+                if not token.startswith("http://calsync.bench/sync/") or not since.isdigit() or int(since) > self.seq:
+                    return (403, {"Content-Type": "application/xml"},
+                            '<d:error xmlns:d="DAV:"><d:valid-sync-token/></d:error>')
+                since = int(since)
+            else:
+                since = 0
+            changed = [(uid, etag) for uid, (etag, _, seq) in self.objects.items() if seq > since]
+            removed = [uid for uid, seq in self.removed.items() if since and seq > since]
+            new_token = self.token()
+        responses = [self._response(self.href(uid), f"<d:getetag>{escape(etag)}</d:getetag>") for uid, etag in changed]
+        responses += [self._response(self.href(uid)) for uid in removed]
+        return self._multistatus(responses, f"<d:sync-token>{new_token}</d:sync-token>")
+
+    def _multiget(self, uids):
+        responses = []
+        for uid in uids:
+            obj = self.objects.get(uid)
+            if obj is None:
+                responses.append(self._response(self.href(uid)))
+            else:
+                responses.append(self._response(
+                    self.href(uid),
+                    f"<d:getetag>{escape(obj[0])}</d:getetag><c:calendar-data>{escape(obj[1], CR)}</c:calendar-data>"
+                ))
+        return self._multistatus(responses)
+
+    def _calendar_query(self, root):
+        # Honours the UID text-match used by object_by_uid, a VEVENT time-range and whether
+        # calendar-data is requested.
+        uid_filter = next((f.findtext(f"{CALDAV}text-match") for f in root.iter(f"{CALDAV}prop-filter")
+                           if f.get("name") == "UID"), None)
+        time_range = root.find(f".//{CALDAV}time-range")
+        window = None
+        if time_range is not None:
+            window = tuple(datetime.strptime(time_range.get(bound), "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+                           if time_range.get(bound) else None for bound in ("start", "end"))
+        with_data = root.find(f"{DAV}prop/{CALDAV}calendar-data") is not None
+        responses = [
+            self._response(self.href(uid), f"<d:getetag>{escape(etag)}</d:getetag>"
+                           + (f"<c:calendar-data>{escape(ics, CR)}</c:calendar-data>" if with_data else ""))
+            for uid, (etag, ics, _) in list(self.objects.items())
+            if (uid_filter is None or uid == uid_filter)
+            and (window is None or overlaps(*self.span(ics), window))
+        ]
+        return self._multistatus(responses)
@@ -0,0 +1,274 @@
+import email.parser
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, unquote, urlsplit
+from zoneinfo import ZoneInfo
+
+from dateutil.rrule import rrulestr
+
+from benchmarks.fake_server import FakeServer, overlaps
+
+EVENTS_PATH = re.compile(r"^/calendar/v3/calendars/([^/]+)/events(?:/([^/]+))?$")
+BATCH_PATH = "/batch/calendar/v3"
+ITEM_FIELDS = re.compile(r"items\(([^)]*)\)")
+
+
+def _parse_time(value):
+    """(aware datetime, zone) of a Google start or end value; dates fall on midnight UTC."""
+    if "date" in value:
+        return datetime.fromisoformat(value["date"]).replace(tzinfo=timezone.utc), timezone.utc
+    moment = datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+    zone = ZoneInfo(value["timeZone"]) if value.get("timeZone") else moment.tzinfo or timezone.utc
+    return (moment if moment.tzinfo else moment.replace(tzinfo=zone)), zone
+
+
+def _starts(event, until):
+    """UTC starts of a recurring event's occurrences up to until, on the wall clock of its zone."""
+    start, zone = _parse_time(event["start"])
+    local = start.astimezone(zone)
+    rules = rrulestr("\n".join(event["recurrence"]), dtstart=local, forceset=True)
+    moments = rules if until is None else rules.between(local, until, inc=True)
+    return sorted({start.astimezone(timezone.utc)} | {moment.astimezone(timezone.utc) for moment in moments})
+
+
+def _span(event):
+    """(start, end) in UTC of a stored event; a series ends with its last occurrence, or None if never."""
+    start, _ = _parse_time(event["start"])
+    duration = _parse_time(event["end"])[0] - start
+    start = start.astimezone(timezone.utc)
+    if not event.get("recurrence"):
+        return start, start + duration
+    if not all("COUNT=" in line or "UNTIL=" in line for line in event["recurrence"] if line.startswith("RRULE")):
+        return start, None
+    return start, _starts(event, None)[-1] + duration
+
+
+def _error(status, reason, message):
+    return status, {"Content-Type": "application/json"}, json.dumps(
+        {"error": {"code": status, "message": message, "errors": [{"reason": reason, "message": message}]}}
+    )
+
+
+class FakeGoogleCalendarServer(FakeServer):
+    """
+    Stand-in for the Google Calendar v3 events API of a single calendar: list with
+    syncToken and paging, insert/import/update/delete, and multipart batch requests.
+    Deleted events stay listed as cancelled, so inserting their iCalUID again fails with 409.
+    singleEvents=true lists recurring events as their instances, up to two years ahead.
+
+    expire_sync_tokens() makes every issued sync token answer 410, and throttle_rate is
+    the probability that a request (or batch part) is rejected with 429. With quota set,
+    requests (and batch parts) beyond that many per second are rejected with 403
+    rateLimitExceeded, as Google enforces its per-user quota.
+    """
+    def __init__(self, latency=0.0, throttle_rate=0.0, seed=0, connect_latency=0.0, quota=0.0):
+        super().__init__(latency, connect_latency=connect_latency)
+        self.throttle_rate = throttle_rate
+        self.quota = quota
+        self._quota_tokens = quota
+        self._quota_updated = time.monotonic()
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.seq = 0
+            self.min_sync_token = 0
+            self.events = {}
+
+    def expire_sync_tokens(self):
+        with self._lock:
+            self.min_sync_token = self.seq + 1
+
+    def classify(self, method, path, query, body):
+        if path == BATCH_PATH:
+            return "batch"
+        match = EVENTS_PATH.match(path)
+        if match is None:
+            return f"{method} other"
+        if method == "GET":
+            return "events.list" if match.group(2) is None else "events.get"
+        if method == "POST":
+            return "events.import" if match.group(2) == "import" else "events.insert"
+        return {"PUT": "events.update", "PATCH": "events.patch", "DELETE": "events.delete"}.get(method, method)
+
+    def handle(self, method, path, query, headers, body):
+        if path == BATCH_PATH and method == "POST":
+            return self._batch(headers.get("Content-Type", ""), body)
+        return self._call(method, path, query, body)
+
+    def _throttled(self):
+        return self.throttle_rate and self.rng.random() < self.throttle_rate
+
+    def _over_quota(self):
+        if not self.quota:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._quota_tokens = min(self.quota, self._quota_tokens + (now - self._quota_updated) * self.quota)
+            self._quota_updated = now
+            if self._quota_tokens < 1:
+                return True
+            self._quota_tokens -= 1
+            return False
+
+    def _call(self, method, path, query, body):
+        if self._throttled():
+            status, headers, payload = _error(429, "rateLimitExceeded", "Rate Limit Exceeded")
+            headers["Retry-After"] = "1"
+            return status, headers, payload
+        if self._over_quota():
+            return _error(403, "rateLimitExceeded", "Rate Limit Exceeded")
+        match = EVENTS_PATH.match(path)
+        if match is None:
+            return _error(404, "notFound", "Not Found")
+        event_id = unquote(match.group(2)) if match.group(2) else None
+        if method == "GET" and event_id is None:
+            return self._list(query)
+        if method == "POST" and event_id in (None, "import"):
+            return self._create(json.loads(body or b"{}"), upsert=event_id == "import")
+        if method == "PUT" and event_id:
+            return self._update(event_id, json.loads(body or b"{}"))
+        if method == "DELETE" and event_id:
+            return self._delete(event_id)
+        if method == "GET" and event_id:
+            event = self.events.get(event_id)
+            return (200, {"Content-Type": "application/json"}, json.dumps(event)) if event else \
+                _error(404, "notFound", "Not Found")
+        return _error(405, "methodNotAllowed", "Method Not Allowed")
+
+    def _store(self, event):
+        """Stamp and store an event; caller holds the lock."""
+        self.seq += 1
+        event["etag"] = f'"{self.seq}"'
+        event["updated"] = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        event["_seq"] = self.seq
+        self.events[event["id"]] = event
+        return 200, {"Content-Type": "application/json"}, json.dumps(
+            {k: v for k, v in event.items() if k != "_seq"}
+        )
+
+    def _create(self, body, upsert=False):
+        with self._lock:
+            ical_uid = body.get("iCalUID")
+            # Like Google, a deleted event keeps its iCalUID: insert refuses it, import brings it back.
+            existing = sorted((e for e in self.events.values() if ical_uid and e.get("iCalUID") == ical_uid
+                               and not e.get("recurringEventId")), key=lambda e: e["status"] == "cancelled")
+            if existing and not upsert:
+                return _error(409, "duplicate", "The requested identifier already exists.")
+            event_id = existing[0]["id"] if existing else uuid.uuid4().hex
+            event = dict(body, id=event_id, status="confirmed", kind="calendar#event")
+            event.setdefault("iCalUID", f"{event_id}@google.com")
+            return self._store(event)
+
+    def _update(self, event_id, body):
+        with self._lock:
+            if event_id not in self.events:
+                return _error(404, "notFound", "Not Found")
+            ical_uid = self.events[event_id].get("iCalUID")
+            event = dict(body, id=event_id, status="confirmed", kind="calendar#event")
+            event.setdefault("iCalUID", ical_uid)
+            return self._store(event)
+
+    def _delete(self, event_id):
+        with self._lock:
+            event = self.events.get(event_id)
+            if event is None:
+                return _error(404, "notFound", "Not Found")
+            if event["status"] == "cancelled":
+                return _error(410, "deleted", "Resource has been deleted")
+            self._store({"id": event_id, "iCalUID": event.get("iCalUID"), "status": "cancelled"})
+            return 204, {}, ""
+
+    def _list(self, query):
+        sync_token = query.get("syncToken")
+        page_token = query.get("pageToken")
+        max_results = min(int(query.get("maxResults", 250)), 2500)
+        show_deleted = query.get("showDeleted") == "true"
+        with self._lock:
+            if page_token:
+                snapshot, offset, sync_token = page_token.split(":", 2)
+                snapshot, offset = int(snapshot), int(offset)
+            else:
+                snapshot, offset = self.seq, 0
+            if sync_token:
+                if not sync_token.isdigit() or int(sync_token) < self.min_sync_token:
+                    return _error(410, "fullSyncRequired", "Sync token is no longer valid, a full sync is required.")
+                since = int(sync_token)
+                items = sorted((e for e in self.events.values() if since < e["_seq"] <= snapshot),
+                               key=lambda e: e["_seq"])
+            else:
+                items = [e for e in self.events.values()
+                         if e["_seq"] <= snapshot and (show_deleted or e["status"] != "cancelled")]
+                if "iCalUID" in query:
+                    items = [e for e in items if e.get("iCalUID") == query["iCalUID"]]
+                if "timeMin" in query or "timeMax" in query:
+                    window = tuple(datetime.fromisoformat(query[bound]) if bound in query else None
+                                   for bound in ("timeMin", "timeMax"))
+                    items = [e for e in items if "start" not in e or overlaps(*_span(e), window)]
+            if query.get("singleEvents") == "true":
+                items = [instance for e in items for instance in self._instances(e)]
+                if "timeMin" in query or "timeMax" in query:
+                    items = [e for e in items if "start" not in e or overlaps(*_span(e), window)]
+            page = items[offset:offset + max_results]
+        fields = ITEM_FIELDS.search(query.get("fields", ""))
+        keep = set(fields.group(1).split(",")) if fields else None
+        result = {"kind": "calendar#events", "items": [
+            {k: v for k, v in e.items() if k != "_seq" and (keep is None or k in keep)} for e in page
+        ]}
+        if offset + max_results < len(items):
+            result["nextPageToken"] = f"{snapshot}:{offset + max_results}:{sync_token or ''}"
+        else:
+            result["nextSyncToken"] = str(snapshot)
+        return 200, {"Content-Type": "application/json"}, json.dumps(result)
+
+    @staticmethod
+    def _instances(event):
+        """A listed event as singleEvents=true returns it: recurring events become their instances."""
+        if event["status"] == "cancelled" or not event.get("recurrence"):
+            return [event]
+        start, _ = _parse_time(event["start"])
+        duration = _parse_time(event["end"])[0] - start
+        all_day = "date" in event["start"]
+        moments = _starts(event, start + timedelta(days=730))
+
+        def value(moment):
+            return {"date": moment.date().isoformat()} if all_day else {"dateTime": moment.isoformat(), "timeZone": "UTC"}
+
+        def instance_id(moment):
+            return f"{event['id']}_{moment:%Y%m%d}" if all_day else f"{event['id']}_{moment:%Y%m%dT%H%M%SZ}"
+
+        master = {k: v for k, v in event.items() if k != "recurrence"}
+        return [dict(master, id=instance_id(moment), recurringEventId=event["id"],
+                     originalStartTime=value(moment), start=value(moment), end=value(moment + duration))
+                for moment in moments]
+
+    def _batch(self, content_type, body):
+        message = email.parser.BytesParser().parsebytes(
+            b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+        )
+        boundary = uuid.uuid4().hex
+        parts = []
+        for part in message.get_payload():
+            content_id = part["Content-ID"].strip("<>")
+            request = part.get_payload()
+            head, _, request_body = request.replace("\r\n", "\n").partition("\n\n")
+            method, url, _ = head.split("\n", 1)[0].split(" ", 2)
+            url = urlsplit(url)
+            query = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+            self.count("batch part")
+            status, headers, payload = self._call(method, url.path, query, request_body.encode())
+            header_lines = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n{header_lines}"
+                f"Content-Length: {len(payload.encode())}\r\n\r\n{payload}\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n")
+        return 200, {"Content-Type": f"multipart/mixed; boundary={boundary}"}, "".join(parts)
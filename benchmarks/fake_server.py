@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def overlaps(start, end, window):
+    """True if [start, end) overlaps the (start, end) window; None bounds, and a None end, are open."""
+    window_start, window_end = window
+    return (window_end is None or start < window_end) and (window_start is None or end is None or end > window_start)
+
+
+class FakeServer:
+    """
+    Local HTTP stand-in running on a background thread.
+
+    Subclasses implement handle(method, path, query, headers, body) and return
+    (status, headers, body). Every request sleeps `latency` seconds first and is
+    counted in `calls` under the key returned by classify(). Every new connection is
+    counted in `connections` and sleeps `connect_latency` seconds, standing in for the
+    TCP and TLS handshakes of a real server.
+    """
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0, connect_latency=0.0):
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.calls = Counter()
+        self.bytes_sent = 0
+        self.connections = 0
+        self._calls_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name=type(self).__name__, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, key, n=1):
+        with self._calls_lock:
+            self.calls[key] += n
+
+    def snapshot(self):
+        with self._calls_lock:
+            return Counter(self.calls), self.bytes_sent
+
+    def classify(self, method, path, query, body):
+        return method
+
+    def handle(self, method, path, query, headers, body):
+        raise NotImplementedError
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Send each response in one segment; otherwise Nagle plus delayed ACKs add
+            # ~40 ms to every keep-alive request.
+            disable_nagle_algorithm = True
+            wbufsize = 1 << 16
+
+            def setup(self):
+                super().setup()
+                with server._calls_lock:
+                    server.connections += 1
+                if server.connect_latency:
+                    time.sleep(server.connect_latency)
+
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                parts = urlsplit(self.path)
+                query = {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+                server.count(server.classify(self.command, parts.path, query, body))
+                if server.latency:
+                    time.sleep(server.latency)
+                status, headers, payload = server.handle(self.command, parts.path, query, self.headers, body)
+                if isinstance(payload, str):
+                    payload = payload.encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                with server._calls_lock:
+                    server.bytes_sent += len(payload)
+
+            do_GET = do_PUT = do_POST = do_DELETE = do_PROPFIND = do_REPORT = do_OPTIONS = _dispatch
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -1,20 +1,24 @@
-
 import typer
-from settings_utils import update_settings_file
-from dynaconf import Dynaconf, Validator
+from functools import cache
 import logging.config
-from google_calendar import GoogleCalendar
-from apple_calendar import AppleCalendar
-from sync import CalendarSync
-import toml
-
-config = Dynaconf(
-    settings_files=['settings.toml'],
-    validators=[Validator("apple_caldav_url", default="https://caldav.icloud.com")]
-)
-config.validators.validate()
-if hasattr(config, "logging") and config.logging:
-    logging.config.dictConfig(config.logging)
+
+# Backends (Google API client, CalDAV, Dynaconf) are imported inside the commands that use
+# them, so `--help` and other cheap invocations do not pay for loading them.
+
+
+@cache
+def get_config():
+    """Load settings.toml once, on first use, and apply its logging configuration."""
+    from dynaconf import Dynaconf, Validator
+
+    config = Dynaconf(
+        settings_files=['settings.toml'],
+        validators=[Validator("apple_caldav_url", default="https://caldav.icloud.com")]
+    )
+    config.validators.validate()
+    if hasattr(config, "logging") and config.logging:
+        logging.config.dictConfig(config.logging)
+    return config
 
 app = typer.Typer()
 
@@ -22,6 +26,11 @@ app = typer.Typer()
 @app.command()
 def configure():
     """Configure Apple (CalDAV) and Google Calendars."""
+    from apple_calendar import AppleCalendar
+    from google_calendar import GoogleCalendar
+    from settings_utils import update_settings_file
+
+    config = get_config()
     existing = {
         "apple_email": getattr(config, "apple_email", None),
         "apple_password": getattr(config, "apple_password", None),
@@ -79,21 +88,106 @@ def configure():
         "google_credentials": google_credentials,
         "google_calendar_id": google_calendars[int(google_calendar_id)]['id']
     })
+    # The next sync resolves the Apple calendar by the index chosen here, not the cached URL.
+    from pairs import pair_state_paths
+    from state_store import open_state_store
+    state = open_state_store(config.get("state.backend", "sqlite"),
+                             *pair_state_paths("default", config.get("state.path", "calsync.db")))
+    state.set_token("apple_calendar_key", None)
+    state.close()
 
 @app.command()
-def sync():
+def sync(
+    metrics_path: str = typer.Option(None, "--metrics", help="Write timings and API call metrics to this file"),
+    metrics_format: str = typer.Option(
+        None, help="Metrics file format: json or prometheus (default: prometheus for .prom files, else json)"
+    ),
+):
     """Sync Apple Calendar to Google Calendar."""
+    from metrics import metrics
+    from pairs import build_pair_syncs, run_pairs
+
     typer.echo("Starting calendar sync...")
+    config = get_config()
+
+    if metrics_path:
+        metrics.enable()
+    try:
+        syncs = build_pair_syncs(config)
+        try:
+            results = run_pairs(syncs, config.get("sync.max_concurrent_pairs", 4))
+        finally:
+            for calendar_sync in syncs:
+                calendar_sync.state.close()
+    finally:
+        if metrics_path:
+            metrics.write(metrics_path, metrics_format)
+    failed = False
+    for calendar_sync in syncs:
+        result = results[calendar_sync.name]
+        prefix = "" if len(syncs) == 1 else f"[{calendar_sync.name}] "
+        if isinstance(result, Exception):
+            failed = True
+            typer.echo(f"{prefix}Sync failed: {result}", err=True)
+        else:
+            typer.echo(f"{prefix}{calendar_sync.summary()}")
+    if failed:
+        raise typer.Exit(1)
 
-    google_calendar = GoogleCalendar(config.google_credentials, config.google_calendar_id)
-    apple_calendar = AppleCalendar(
-        config.apple_email,
-        config.apple_password,
-        config.apple_caldav_url,
-        calendar_index=config.apple_calendar_index
+
+@app.command()
+def verify(
+    repair: bool = typer.Option(False, "--repair", help="Fix the drift found instead of only reporting it"),
+):
+    """Check that Google Calendar still matches what calsync mirrored from Apple."""
+    from pairs import build_pair_syncs
+    from verify import Verifier
+
+    config = get_config()
+    syncs = build_pair_syncs(config)
+    drifted = False
+    try:
+        for calendar_sync in syncs:
+            prefix = "" if len(syncs) == 1 else f"[{calendar_sync.name}] "
+            verifier = Verifier(calendar_sync)
+            verifier.verify(repair=repair)
+            for kind, uid in verifier.drift:
+                typer.echo(f"{prefix}{kind}: {uid}")
+            typer.echo(f"{prefix}{verifier.summary()}")
+            if verifier.drift and not repair:
+                drifted = True
+    finally:
+        for calendar_sync in syncs:
+            calendar_sync.state.close()
+    if drifted:
+        raise typer.Exit(1)
+
+
+@app.command()
+def daemon(
+    min_interval: int = typer.Option(None, help="Seconds between syncs after a change (default 30)"),
+    max_interval: int = typer.Option(None, help="Longest wait between syncs while idle (default 900)"),
+):
+    """Keep syncing in a long-running process with adaptive polling."""
+    from daemon import SyncDaemon
+    from pairs import build_pair_syncs
+
+    typer.echo("Starting calendar sync daemon...")
+    config = get_config()
+    syncs = build_pair_syncs(config)
+    sync_daemon = SyncDaemon(
+        syncs,
+        min_interval=min_interval or config.get("daemon.min_interval", 30),
+        max_interval=max_interval or config.get("daemon.max_interval", 900),
+        backoff=config.get("daemon.backoff", 2.0),
+        jitter=config.get("daemon.jitter", 0.1),
+        max_concurrent=config.get("sync.max_concurrent_pairs", 4),
     )
-    sync = CalendarSync(apple_calendar, google_calendar, config)
-    sync.sync()
-    
+    try:
+        sync_daemon.run()
+    finally:
+        for calendar_sync in syncs:
+            calendar_sync.state.close()
+
 if __name__ == "__main__":
     app()
@@ -0,0 +1,79 @@
+import logging
+import random
+import signal
+import threading
+
+from pairs import pair_executor, run_pairs
+
+
+class SyncDaemon:
+    """
+    Runs CalendarSync.sync for one or more calendar pairs in a loop with warm clients
+    and adaptive polling.
+
+    The interval between runs grows by `backoff` while runs find nothing to do, up to
+    max_interval, and drops back to min_interval as soon as a run changes something.
+    """
+    def __init__(self, calendar_syncs, min_interval=30, max_interval=900, backoff=2.0, jitter=0.1,
+                 refresh_margin=300, max_concurrent=4):
+        self.calendar_syncs = calendar_syncs
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.backoff = backoff
+        self.jitter = jitter
+        self.refresh_margin = refresh_margin
+        self.stop_event = threading.Event()
+        # One pool for the life of the daemon instead of a new one every cycle.
+        self.executor = pair_executor(max_concurrent) if len(calendar_syncs) > 1 else None
+
+    def stop(self, signum=None, frame=None):
+        if signum is not None:
+            logging.info(f"Received signal {signum}, stopping after the current sync.")
+        self.stop_event.set()
+
+    def close(self):
+        """Shut down the pair worker threads; the daemon cannot run again afterwards."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def next_interval(self, interval, changed):
+        if changed:
+            return self.min_interval
+        return min(interval * self.backoff, self.max_interval)
+
+    def sleep_time(self, interval):
+        # Jitter keeps several daemons from polling the servers in lockstep.
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def run_once(self):
+        """Run one sync pass over all pairs and return True if it changed anything on Google."""
+        for calendar_sync in self.calendar_syncs:
+            # Pairs usually share credentials, so only the first call actually refreshes.
+            calendar_sync.google_calendar.refresh_credentials(self.refresh_margin)
+        results = run_pairs(self.calendar_syncs, self.max_concurrent, executor=self.executor)
+        return any(
+            not isinstance(stats, Exception) and (stats['inserted'] or stats['updated'] or stats['deleted'])
+            for stats in results.values()
+        )
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        interval = self.min_interval
+        logging.info(f"Sync daemon started (interval {self.min_interval}-{self.max_interval}s).")
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    changed = self.run_once()
+                except Exception as e:
+                    logging.error("Sync run failed", exc_info=e)
+                    changed = False
+                interval = self.next_interval(interval, changed)
+                delay = self.sleep_time(interval)
+                logging.debug(f"Next sync in {delay:.0f}s")
+                self.stop_event.wait(delay)
+        finally:
+            self.close()
+        logging.info("Sync daemon stopped.")
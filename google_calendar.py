@@ -2,12 +2,83 @@
 # requires-python = ">=3.12"
 # dependencies = ["google-api-python-client", "google-auth-oauthlib"]
 # ///
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
+# The Google API client and auth libraries are a large share of process startup, so they
+# are imported where first used: a sync without Apple changes never loads them.
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache, partial
+from typing import TYPE_CHECKING, Any, NamedTuple
+import json
 import os
 import logging
+import threading
+
+from metrics import MeteredHttp, metrics
+from pooled_http import PooledHttp, refresh_lock
+from ratelimit import RETRYABLE, classify, google_scheduler
+from recurrence import Occurrence, RecurrenceIndex
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+
+@lru_cache(maxsize=None)
+def _discovery_document():
+    """
+    The Calendar v3 discovery document bundled with googleapiclient, parsed once per process
+    so building a service (one per thread and calendar) needs neither a download nor a parse.
+    None if this googleapiclient ships without it.
+    """
+    from googleapiclient.discovery_cache import get_static_doc
+    document = get_static_doc("calendar", "v3")
+    return json.loads(document) if document else None
+
+
+def _build_calendar_service(**kwargs):
+    from googleapiclient.discovery import build, build_from_document
+
+    document = _discovery_document()
+    if document is None:
+        return build('calendar', 'v3', **kwargs)
+    return build_from_document(document, **kwargs)
+
+
+def _is_conflict(error):
+    """True for the 409 Google answers an insert whose iCalUID is taken, also by a deleted event."""
+    return getattr(getattr(error, 'resp', None), 'status', None) == 409
+
+
+class _GoogleEventFields(NamedTuple):
+    id: str
+    iCalUID: str | None
+    etag: str | None
+    updated: str | None
+    status: str | None
+    recurringEventId: str | None
+    # Only filled by series-level listings (SERIES_FIELDS).
+    start: dict[str, Any] | None = None
+    end: dict[str, Any] | None = None
+    recurrence: list[str] | None = None
+    originalStartTime: dict[str, Any] | None = None
+
+
+class GoogleEventRecord(_GoogleEventFields):
+    """
+    Compact view of a listed Google event; the raw event payload is not kept.
+    """
+    __slots__ = ()
+    # Partial-response selector so list pages only carry the record fields.
+    FIELDS = "items(id,iCalUID,etag,updated,status,recurringEventId),nextPageToken,nextSyncToken"
+    # The series-level listing behind the recurrence index also needs times and rules.
+    SERIES_FIELDS = ("items(id,iCalUID,etag,updated,status,recurringEventId,start,end,recurrence,"
+                     "originalStartTime),nextPageToken,nextSyncToken")
+
+    @classmethod
+    def from_item(cls, item):
+        return cls(item['id'], item.get('iCalUID'), item.get('etag'), item.get('updated'),
+                   item.get('status'), item.get('recurringEventId'), item.get('start'), item.get('end'),
+                   item.get('recurrence'), item.get('originalStartTime'))
+
 
 class GoogleCalendar:
     @staticmethod
@@ -15,6 +86,8 @@ class GoogleCalendar:
         """
         Load and return Google API credentials, handling refresh and OAuth flow as needed.
         """
+        from google.oauth2.credentials import Credentials
+
         SCOPES = ["https://www.googleapis.com/auth/calendar"]
         creds = None
         if os.path.exists(token_path):
@@ -22,9 +95,12 @@ class GoogleCalendar:
             creds = Credentials.from_authorized_user_file(token_path, SCOPES)
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
+                from google.auth.transport.requests import Request
                 logging.debug("Refreshing expired Google credentials.")
                 creds.refresh(Request())
             else:
+                # Only needed for the interactive OAuth flow, which most runs never reach.
+                from google_auth_oauthlib.flow import InstalledAppFlow
                 logging.debug(f"Running OAuth flow for Google credentials from {credentials_path}")
                 flow = InstalledAppFlow.from_client_secrets_file(credentials_path, SCOPES)
                 creds = flow.run_local_server(port=0)
@@ -33,10 +109,130 @@ class GoogleCalendar:
             logging.debug(f"Saved new Google credentials to {token_path}")
         return creds
     
-    def __init__(self, credentials_path, calendar_id, token_path="token.json"):
-        self.creds = self._load_credentials(credentials_path, token_path)
-        self.service = build('calendar', 'v3', credentials=self.creds)
+    # Credentials loaded per (credentials_path, token_path), shared by the calendars of one process.
+    _shared_creds: dict[tuple[str, str], "Credentials"] = {}
+    _shared_creds_lock = threading.Lock()
+
+    def __init__(self, credentials_path, calendar_id, token_path="token.json", use_import=False, creds=None,
+                 transport="httplib2", pool_size=10, timeout=60):
+        # Loaded on first use unless given, so runs that never call Google skip the OAuth setup.
+        self._creds = creds
+        self.credentials_path = credentials_path
+        self.token_path = token_path
+        self._local = threading.local()
+        # "httplib2" gives every thread its own connection; "pooled" shares a keep-alive
+        # connection pool of pool_size between threads, with timeout in seconds (see pooled_http).
+        if transport not in ("httplib2", "pooled"):
+            raise ValueError(f"Unknown Google transport: {transport!r}")
+        self.transport = transport
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pooled_http = None
+        self._http_lock = threading.Lock()
+        self._index_lock = threading.Lock()
         self.calendar_id = calendar_id
+        # Create events through events.import, which is idempotent on iCalUID.
+        self.use_import = use_import
+        # iCalUID -> Google event id, kept current from listings and our own mutations.
+        self.ical_index = {}
+        self._ical_uid_by_id = {}
+        # True once the index has been built from a full listing of the calendar.
+        self.ical_index_complete = False
+        # Recurring series of the calendar, built on the first instances() call from a
+        # series-level listing and dropped when a listing shows a recurring event changed.
+        self.recurrence = RecurrenceIndex()
+        self._recurrence_loaded = False
+        self._recurrence_lock = threading.Lock()
+
+    @property
+    def creds(self):
+        if self._creds is None:
+            key = (self.credentials_path, self.token_path)
+            with GoogleCalendar._shared_creds_lock:
+                creds = GoogleCalendar._shared_creds.get(key)
+                if creds is None:
+                    creds = GoogleCalendar._shared_creds[key] = self._load_credentials(*key)
+            self._creds = creds
+        return self._creds
+
+    def refresh_credentials(self, margin=300):
+        """
+        Refresh the OAuth access token if it expires within `margin` seconds, and save it.
+        """
+        expiry = self.creds.expiry
+        if not self.creds.refresh_token:
+            return
+        if expiry is None and self.creds.valid:
+            return
+        if expiry is not None:
+            # google-auth keeps the expiry as naive UTC.
+            if expiry.tzinfo is None:
+                expiry = expiry.replace(tzinfo=timezone.utc)
+            if expiry - datetime.now(timezone.utc) > timedelta(seconds=margin):
+                return
+        from google.auth.transport.requests import Request
+        logging.debug("Refreshing Google credentials ahead of expiry.")
+        with refresh_lock:
+            self.creds.refresh(Request())
+        with open(self.token_path, 'w') as token:
+            token.write(self.creds.to_json())
+
+    @property
+    def service(self):
+        # httplib2 transports are not thread-safe, so every thread gets its own service object.
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = self._local.service = self._build_service()
+        return service
+
+    @property
+    def events(self):
+        """The service's events() resource, which googleapiclient rebuilds on every call, cached per thread."""
+        events = getattr(self._local, 'events', None)
+        if events is None:
+            events = self._local.events = self.service.events()
+        return events
+
+    @property
+    def pooled_http(self):
+        """The PooledHttp shared by the services of all threads."""
+        with self._http_lock:
+            if self._pooled_http is None:
+                self._pooled_http = PooledHttp(self.creds, pool_size=self.pool_size, timeout=self.timeout)
+        return self._pooled_http
+
+    def _build_service(self):
+        if self.transport == "pooled":
+            http = self.pooled_http
+        elif metrics.enabled:
+            from google_auth_httplib2 import AuthorizedHttp
+            from googleapiclient.http import build_http
+            http = AuthorizedHttp(self.creds, http=build_http())
+        else:
+            return _build_calendar_service(credentials=self.creds)
+        return _build_calendar_service(http=MeteredHttp(http, "google") if metrics.enabled else http)
+
+    @staticmethod
+    def _execute(request, endpoint):
+        """
+        Execute a Google API request within the quota, retrying throttled and transient
+        failures. events.insert is not idempotent, so it is only retried when throttled.
+        """
+        return google_scheduler.call(partial(GoogleCalendar._send, request, endpoint),
+                                     idempotent=endpoint != 'events.insert')
+
+    @staticmethod
+    def _send(request, endpoint):
+        """Execute a Google API request once, recording its latency and errors under endpoint."""
+        if not metrics.enabled:
+            return request.execute()
+        from googleapiclient.errors import HttpError
+        with metrics.timer("calsync_google_request_seconds", endpoint=endpoint):
+            try:
+                return request.execute()
+            except HttpError as e:
+                metrics.inc("calsync_google_errors_total", endpoint=endpoint, status=e.resp.status)
+                raise
 
     @staticmethod
     def list_calendars(credentials_path, token_path="token.json"):
@@ -44,48 +240,203 @@ class GoogleCalendar:
         List all Google calendars for the authenticated user.
         """
         creds = GoogleCalendar._load_credentials(credentials_path, token_path)
-        service = build('calendar', 'v3', credentials=creds)
+        service = _build_calendar_service(credentials=creds)
         logging.debug("Listing Google calendars.")
-        calendars = service.calendarList().list().execute()
+        calendars = GoogleCalendar._execute(service.calendarList().list(), 'calendarList.list')
         logging.info(f"Fetched {len(calendars['items'])} Google Calendars.")
         return calendars['items']
 
+    def index_events(self, records):
+        """
+        Update the iCalUID index from a page of GoogleEventRecords.
+        """
+        for record in records:
+            if self._recurrence_loaded and (record.recurringEventId or record.recurrence or record.id in self.recurrence):
+                self._recurrence_loaded = False
+            if record.recurringEventId:
+                # Instance or exception of a recurring series: index the series master.
+                if record.status != 'cancelled' and record.iCalUID:
+                    self.ical_index.setdefault(record.iCalUID, record.recurringEventId)
+            elif record.status == 'cancelled':
+                self.unindex_event(record.id)
+            elif record.iCalUID:
+                self.index_event(record.iCalUID, record.id)
+
+    def index_event(self, ical_uid, event_id):
+        with self._index_lock:
+            self.ical_index[ical_uid] = event_id
+            self._ical_uid_by_id[event_id] = ical_uid
+
+    def unindex_event(self, event_id):
+        with self._index_lock:
+            ical_uid = self._ical_uid_by_id.pop(event_id, None)
+            if ical_uid is not None and self.ical_index.get(ical_uid) == event_id:
+                del self.ical_index[ical_uid]
+
+    def reset_index(self):
+        self.ical_index = {}
+        self._ical_uid_by_id = {}
+        self.ical_index_complete = False
+        self._recurrence_loaded = False
+        self.recurrence.clear()
+
+    def instances(self, event_id, time_min, time_max):
+        """
+        Return the Occurrences of a recurring event that overlap [time_min, time_max).
+        Series are expanded locally from the recurrence index; series it cannot expand are
+        listed with events.instances.
+        """
+        self._load_recurrence()
+        occurrences = self.recurrence.occurrences(event_id, time_min, time_max)
+        if occurrences is not None:
+            return occurrences
+        occurrences = []
+        page_token = None
+        while True:
+            page = self._execute(self.events.instances(
+                calendarId=self.calendar_id, eventId=event_id, timeMin=time_min.isoformat(),
+                timeMax=time_max.isoformat(), maxResults=2500, pageToken=page_token,
+                fields="items(id,status,start,end,originalStartTime),nextPageToken"
+            ), 'events.instances')
+            occurrences += [Occurrence.from_item(item) for item in page.get('items', [])
+                            if item.get('status') != 'cancelled']
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return occurrences
+
+    def _load_recurrence(self):
+        """Build the recurrence index from a series-level listing unless it is current."""
+        with self._recurrence_lock:
+            if self._recurrence_loaded:
+                return
+            self.recurrence.clear()
+            page_token = None
+            while True:
+                # Cancelled occurrences are only listed as deleted exceptions.
+                page = self.list_events(single_events=False, show_deleted=True, page_token=page_token,
+                                        fields=GoogleEventRecord.SERIES_FIELDS)
+                for item in page.get('items', []):
+                    self.recurrence.add(GoogleEventRecord.from_item(item))
+                page_token = page.get('nextPageToken')
+                if not page_token:
+                    break
+            logging.debug(f"Indexed {len(self.recurrence)} recurring series of Google calendar {self.calendar_id}")
+            self._recurrence_loaded = True
+
     def insert_event(self, event, apple_guid):
         logging.debug(f"Inserting event into Google calendar {self.calendar_id} with Apple GUID {apple_guid}")
-        # Insert the event
-        created_event = self.service.events().insert(calendarId=self.calendar_id, body=event).execute()
+        ical_uid = event.get('iCalUID') or apple_guid
+        existing_id = self.existing_event_id(ical_uid)
+        if existing_id is not None:
+            logging.debug(f"iCalUID {ical_uid} already exists on Google as {existing_id}, updating instead")
+            return self.update_event(existing_id, event)
+
+        if self.use_import:
+            created_event = self._execute(self.events.import_(calendarId=self.calendar_id, body=event), 'events.import')
+        else:
+            created_event = self._insert(event)
         logging.info(f"Event created: {created_event['id']}")
+        if ical_uid:
+            self.index_event(ical_uid, created_event['id'])
+        return created_event
 
-        # If a GUID is provided, find and delete duplicate events with the same GUID
-        if apple_guid:
-            logging.debug(f"Checking for duplicate Google events with Apple GUID {apple_guid}")
-            events = self.service.events().list(calendarId=self.calendar_id, q=apple_guid).execute()
-            for existing_event in events.get('items', []):
-                # Skip the event that was just created
-                if existing_event['id'] != created_event['id']:
-                    self.service.events().delete(calendarId=self.calendar_id, eventId=existing_event['id']).execute()
-                    logging.info(f"Deleted duplicate event: {existing_event['id']}")
+    def restore_event(self, event):
+        """
+        Create the event again through events.import, which also brings back a deleted
+        Google event with the same iCalUID, where events.insert would fail with 409.
+        """
+        logging.debug(f"Restoring Google event with iCalUID {event['iCalUID']}")
+        restored_event = self._execute(self.events.import_(calendarId=self.calendar_id, body=event), 'events.import')
+        self.index_event(event['iCalUID'], restored_event['id'])
+        return restored_event
+
+    def _insert(self, event):
+        """
+        Send events.insert. An insert that failed with a 5xx or network error may still
+        have been applied, so it is sent again as events.import, which is idempotent on
+        iCalUID, rather than as another insert.
+        """
+        try:
+            return self._execute(self.events.insert(calendarId=self.calendar_id, body=event), 'events.insert')
+        except Exception as e:
+            if event.get('iCalUID') and _is_conflict(e):
+                # A deleted Google event keeps its iCalUID; importing brings it back.
+                logging.debug(f"iCalUID {event['iCalUID']} belongs to a deleted Google event, restoring it")
+                return self.restore_event(event)
+            if not event.get('iCalUID') or classify(e) != RETRYABLE or not google_scheduler.should_retry(e, 0):
+                raise
+            logging.debug(f"Insert of iCalUID {event['iCalUID']} failed ({e}), retrying as an import")
+            google_scheduler.backoff(0, e)
+            return self._execute(self.events.import_(calendarId=self.calendar_id, body=event), 'events.import')
+
+    def existing_event_id(self, ical_uid):
+        """
+        Return the id of the Google event that already has ical_uid, or None. Every insert
+        path checks this first. Google is only asked while the local index does not cover
+        the calendar, and never with use_import, as imports are idempotent on iCalUID.
+        """
+        existing_id = self.ical_index.get(ical_uid)
+        if existing_id is None and ical_uid and not self.use_import and not self.ical_index_complete:
+            existing_id = self._find_duplicates(ical_uid)
+        return existing_id
+
+    def _find_duplicates(self, ical_uid):
+        """
+        Look up events with the given iCalUID on Google, keep the first one and delete the rest.
+        Only used while the local index does not cover the whole calendar.
+        """
+        logging.debug(f"Checking for existing Google events with iCalUID {ical_uid}")
+        events = self._execute(self.events.list(calendarId=self.calendar_id, iCalUID=ical_uid), 'events.list')
+        # Edited occurrences of a series share its iCalUID but are not copies of it.
+        existing_ids = [e['id'] for e in events.get('items', [])
+                        if e.get('status') != 'cancelled' and not e.get('recurringEventId')]
+        for duplicate_id in existing_ids[1:]:
+            self._execute(self.events.delete(calendarId=self.calendar_id, eventId=duplicate_id), 'events.delete')
+            logging.info(f"Deleted duplicate event: {duplicate_id}")
+        if existing_ids:
+            self.index_event(ical_uid, existing_ids[0])
+            return existing_ids[0]
+        return None
+
+    def get_event(self, event_id):
+        return self._execute(self.events.get(calendarId=self.calendar_id, eventId=event_id), 'events.get')
 
-        return created_event
-    
     def update_event(self, event_id, event_body):
         """
         Update an existing Google Calendar event by event ID.
         """
         logging.debug(f"Updating Google event {event_id}")
-        updated_event = self.service.events().update(calendarId=self.calendar_id, eventId=event_id, body=event_body).execute()
+        updated_event = self._execute(
+            self.events.update(calendarId=self.calendar_id, eventId=event_id, body=event_body), 'events.update'
+        )
         logging.info(f"Event updated: {updated_event['id']}")
         return updated_event    
 
     def delete_event(self, event_id):
         logging.debug(f"Deleting Google event {event_id}")
-        self.service.events().delete(calendarId=self.calendar_id, eventId=event_id).execute()
+        self._execute(self.events.delete(calendarId=self.calendar_id, eventId=event_id), 'events.delete')
+        self.unindex_event(event_id)
         logging.info(f"Event deleted: {event_id}")
 
+    def batch(self, on_result, batch_size=50):
+        """
+        Return a MutationBatch that queues inserts, updates and deletes and
+        executes them as Google API batch requests.
+        """
+        return MutationBatch(self, on_result, batch_size)
+
+    def concurrent(self, on_result, max_workers=4):
+        """
+        Return a ConcurrentMutations that sends inserts, updates and deletes as individual
+        requests from a pool of worker threads.
+        """
+        return ConcurrentMutations(self, on_result, max_workers)
 
-    def list_events(self, single_events=True, max_results=2500, show_deleted=True, page_token=None, sync_token=None):
+    def list_events(self, single_events=True, max_results=2500, show_deleted=True, page_token=None, sync_token=None, fields=None,
+                    time_min=None, time_max=None):
         """
         List events in the Google Calendar within the specified time range.
+        time_min/time_max (aware datetimes) cannot be combined with a sync token.
         """
         logging.debug(f"Listing Google events with single_events={single_events}, max_results={max_results}, show_deleted={show_deleted}, page_token={page_token}")
         list_kwargs = {
@@ -101,7 +452,230 @@ class GoogleCalendar:
             list_kwargs['syncToken'] = sync_token
             logging.debug(f"Using sync token: {sync_token}")
 
-        events = self.service.events().list(**list_kwargs).execute()
+        if fields:
+            list_kwargs['fields'] = fields
+
+        if time_min:
+            list_kwargs['timeMin'] = time_min.isoformat()
+        if time_max:
+            list_kwargs['timeMax'] = time_max.isoformat()
+
+        events = self._execute(self.events.list(**list_kwargs), 'events.list')
         
         logging.info(f"Fetched {len(events.get('items', []))} Google events.")
         return events
+
+
+class MutationBatch:
+    """
+    Queue of Google Calendar event mutations flushed as batch requests.
+
+    Each queued mutation is reported through on_result(op, apple_guid, response, error)
+    once its batch has been executed; a failed item does not abort the rest of the batch.
+    Items that were throttled or failed transiently are sent again in a new batch.
+    """
+    # Google rejects batches larger than 1000 requests and recommends staying at or below 50.
+    MAX_BATCH_SIZE = 1000
+
+    def __init__(self, google_calendar, on_result, batch_size=50):
+        self.google_calendar = google_calendar
+        self.on_result = on_result
+        self.batch_size = max(1, min(int(batch_size), self.MAX_BATCH_SIZE))
+        self._pending = []
+        self._guids = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
+
+    def insert(self, event, apple_guid):
+        google_calendar = self.google_calendar
+        events = google_calendar.events
+        existing_id = google_calendar.existing_event_id(event.get('iCalUID') or apple_guid)
+        insert_body = None
+        if existing_id is not None:
+            # Known iCalUID: the insert becomes an update of the existing event.
+            request = events.update(calendarId=google_calendar.calendar_id, eventId=existing_id, body=event)
+        elif google_calendar.use_import:
+            request = events.import_(calendarId=google_calendar.calendar_id, body=event)
+        else:
+            request = events.insert(calendarId=google_calendar.calendar_id, body=event)
+            # Kept with the request so a failed insert can be retried as an import.
+            insert_body = event
+        self._queue('insert', apple_guid, request, insert_body=insert_body)
+
+    def update(self, event_id, event_body, apple_guid=None):
+        events = self.google_calendar.events
+        request = events.update(calendarId=self.google_calendar.calendar_id, eventId=event_id, body=event_body)
+        self._queue('update', apple_guid, request)
+
+    def delete(self, event_id, apple_guid=None):
+        events = self.google_calendar.events
+        request = events.delete(calendarId=self.google_calendar.calendar_id, eventId=event_id)
+        self._queue('delete', apple_guid, request, event_id)
+
+    def _queue(self, op, apple_guid, request, event_id=None, insert_body=None):
+        # Requests inside one batch may run in any order, so never put two mutations
+        # for the same GUID into the same batch.
+        if apple_guid is not None and apple_guid in self._guids:
+            self.flush()
+        self._pending.append((op, apple_guid, request, event_id, insert_body))
+        if apple_guid is not None:
+            self._guids.add(apple_guid)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Execute all queued mutations as a single batch request.
+        """
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        self._guids = set()
+        attempt = 0
+        while pending:
+            logging.debug(f"Executing Google batch of {len(pending)} mutations on calendar {self.google_calendar.calendar_id}")
+            batch = self.google_calendar.service.new_batch_http_request()
+            retry = []
+            for idx, item in enumerate(pending):
+                batch.add(item[2], callback=partial(self._handle_part, item, attempt, retry), request_id=str(idx))
+            inserts = any(item[4] is not None for item in pending)
+            try:
+                # Every item counts against the quota.
+                google_scheduler.call(partial(self._execute_batch, batch, len(pending)), cost=len(pending),
+                                      idempotent=not inserts)
+            except Exception as e:
+                importable = all(item[4] is None or item[4].get('iCalUID') for item in pending)
+                if not inserts or not importable or classify(e) != RETRYABLE or not google_scheduler.should_retry(e, attempt):
+                    raise
+                # The batch may have been applied: send it again with its inserts as imports.
+                logging.debug(f"Google batch failed ({e}), retrying its inserts as imports")
+                google_scheduler.backoff(attempt, e)
+                pending = [self._as_import(item) for item in pending]
+                attempt += 1
+                continue
+            errors = [error for _, error in retry if error is not None]
+            if errors:
+                google_scheduler.backoff(attempt, errors[0])
+            pending = [item for item, _ in retry]
+            attempt += 1
+
+    def _as_import(self, item):
+        """The queued item with an insert that has an iCalUID turned into an events.import, which is idempotent on it."""
+        op, apple_guid, _, event_id, insert_body = item
+        if insert_body is None or not insert_body.get('iCalUID'):
+            return item
+        google_calendar = self.google_calendar
+        request = google_calendar.events.import_(calendarId=google_calendar.calendar_id, body=insert_body)
+        return op, apple_guid, request, event_id, None
+
+    @staticmethod
+    def _execute_batch(batch, size):
+        with metrics.timer("calsync_google_request_seconds", endpoint="batch"):
+            batch.execute()
+        metrics.inc("calsync_google_batch_items_total", size)
+
+    def _handle_part(self, item, attempt, retry, request_id, response, exception):
+        op, apple_guid, _, event_id, insert_body = item
+        if exception is not None:
+            idempotent = insert_body is None
+            if not idempotent and insert_body.get('iCalUID') and _is_conflict(exception):
+                # The iCalUID belongs to a deleted Google event: import it back, right away.
+                retry.append((self._as_import(item), None))
+                return
+            if not idempotent and insert_body.get('iCalUID') and classify(exception) == RETRYABLE:
+                # The insert may have been applied; retry it as an import.
+                item, idempotent = self._as_import(item), True
+            if google_scheduler.should_retry(exception, attempt, idempotent):
+                retry.append((item, exception))
+                return
+        self._handle_response(op, apple_guid, event_id, request_id, response, exception)
+
+    def _handle_response(self, op, apple_guid, event_id, request_id, response, exception):
+        if exception is not None:
+            status = getattr(getattr(exception, 'resp', None), 'status', None)
+            if op == 'delete' and status in (404, 410):
+                logging.debug(f"Event for Apple GUID {apple_guid} was already deleted on Google")
+                exception = None
+            else:
+                logging.error(f"Google batch {op} failed for Apple GUID {apple_guid}: {exception}")
+        if exception is None and op == 'delete':
+            self.google_calendar.unindex_event(event_id)
+            logging.info(f"Event deleted: {event_id}")
+        elif exception is None:
+            if response.get('iCalUID'):
+                self.google_calendar.index_event(response['iCalUID'], response['id'])
+            logging.info(f"Event {'created' if op == 'insert' else 'updated'}: {response['id']}")
+        self.on_result(op, apple_guid, response, exception)
+
+
+class ConcurrentMutations(MutationBatch):
+    """
+    Runs queued Google Calendar mutations as individual requests on a pool of worker threads.
+
+    Mutations for the same Apple GUID run in the order they were queued; on_result is
+    called from the worker threads, so it must be thread-safe.
+    """
+    def __init__(self, google_calendar, on_result, max_workers=4):
+        super().__init__(google_calendar, on_result)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='calsync-google')
+        # Bound the number of queued mutations so their bodies are not all held in memory at once.
+        self._slots = threading.BoundedSemaphore(max_workers * 4)
+        self._futures = []
+        self._last_by_guid = {}
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown(wait=True)
+        return False
+
+    def insert(self, event, apple_guid):
+        self._submit('insert', apple_guid, None, partial(self.google_calendar.insert_event, event, apple_guid))
+
+    def update(self, event_id, event_body, apple_guid=None):
+        self._submit('update', apple_guid, event_id, partial(self.google_calendar.update_event, event_id, event_body))
+
+    def delete(self, event_id, apple_guid=None):
+        self._submit('delete', apple_guid, event_id, partial(self.google_calendar.delete_event, event_id))
+
+    def _submit(self, op, apple_guid, event_id, call):
+        self._slots.acquire()
+        previous = self._last_by_guid.get(apple_guid) if apple_guid is not None else None
+        future = self.executor.submit(self._run, op, apple_guid, event_id, call, previous)
+        self._futures.append(future)
+        if apple_guid is not None:
+            self._last_by_guid[apple_guid] = future
+        if len(self._futures) >= 1000:
+            self._futures = [f for f in self._futures if not f.done() or f.exception() is not None]
+            self._last_by_guid = {g: f for g, f in self._last_by_guid.items() if not f.done()}
+
+    def _run(self, op, apple_guid, event_id, call, previous):
+        try:
+            if previous is not None:
+                # Earlier mutation for the same GUID was submitted first, so it is already running or queued ahead.
+                wait([previous])
+            try:
+                response, exception = call(), None
+            except Exception as e:
+                response, exception = None, e
+            self._handle_response(op, apple_guid, event_id, None, response, exception)
+        finally:
+            self._slots.release()
+
+    def flush(self):
+        """
+        Wait for all queued mutations to finish.
+        """
+        futures, self._futures = self._futures, []
+        self._last_by_guid = {}
+        wait(futures)
+        for future in futures:
+            # Re-raise unexpected errors from result handling; request failures went to on_result.
+            future.result()
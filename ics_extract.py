@@ -0,0 +1,247 @@
+"""
+Pulls the VEVENT fields calsync mirrors to Google straight out of raw ICS text.
+
+vobject builds a full component tree (alarms, attendees, X- properties) for every object,
+while transform_event only needs a handful of properties from the first VEVENT.
+extract_vevent reads the text line by line, stops at the end of that VEVENT and raises
+UnsupportedICS for anything it does not handle exactly like vobject, so the caller can
+fall back to the vobject parse.
+
+Running this module compares both paths over a corpus of .ics files:
+
+    python ics_extract.py calendar-dump/ event.ics
+
+tests/test_ics_extract.py runs the same comparison over tests/fixtures/ics; add a fixture
+there for every case the fast path learns (or learns to refuse).
+"""
+import re
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+
+class UnsupportedICS(ValueError):
+    """The fast extractor cannot handle this object; parse it with vobject instead."""
+
+
+class NotAnEvent(ValueError):
+    """The calendar object does not contain a VEVENT."""
+
+
+# Property name -> key in the extracted fields.
+_TEXT_PROPERTIES = {
+    "UID": "uid",
+    "SUMMARY": "summary",
+    "DESCRIPTION": "description",
+    "LOCATION": "location",
+}
+_DATE_PROPERTIES = {"DTSTART": "dtstart", "DTEND": "dtend"}
+_WANTED = set(_TEXT_PROPERTIES) | set(_DATE_PROPERTIES) | {"SEQUENCE", "RRULE"}
+
+# Folding and line splitting follow vobject's logical line handling: a line ending
+# followed by one space or tab continues the previous line.
+_UNFOLD = re.compile(r"(?:\r\n|\r|\n)[ \t]")
+_LINE_END = re.compile(r"\r\n|\r|\n")
+_PROPERTY = re.compile(r"([A-Za-z0-9_-]+)([;:])")
+_PARAM = re.compile(r';([A-Za-z0-9_-]+)(?:=((?:"[^"]*"|[^";:,]*)(?:,(?:"[^"]*"|[^";:,]*))*))?')
+_PARAM_VALUE = re.compile(r'"([^"]*)"|([^",]+)')
+_DATE = re.compile(r"(\d{4})(\d{2})(\d{2})")
+_DATE_TIME = re.compile(r"(\d{4})(\d{2})(\d{2})T(\d{2})(\d{2})(\d{2})(Z?)")
+_TEXT_ESCAPE = re.compile(r"\\(.?)|,", re.DOTALL)
+_ESCAPED = {"n": "\n", "N": "\n", "\\": "\\", ";": ";", ",": ",", '"': '"'}
+
+
+@lru_cache(maxsize=None)
+def _zone(tzid):
+    try:
+        return ZoneInfo(tzid)
+    except (KeyError, ValueError, OSError):
+        raise UnsupportedICS(f"Unknown TZID {tzid!r}") from None
+
+
+def _unescape(match):
+    if match.group(0) == ",":
+        # vobject splits TEXT values on unescaped commas and keeps only the first part.
+        raise UnsupportedICS("Unescaped comma in TEXT value")
+    char = match.group(1)
+    if not char:
+        raise UnsupportedICS("Trailing backslash in TEXT value")
+    return _ESCAPED.get(char, "\\" + char)
+
+
+def _text(value):
+    if "\\" not in value and "," not in value:
+        return value
+    return _TEXT_ESCAPE.sub(_unescape, value)
+
+
+def _params(line, pos):
+    """Parse the parameters starting at line[pos]; returns (params, value)."""
+    params = {}
+    while line.startswith(";", pos):
+        match = _PARAM.match(line, pos)
+        if match is None:
+            raise UnsupportedICS(f"Cannot parse parameters of {line!r}")
+        values = [quoted or plain for quoted, plain in _PARAM_VALUE.findall(match.group(2) or "")]
+        params.setdefault(match.group(1).upper().replace("_", "-"), values)
+        pos = match.end()
+    if not line.startswith(":", pos):
+        raise UnsupportedICS(f"Cannot parse parameters of {line!r}")
+    return params, line[pos + 1:]
+
+
+def _date_value(params, value):
+    value_type = params.get("VALUE", ["DATE-TIME"])[0].upper()
+    value = value.strip()
+    match = _DATE_TIME.fullmatch(value) if value_type == "DATE-TIME" else None
+    try:
+        if match:
+            year, month, day, hour, minute, second = (int(part) for part in match.groups()[:6])
+            if match.group(7):
+                tzinfo = timezone.utc
+            elif "TZID" in params:
+                tzinfo = _zone(params["TZID"][0])
+            else:
+                tzinfo = None
+            dt = datetime(year, month, day, hour, minute, second, tzinfo=tzinfo)
+            if tzinfo is not None and dt.utcoffset() != dt.replace(fold=1).utcoffset():
+                # Times repeated or skipped by a DST change resolve differently per tz library.
+                raise UnsupportedICS(f"Ambiguous local time {value!r}")
+            return dt
+        match = _DATE.fullmatch(value) if value_type in ("DATE", "DATE-TIME") else None
+        if match:
+            return date(*(int(part) for part in match.groups()))
+    except ValueError:
+        pass
+    raise UnsupportedICS(f"Cannot parse {value_type} value {value!r}")
+
+
+def extract_vevent(text):
+    """
+    Return the fields of the first VEVENT in an ICS string as a dict with uid, summary,
+    description, location, sequence, dtstart, dtend and rrule.
+
+    Raises NotAnEvent if the calendar has no VEVENT and UnsupportedICS for input that
+    should go through vobject.
+    """
+    if not isinstance(text, str):
+        raise UnsupportedICS("ICS data is not a string")
+    lines = (line for line in _LINE_END.split(_UNFOLD.sub("", text)) if line)
+    first = next(lines, "")
+    if first.upper() != "BEGIN:VCALENDAR":
+        raise UnsupportedICS("Object does not start with BEGIN:VCALENDAR")
+
+    # depth counts open components below VCALENDAR; the VEVENT's own properties are at depth 1.
+    depth = 0
+    in_event = False
+    found = {}
+    for line in lines:
+        match = _PROPERTY.match(line)
+        if match is None:
+            raise UnsupportedICS(f"Cannot parse line {line!r}")
+        name = match.group(1).upper().replace("_", "-")
+        if name == "BEGIN":
+            depth += 1
+            if depth == 1 and line[match.end():].strip().upper() == "VEVENT":
+                in_event = True
+            continue
+        if name == "END":
+            depth -= 1
+            if in_event and depth == 0:
+                break
+            if depth < 0:
+                raise NotAnEvent("No VEVENT found in calendar object")
+            continue
+        if not in_event or depth != 1 or name not in _WANTED or name in found:
+            continue
+        if match.group(2) == ":":
+            params, value = {}, line[match.end():]
+        else:
+            params, value = _params(line, match.start(2))
+        if "ENCODING" in params:
+            raise UnsupportedICS(f"Encoded {name} value")
+        found[name] = (params, value)
+    else:
+        if not in_event:
+            raise NotAnEvent("No VEVENT found in calendar object")
+        raise UnsupportedICS("Unterminated VEVENT")
+
+    fields = {key: _text(found[name][1]) if name in found else "" for name, key in _TEXT_PROPERTIES.items()}
+    for name, key in _DATE_PROPERTIES.items():
+        fields[key] = _date_value(*found[name]) if name in found and found[name][1] else None
+    if "DTSTART" in found and not found["DTSTART"][1]:
+        raise UnsupportedICS("Empty DTSTART")
+    fields["sequence"] = int(found["SEQUENCE"][1]) if "SEQUENCE" in found else 0
+    fields["rrule"] = found["RRULE"][1] if "RRULE" in found else None
+    return fields
+
+
+def vevent_fields(vobj):
+    """
+    Return the same fields as extract_vevent from a parsed vobject calendar.
+    """
+    vevent = getattr(vobj, 'vevent', None)
+    if vevent is None:
+        raise NotAnEvent("No VEVENT found in vobject instance")
+
+    def get_text(field):
+        return str(getattr(vevent, field).value) if hasattr(vevent, field) else ""
+
+    fields = {field: get_text(field) for field in ("uid", "summary", "description", "location")}
+    fields["sequence"] = int(vevent.sequence.value) if hasattr(vevent, 'sequence') else 0
+    fields["dtstart"] = vevent.dtstart.value if hasattr(vevent, 'dtstart') else None
+    fields["dtend"] = vevent.dtend.value if hasattr(vevent, 'dtend') else None
+    rrule = None
+    if hasattr(vevent, 'rrule'):
+        rrule = vevent.rrule.value if hasattr(vevent.rrule, 'value') else vevent.rrule
+    fields["rrule"] = rrule
+    return fields
+
+
+def _compare(paths):
+    """Transform every .ics file under paths with both extractors and report differences."""
+    import os
+    import sys
+
+    import vobject
+
+    from sync import CalendarSync
+
+    def outcome(extract):
+        try:
+            return CalendarSync.event_from_fields(extract())
+        except Exception as e:
+            return type(e).__name__
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(".ics"))
+        else:
+            files.append(path)
+
+    fast = fallback = mismatched = 0
+    for filename in files:
+        with open(filename, newline="") as f:
+            text = f.read()
+        try:
+            extract_vevent(text)
+            fast += 1
+        except UnsupportedICS:
+            fallback += 1
+            continue
+        except NotAnEvent:
+            fast += 1
+        expected = outcome(lambda: vevent_fields(vobject.readOne(text)))
+        actual = outcome(lambda: extract_vevent(text))
+        if actual != expected:
+            mismatched += 1
+            print(f"MISMATCH {filename}\n  vobject: {expected}\n  fast:    {actual}")
+    print(f"{len(files)} files: {fast} fast path, {fallback} vobject fallback, {mismatched} mismatched")
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == "__main__":
+    import sys
+    _compare(sys.argv[1:])
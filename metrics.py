@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+
+class _Timer:
+    __slots__ = ("registry", "key", "start")
+
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry._observe(self.key, time.perf_counter() - self.start)
+        return False
+
+
+_DISABLED = nullcontext()
+
+
+def payload_size(data):
+    """Size in bytes of a request or response body given as str, bytes or None."""
+    if not data:
+        return 0
+    return len(data.encode("utf-8")) if isinstance(data, str) else len(data)
+
+
+class Metrics:
+    """
+    Process-wide registry of counters and timings, keyed by metric name and labels.
+
+    Disabled by default: inc() and timer() then return immediately, so instrumented
+    code paths cost one attribute check. Enable it before a sync to collect, then
+    export with write().
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.counters = {}
+        # (name, labels) -> [count, sum, max] in seconds
+        self.timings = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.timings = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def timer(self, name, **labels):
+        """Context manager recording the duration of its block under name and labels."""
+        if not self.enabled:
+            return _DISABLED
+        return _Timer(self, self._key(name, labels))
+
+    def observe(self, name, seconds, **labels):
+        if self.enabled:
+            self._observe(self._key(name, labels), seconds)
+
+    def _observe(self, key, seconds):
+        with self._lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                self.timings[key] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = max(timing[2], seconds)
+
+    def to_dict(self):
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timings = sorted((key, list(value)) for key, value in self.timings.items())
+        result = {"counters": {}, "timings": {}}
+        for (name, labels), value in counters:
+            result["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), (count, total, longest) in timings:
+            result["timings"].setdefault(name, []).append({
+                "labels": dict(labels), "count": count, "sum": round(total, 6), "max": round(longest, 6)
+            })
+        return result
+
+    def to_prometheus(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        def series(name, labels, value):
+            label_str = ",".join(
+                '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                for k, v in labels.items()
+            )
+            return f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}"
+
+        data = self.to_dict()
+        lines = []
+        for name, samples in data["counters"].items():
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(series(name, s["labels"], s["value"]) for s in samples)
+        for name, samples in data["timings"].items():
+            lines.append(f"# TYPE {name} summary")
+            for s in samples:
+                lines.append(series(f"{name}_count", s["labels"], s["count"]))
+                lines.append(series(f"{name}_sum", s["labels"], s["sum"]))
+            lines.append(f"# TYPE {name}_max gauge")
+            lines.extend(series(f"{name}_max", s["labels"], s["max"]) for s in samples)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, fmt=None):
+        """
+        Write the metrics to path as "json" or "prometheus" (textfile collector format).
+        Without fmt, a .prom file is written as prometheus and anything else as JSON.
+        """
+        fmt = fmt or ("prometheus" if path.endswith(".prom") else "json")
+        if fmt == "prometheus":
+            content = self.to_prometheus()
+        elif fmt == "json":
+            content = json.dumps(self.to_dict(), indent=2) + "\n"
+        else:
+            raise ValueError(f"Unknown metrics format: {fmt!r}")
+        # The textfile collector may read at any time, so never expose a half-written file.
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+
+class MeteredHttp:
+    """
+    Wraps an httplib2-compatible http object and counts requests, errors and bytes
+    sent and received under the given service label.
+    """
+    def __init__(self, http, service, registry=None):
+        self.http = http
+        self.service = service
+        self.registry = registry or metrics
+
+    def request(self, uri, method="GET", body=None, headers=None, *args, **kwargs):
+        registry = self.registry
+        with registry.timer("calsync_http_request_seconds", service=self.service, method=method):
+            resp, content = self.http.request(uri, method, body, headers, *args, **kwargs)
+        registry.inc("calsync_http_bytes_total", payload_size(body), service=self.service, direction="sent")
+        registry.inc("calsync_http_bytes_total", payload_size(content), service=self.service, direction="received")
+        if resp.status >= 400:
+            registry.inc("calsync_http_errors_total", service=self.service, status=resp.status)
+        return resp, content
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+
+# Registry used by the sync code; cli.py enables it for --metrics.
+metrics = Metrics()
@@ -0,0 +1,127 @@
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from apple_calendar import AppleCalendar
+from google_calendar import GoogleCalendar
+from ratelimit import caldav_scheduler, google_scheduler
+from state_store import open_state_store
+from sync import CalendarSync
+
+# Pair names become part of state file names, so they may not contain path separators.
+PAIR_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]*")
+
+
+def load_pairs(config):
+    """
+    Return the configured Apple -> Google calendar pairs as dicts with name,
+    apple_calendar_index and google_calendar_id.
+
+    Without a [[pairs]] list the top-level apple_calendar_index/google_calendar_id
+    form a single pair named "default".
+    """
+    pairs = config.get("pairs") or []
+    if not pairs:
+        return [{
+            "name": "default",
+            "apple_calendar_index": config.apple_calendar_index,
+            "google_calendar_id": config.google_calendar_id,
+        }]
+    names = set()
+    result = []
+    for idx, pair in enumerate(pairs):
+        name = str(pair.get("name") or idx)
+        if not PAIR_NAME.fullmatch(name):
+            raise ValueError(f"Invalid sync pair name {name!r}: use letters, digits, '-', '_' and '.'")
+        if name in names:
+            raise ValueError(f"Duplicate sync pair name: {name!r}")
+        names.add(name)
+        result.append({
+            "name": name,
+            "apple_calendar_index": int(pair["apple_calendar_index"]),
+            "google_calendar_id": pair["google_calendar_id"],
+        })
+    return result
+
+
+def pair_state_paths(name, path="calsync.db", map_file="event_map.toml", state_file="sync_state.toml"):
+    """
+    Return (path, map_file, state_file) for a pair; the "default" pair keeps the unsuffixed names.
+    """
+    if name == "default":
+        return path, map_file, state_file
+
+    def suffixed(filename):
+        root, ext = os.path.splitext(filename)
+        return f"{root}-{name}{ext}"
+    return suffixed(path), suffixed(map_file), suffixed(state_file)
+
+
+def configure_schedulers(config):
+    """Apply the request rate and retry settings to the process-wide Google and CalDAV schedulers."""
+    max_retries = int(config.get("sync.max_retries", 5))
+    google_scheduler.configure(rate=float(config.get("sync.google_qps", 10)), burst=60, max_retries=max_retries)
+    caldav_scheduler.configure(rate=float(config.get("sync.caldav_qps", 0)), max_retries=max_retries)
+
+
+def build_pair_syncs(config):
+    """
+    Build one CalendarSync per configured pair. All pairs share the Google credentials
+    and the CalDAV connection; each pair has its own state store.
+    """
+    configure_schedulers(config)
+    apple_client = None
+    syncs = []
+    for pair in load_pairs(config):
+        path, map_file, state_file = pair_state_paths(pair["name"], config.get("state.path", "calsync.db"))
+        state = open_state_store(config.get("state.backend", "sqlite"), path, map_file, state_file)
+        google_calendar = GoogleCalendar(
+            config.google_credentials,
+            pair["google_calendar_id"],
+            use_import=config.get("sync.use_import", False),
+            transport=config.get("sync.google_transport", "httplib2"),
+            pool_size=int(config.get("sync.google_pool_size", 10)),
+            timeout=float(config.get("sync.google_timeout", 60))
+        )
+        apple_calendar = AppleCalendar(
+            config.apple_email,
+            config.apple_password,
+            config.apple_caldav_url,
+            calendar_index=pair["apple_calendar_index"],
+            state=state,
+            client=apple_client
+        )
+        apple_client = apple_calendar.client
+        calendar_sync = CalendarSync(apple_calendar, google_calendar, config, state=state)
+        calendar_sync.name = pair["name"]
+        syncs.append(calendar_sync)
+    return syncs
+
+
+def run_pairs(calendar_syncs, max_concurrent=4, executor=None):
+    """
+    Run sync() for every pair, at most max_concurrent at a time. A long-running caller
+    can pass its own executor to reuse the worker threads; it is left running.
+
+    Returns a dict of pair name -> stats Counter, or the exception a failed pair raised.
+    """
+    def run(calendar_sync):
+        try:
+            return calendar_sync.sync()
+        except Exception as e:
+            logging.error(f"Sync of pair {calendar_sync.name} failed", exc_info=e)
+            return e
+
+    if len(calendar_syncs) == 1:
+        return {calendar_syncs[0].name: run(calendar_syncs[0])}
+    if executor is None:
+        with pair_executor(max_concurrent) as executor:
+            return run_pairs(calendar_syncs, max_concurrent, executor)
+    results = executor.map(run, calendar_syncs)
+    return {calendar_sync.name: result for calendar_sync, result in zip(calendar_syncs, results)}
+
+
+def pair_executor(max_concurrent=4):
+    """Thread pool that runs up to max_concurrent pairs at once."""
+    return ThreadPoolExecutor(max_workers=max(1, max_concurrent), thread_name_prefix='calsync-pair')
@@ -0,0 +1,78 @@
+"""
+httplib2-compatible transport for googleapiclient on top of a urllib3 connection pool.
+
+httplib2 keeps one connection per Http object and is not thread-safe, so every thread
+(and every service built with the default transport) opens and handshakes its own
+connections. PooledHttp instead sends all requests of a GoogleCalendar through one
+urllib3 pool that threads share, with keep-alive, gzip and timeouts, and applies and
+refreshes the OAuth credentials itself.
+"""
+import threading
+import urllib.request
+
+# One lock for all refreshes, as calendars of one process share their credentials.
+refresh_lock = threading.Lock()
+
+
+class PooledHttp:
+    """
+    Stands in for httplib2.Http in googleapiclient services and batch requests.
+
+    pool_size caps the connections kept open to each host, so it should be at least the
+    number of threads sending requests. timeout is the connect and read timeout in seconds.
+    An https_proxy from the environment is honoured, as with httplib2.
+    """
+    def __init__(self, credentials, pool_size=10, timeout=60):
+        import certifi
+        import urllib3
+
+        self.credentials = credentials
+        options = dict(
+            num_pools=4, maxsize=pool_size, retries=False, ca_certs=certifi.where(),
+            timeout=urllib3.Timeout(connect=timeout, read=timeout),
+            headers={"accept-encoding": "gzip, deflate"},
+        )
+        proxy = urllib.request.getproxies().get("https")
+        self.pool = urllib3.ProxyManager(proxy, **options) if proxy else urllib3.PoolManager(**options)
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        headers = dict(headers or {})
+        if not self.credentials.valid:
+            self.refresh(self.credentials.token)
+        token = self.credentials.token
+        self.credentials.apply(headers)
+        response = self._send(uri, method, body, headers, redirections)
+        if response.status == 401 and self.credentials.refresh_token:
+            # Token revoked or expired early: refresh once and retry.
+            self.refresh(token)
+            self.credentials.apply(headers)
+            response = self._send(uri, method, body, headers, redirections)
+        return self._httplib2_response(response), response.data
+
+    def _send(self, uri, method, body, headers, redirections):
+        return self.pool.request(method, uri, body=body, headers=headers, redirect=redirections > 0)
+
+    def refresh(self, stale_token):
+        """Refresh the credentials unless another thread already replaced stale_token."""
+        from google.auth.transport.urllib3 import Request
+
+        with refresh_lock:
+            if self.credentials.token == stale_token or not self.credentials.valid:
+                self.credentials.refresh(Request(self.pool))
+
+    @staticmethod
+    def _httplib2_response(response):
+        import httplib2
+
+        info = {name.lower(): value for name, value in response.headers.items()}
+        if "content-encoding" in info:
+            # urllib3 already decoded the body; report it the way httplib2 does.
+            info["-content-encoding"] = info.pop("content-encoding")
+            info["content-length"] = str(len(response.data))
+        info["status"] = str(response.status)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason
+        return resp
+
+    def close(self):
+        self.pool.clear()
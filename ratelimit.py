@@ -0,0 +1,239 @@
+"""
+Request scheduling shared by the Google and CalDAV clients: a token bucket that paces
+requests under the server's quota, an AIMD rate that backs off when the server
+throttles and creeps back up while it does not, and retries of transient failures
+with jittered exponential backoff that honours Retry-After.
+
+Google's Calendar quota is per user and per minute, so one scheduler per service is
+shared by every calendar and thread of the process.
+"""
+import email.utils
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from metrics import metrics
+
+# Error kinds returned by classify().
+THROTTLED = "throttled"
+RETRYABLE = "retryable"
+FATAL = "fatal"
+
+# 403 reasons Google uses for short-term rate limits, as opposed to daily quotas or permissions.
+THROTTLE_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+RETRYABLE_STATUSES = {500, 502, 503, 504}
+
+
+class RetryableResponse(Exception):
+    """Raised for an HTTP response (not an exception) that should be retried, such as a CalDAV 503."""
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status}")
+        self.response = response
+        self.status = response.status
+        self.headers = response.headers
+
+
+def _status_and_headers(error):
+    resp = getattr(error, "resp", None)
+    if resp is not None:
+        # googleapiclient HttpError: resp is an httplib2.Response with lower-cased headers.
+        return getattr(resp, "status", None), resp
+    return getattr(error, "status", None), getattr(error, "headers", None) or {}
+
+
+def _google_reason(error):
+    try:
+        details = json.loads(error.content)["error"]["errors"]
+    except (AttributeError, KeyError, IndexError, TypeError, ValueError):
+        return None
+    return details[0].get("reason") if details else None
+
+
+def _is_network_error(error):
+    if isinstance(error, OSError):
+        # Connection resets, timeouts and DNS failures; requests' errors are OSErrors too.
+        return True
+    # Transport errors that are not OSErrors, checked only if their library was loaded.
+    for module, name in (("httplib2", "HttpLib2Error"), ("urllib3.exceptions", "HTTPError")):
+        base = getattr(sys.modules.get(module), name, None)
+        if base is not None and isinstance(error, base):
+            return True
+    return False
+
+
+def classify(error):
+    """Return THROTTLED, RETRYABLE or FATAL for an exception raised by a request."""
+    status, _ = _status_and_headers(error)
+    if status is None:
+        return RETRYABLE if _is_network_error(error) else FATAL
+    status = int(status)
+    if status == 429 or (status == 403 and _google_reason(error) in THROTTLE_REASONS):
+        return THROTTLED
+    if status in RETRYABLE_STATUSES:
+        return RETRYABLE
+    return FATAL
+
+
+def is_permanent(error):
+    """
+    True for a client error that sending the same request again will not fix, such as a
+    400 for an event Google refuses. Authorization, quota and timeout errors are not
+    permanent: they can clear up by the next run.
+    """
+    status, _ = _status_and_headers(error)
+    return status is not None and 400 <= int(status) < 500 and int(status) not in (401, 403, 408, 429)
+
+
+def retry_after(error):
+    """Seconds the server asked to wait before retrying, from a Retry-After header, or None."""
+    _, headers = _status_and_headers(error)
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiter:
+    """
+    Token bucket refilled at `rate` requests per second, holding up to `burst` seconds
+    worth of tokens. Callers that find the bucket empty take tokens on credit and sleep
+    until they are paid back, so waiting callers are served in order.
+
+    The rate adapts AIMD-style between min_rate and the configured ceiling: it halves
+    (at most once per second) when the server throttles, and grows by about `increase`
+    requests per second for every second of successful requests. rate=None disables it.
+    """
+    def __init__(self, rate=None, burst=1.0, min_rate=0.5, increase=1.0):
+        self._lock = threading.Lock()
+        self.configure(rate, burst, min_rate, increase)
+
+    def configure(self, rate=None, burst=1.0, min_rate=0.5, increase=1.0):
+        with self._lock:
+            self.max_rate = float(rate) if rate else None
+            self.rate = self.max_rate
+            self.capacity = max(1.0, self.max_rate * burst) if self.max_rate else 0.0
+            self.tokens = self.capacity
+            self.min_rate = min(min_rate, self.max_rate) if self.max_rate else min_rate
+            self.increase = increase
+            self._updated = time.monotonic()
+            self._last_decrease = 0.0
+
+    def acquire(self, cost=1):
+        """Block until cost requests may be sent; returns the seconds waited."""
+        if self.max_rate is None:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= cost
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            metrics.observe("calsync_rate_limit_wait_seconds", wait)
+            time.sleep(wait)
+        return wait
+
+    def throttled(self):
+        if self.max_rate is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # Concurrent requests tend to be throttled together; count that as one signal.
+            if now - self._last_decrease < 1.0:
+                return
+            self._last_decrease = now
+            self.rate = max(self.min_rate, self.rate / 2)
+            # Spend the saved-up burst too, or it would be sent straight into the limit again.
+            self.tokens = min(self.tokens, 0.0)
+            logging.info(f"Throttled by the server, slowing down to {self.rate:.1f} requests/s")
+
+    def succeeded(self, cost=1):
+        if self.max_rate is None or self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase * cost / self.rate)
+
+
+class RequestScheduler:
+    """
+    Sends requests for one service through a RateLimiter and retries throttled and
+    transient failures up to max_retries times. The n-th retry waits a random time
+    between half and all of base_delay * 2**n (capped at max_delay), or longer if the
+    server sent Retry-After. Retries are counted in calsync_retries_total.
+    """
+    def __init__(self, service, rate=None, burst=1.0, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.service = service
+        self.limiter = RateLimiter(rate, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def configure(self, rate=None, burst=1.0, max_retries=5):
+        self.limiter.configure(rate, burst)
+        self.max_retries = max_retries
+
+    def call(self, request, cost=1, idempotent=True):
+        """
+        Return request(), retrying it while should_retry() allows; cost is the number of
+        API calls it makes. See should_retry() for requests that are not idempotent.
+        """
+        attempt = 0
+        while True:
+            self.limiter.acquire(cost)
+            try:
+                result = request()
+            except Exception as e:
+                if not self.should_retry(e, attempt, idempotent):
+                    raise
+                self.backoff(attempt, e)
+                attempt += 1
+                continue
+            self.limiter.succeeded(cost)
+            return result
+
+    def should_retry(self, error, attempt, idempotent=True):
+        """
+        Whether a request that failed with error on its attempt-th retry (0 for the first
+        try) should be retried. Throttling also slows the limiter down. A request that is
+        not idempotent is only retried when throttled: after a 5xx or network error it may
+        have been applied, and sending it again could apply it twice.
+        """
+        kind = classify(error)
+        if kind == FATAL or (kind == RETRYABLE and not idempotent):
+            return False
+        if kind == THROTTLED:
+            self.limiter.throttled()
+        if attempt >= self.max_retries:
+            logging.warning(f"Giving up on {self.service} request after {attempt} retries: {error}")
+            return False
+        metrics.inc("calsync_retries_total", reason=f"{self.service}_{kind}")
+        return True
+
+    def backoff(self, attempt, error=None):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+        requested = retry_after(error) if error is not None else None
+        if requested is not None:
+            delay = max(delay, min(requested, self.max_delay))
+        logging.debug(f"Retrying {self.service} request in {delay:.2f}s: {error}")
+        time.sleep(delay)
+
+
+# Google's default Calendar quota is 600 requests per minute per user: 10/s with a
+# minute's burst. CalDAV has no published quota, so its requests are not paced unless
+# a rate is configured, only retried.
+google_scheduler = RequestScheduler("google", rate=10, burst=60)
+caldav_scheduler = RequestScheduler("caldav")
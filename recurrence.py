@@ -0,0 +1,207 @@
+"""
+Recurring Google events without Google's expansion. A series-level listing
+(singleEvents=False) returns each recurring series once, as its master plus any
+exceptions, instead of one item per occurrence. RecurrenceIndex keeps those compactly
+and expands occurrences only when asked for a time window, caching recent windows.
+"""
+from collections import OrderedDict, namedtuple
+from datetime import date, datetime, time
+from itertools import count
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import logging
+import threading
+
+from dateutil import parser
+from dateutil.rrule import rrulestr
+
+UTC = ZoneInfo("UTC")
+
+
+def parse_time(value):
+    """
+    Return (datetime, zone) for a Google start, end or originalStartTime value. The
+    datetime is aware; all-day dates fall on midnight UTC.
+    """
+    if "date" in value:
+        return datetime.combine(date.fromisoformat(value["date"]), time(), UTC), UTC
+    moment = parser.isoparse(value["dateTime"])
+    zone = None
+    if value.get("timeZone"):
+        try:
+            zone = ZoneInfo(value["timeZone"])
+        except (ZoneInfoNotFoundError, ValueError):
+            logging.debug(f"Unknown time zone {value['timeZone']!r}, using the offset of {value['dateTime']}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=zone or UTC)
+    return moment, zone or moment.tzinfo
+
+
+def _utc(value):
+    return parse_time(value)[0].astimezone(UTC)
+
+
+def instance_id(series_id, start, all_day=False):
+    """Event id Google gives the occurrence of series_id that starts at start."""
+    start = start.astimezone(UTC)
+    return f"{series_id}_{start:%Y%m%d}" if all_day else f"{series_id}_{start:%Y%m%dT%H%M%SZ}"
+
+
+class Recurrence:
+    """
+    The RRULE/EXRULE/RDATE/EXDATE lines of a series starting at start. Occurrences repeat
+    on the wall clock of zone, so they keep their local time across DST changes, and are
+    returned in UTC. Raises ValueError for lines dateutil cannot parse.
+    """
+    __slots__ = ("_rules", "_zone", "bounded")
+
+    def __init__(self, lines, start, zone=UTC):
+        text = "\n".join(lines)
+        local = start.astimezone(zone)
+        # Without a COUNT or UNTIL, an RRULE repeats forever.
+        self.bounded = all("COUNT=" in line or "UNTIL=" in line for line in lines if line.startswith("RRULE"))
+        try:
+            self._rules = rrulestr(text, dtstart=local, forceset=True)
+            self._zone = None
+        except ValueError:
+            # A date-only UNTIL cannot be combined with an aware DTSTART.
+            self._rules = rrulestr(text, dtstart=local.replace(tzinfo=None), forceset=True)
+            self._zone = zone
+
+    def _local(self, moment):
+        return moment.astimezone(self._zone).replace(tzinfo=None) if self._zone else moment
+
+    def _utc(self, moment):
+        return (moment.replace(tzinfo=self._zone) if self._zone else moment).astimezone(UTC)
+
+    def between(self, after, before):
+        """Occurrence starts strictly between two aware datetimes."""
+        return [self._utc(moment) for moment in self._rules.between(self._local(after), self._local(before))]
+
+    def last(self):
+        """Start of the last occurrence, or None if the series never ends or has none."""
+        if not self.bounded:
+            return None
+        last = None
+        for last in self._rules:
+            pass
+        return self._utc(last) if last is not None else None
+
+
+class Occurrence(namedtuple("Occurrence", "event_id start end original_start")):
+    """One occurrence of a recurring event; times are UTC datetimes."""
+    __slots__ = ()
+
+    @classmethod
+    def from_item(cls, item):
+        """Occurrence of an instance listed by Google (events.instances or singleEvents=True)."""
+        start = _utc(item["start"])
+        original = _utc(item["originalStartTime"]) if item.get("originalStartTime") else start
+        return cls(item["id"], start, _utc(item["end"]), original)
+
+
+class _Series:
+    """A recurring master as listed; its times and rules are parsed on first expansion."""
+    __slots__ = ("start_value", "end_value", "lines", "_parsed")
+
+    def __init__(self, start_value, end_value, lines):
+        self.start_value = start_value
+        self.end_value = end_value
+        self.lines = tuple(lines)
+        self._parsed = None
+
+    def parsed(self):
+        """(start, duration, all_day, Recurrence); raises ValueError for unparsable rules."""
+        if self._parsed is None:
+            start, zone = parse_time(self.start_value)
+            start = start.astimezone(UTC)
+            self._parsed = (start, _utc(self.end_value) - start, "date" in self.start_value,
+                            Recurrence(self.lines, start, zone))
+        return self._parsed
+
+
+class RecurrenceIndex:
+    """
+    Recurring series of one calendar, indexed from the masters and exceptions of a
+    series-level listing. Nothing is expanded while indexing: occurrences() expands one
+    series for one window when asked, and keeps the last cache_size results until the
+    series or one of its exceptions changes.
+    """
+    def __init__(self, cache_size=256):
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._versions = count()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._series = {}
+            # series id -> {original start: (event id, start, end), or None if cancelled}
+            self._exceptions = {}
+            # series id -> version, part of the cache key so changes invalidate cached windows.
+            self._version = {}
+            self._cache = OrderedDict()
+
+    def __contains__(self, series_id):
+        return series_id in self._series
+
+    def __len__(self):
+        return len(self._series)
+
+    def add(self, record):
+        """
+        Index a GoogleEventRecord from a series-level listing: a recurring master, an
+        exception of one (moved, edited or cancelled occurrence) or a cancelled master.
+        Other records are ignored.
+        """
+        with self._lock:
+            if record.recurringEventId and record.originalStartTime:
+                original = _utc(record.originalStartTime)
+                exceptions = self._exceptions.setdefault(record.recurringEventId, {})
+                if record.status == "cancelled" or not record.start:
+                    exceptions[original] = None
+                else:
+                    exceptions[original] = (record.id, _utc(record.start), _utc(record.end))
+                self._version[record.recurringEventId] = next(self._versions)
+            elif record.recurrence and record.status != "cancelled":
+                self._series[record.id] = _Series(record.start, record.end, record.recurrence)
+                self._version[record.id] = next(self._versions)
+            elif record.id in self._series or record.id in self._exceptions:
+                # Cancelled, or no longer recurring.
+                self._series.pop(record.id, None)
+                self._exceptions.pop(record.id, None)
+                self._version.pop(record.id, None)
+
+    def occurrences(self, series_id, time_min, time_max):
+        """
+        Occurrences of series_id that overlap [time_min, time_max), with its exceptions
+        applied, in start order. None if the series is not indexed or its recurrence
+        cannot be parsed, so callers can ask Google instead.
+        """
+        with self._lock:
+            series = self._series.get(series_id)
+            if series is None:
+                return None
+            key = (series_id, self._version[series_id], time_min, time_max)
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return list(cached)
+            try:
+                start, duration, all_day, recurrence = series.parsed()
+                # The series start itself is an occurrence even if the rules skip it.
+                starts = [start] if time_min - duration < start < time_max else []
+                starts += [moment for moment in recurrence.between(time_min - duration, time_max) if moment != start]
+            except ValueError as e:
+                logging.debug(f"Cannot expand recurrence of Google event {series_id}: {e}")
+                return None
+            exceptions = self._exceptions.get(series_id, {})
+            result = [Occurrence(instance_id(series_id, moment, all_day), moment, moment + duration, moment)
+                      for moment in starts if moment not in exceptions]
+            for original, moved in exceptions.items():
+                if moved is not None and moved[1] < time_max and moved[2] > time_min:
+                    result.append(Occurrence(moved[0], moved[1], moved[2], original))
+            result.sort(key=lambda occurrence: occurrence.start)
+            self._cache[key] = tuple(result)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return result
@@ -1,6 +1,9 @@
 import toml
 from dateutil import parser
 from datetime import datetime, timezone
+from state_store import open_state_store
+
+_state_store = None
 
 def update_settings_file(new_settings, filename="settings.toml"):
     # Load existing settings
@@ -17,43 +20,32 @@ def update_settings_file(new_settings, filename="settings.toml"):
         toml.dump(settings, f)
 
 
-def get_g_sync_token(filename="sync_state.toml"):
-    try:
-        data = toml.load(filename)
-        return data.get("g_sync_token")
-    except Exception:
-        return None
+def get_state_store():
+    """Return the process-wide state store, opening the default SQLite store on first use."""
+    global _state_store
+    if _state_store is None:
+        _state_store = open_state_store()
+    return _state_store
 
-def set_g_sync_token(token, filename="sync_state.toml"):
-    try:
-        data = toml.load(filename)
-    except Exception:
-        data = {}
-    data["g_sync_token"] = token
-    with open(filename, "w") as f:
-        toml.dump(data, f)
+def set_state_store(store):
+    global _state_store
+    _state_store = store
 
-def get_apple_sync_token(filename="sync_state.toml"):
-    try:
-        data = toml.load(filename)
-        return data.get("apple_sync_token")
-    except Exception:
-        return None
 
-def set_apple_sync_token(token, filename="sync_state.toml"):
-    try:
-        data = toml.load(filename)
-    except Exception:
-        data = {}
-    data["apple_sync_token"] = token
-    with open(filename, "w") as f:
-        toml.dump(data, f)
+def get_g_sync_token(store=None):
+    return (store or get_state_store()).get_token("g_sync_token")
 
-def load_guid_map(filename="event_map.toml"):
-    data = toml.load(filename)
-    return data.get("guid_map", {})
+def set_g_sync_token(token, store=None):
+    (store or get_state_store()).set_token("g_sync_token", token)
 
-def save_guid_map(guid_map, filename="event_map.toml"):
-    data = {"guid_map": guid_map}
-    with open(filename, "w") as f:
-        toml.dump(data, f)
\ No newline at end of file
+def get_apple_sync_token(store=None):
+    return (store or get_state_store()).get_token("apple_sync_token")
+
+def set_apple_sync_token(token, store=None):
+    (store or get_state_store()).set_token("apple_sync_token", token)
+
+def load_guid_map(store=None):
+    return (store or get_state_store()).load_guid_map()
+
+def save_guid_map(guid_map, store=None):
+    (store or get_state_store()).save_guid_map(guid_map)
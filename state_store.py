@@ -0,0 +1,385 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import toml
+
+
+class GuidMap(dict):
+    """
+    Apple GUID -> Google event id mapping that remembers which entries changed since
+    it was last saved, so a state store only has to write those rows.
+
+    Alongside each mapping it keeps the hash of the event body last pushed to Google,
+    the etag Google returned for it and, with a sync horizon, when the event (or its
+    series) ends: an ISO timestamp, or "" for a series without end. The CalDAV href of
+    the Apple object lets a deletion, which the sync report only names by href, find its GUID.
+    """
+    def __init__(self, *args, hashes=None, etags=None, ends=None, hrefs=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hashes = dict(hashes or {})
+        self.etags = dict(etags or {})
+        self.ends = dict(ends or {})
+        self.hrefs = dict(hrefs or {})
+        self._dirty = set()
+        self._deleted = set()
+
+    def __setitem__(self, guid, event_id):
+        super().__setitem__(guid, event_id)
+        self._dirty.add(guid)
+        self._deleted.discard(guid)
+
+    def __delitem__(self, guid):
+        super().__delitem__(guid)
+        self.hashes.pop(guid, None)
+        self.etags.pop(guid, None)
+        self.ends.pop(guid, None)
+        self.hrefs.pop(guid, None)
+        self._dirty.discard(guid)
+        self._deleted.add(guid)
+
+    def pop(self, guid, *default):
+        if guid not in self:
+            return super().pop(guid, *default)
+        event_id = self[guid]
+        del self[guid]
+        return event_id
+
+    def setdefault(self, guid, event_id=None):
+        if guid not in self:
+            self[guid] = event_id
+        return self[guid]
+
+    def update(self, *args, **kwargs):
+        for guid, event_id in dict(*args, **kwargs).items():
+            self[guid] = event_id
+
+    def clear(self):
+        for guid in list(self):
+            del self[guid]
+
+    def set_hash(self, guid, body_hash):
+        self.hashes[guid] = body_hash
+        self._dirty.add(guid)
+
+    def set_etag(self, guid, etag):
+        self.etags[guid] = etag
+        self._dirty.add(guid)
+
+    def set_end(self, guid, end):
+        self.ends[guid] = end
+        self._dirty.add(guid)
+
+    def set_href(self, guid, href):
+        self.hrefs[guid] = href
+        self._dirty.add(guid)
+
+    def changes(self):
+        """Return (upserts, deletes) accumulated since the last save."""
+        return {guid: self[guid] for guid in self._dirty}, set(self._deleted)
+
+    def mark_saved(self, upserts, deletes):
+        self._dirty.difference_update(upserts)
+        self._deleted.difference_update(deletes)
+
+
+class TomlStateStore:
+    """
+    Legacy state backend: the GUID map in event_map.toml and sync tokens in sync_state.toml.
+    Every save rewrites the whole file. The mutation journal is an append-only JSON lines
+    file next to the map file.
+    """
+    def __init__(self, map_file="event_map.toml", state_file="sync_state.toml"):
+        self.map_file = map_file
+        self.state_file = state_file
+        self.journal_file = f"{os.path.splitext(map_file)[0]}.journal.jsonl"
+
+    @staticmethod
+    def _load(filename):
+        try:
+            return toml.load(filename)
+        except FileNotFoundError:
+            return {}
+
+    @staticmethod
+    def _dump(data, filename):
+        # Write to a temporary file first so a crash cannot leave a truncated file behind.
+        tmp = f"{filename}.tmp"
+        with open(tmp, "w") as f:
+            toml.dump(data, f)
+        os.replace(tmp, filename)
+
+    @contextmanager
+    def transaction(self):
+        yield self
+
+    def load_guid_map(self):
+        data = self._load(self.map_file)
+        return GuidMap(data.get("guid_map", {}), hashes=data.get("body_hash", {}), etags=data.get("google_etag", {}),
+                       ends=data.get("event_end", {}), hrefs=data.get("apple_href", {}))
+
+    def save_guid_map(self, guid_map):
+        data = {"guid_map": dict(guid_map)}
+        hashes = getattr(guid_map, "hashes", None)
+        if hashes:
+            data["body_hash"] = hashes
+        etags = getattr(guid_map, "etags", None)
+        if etags:
+            data["google_etag"] = etags
+        ends = getattr(guid_map, "ends", None)
+        if ends:
+            data["event_end"] = ends
+        hrefs = getattr(guid_map, "hrefs", None)
+        if hrefs:
+            data["apple_href"] = hrefs
+        self._dump(data, self.map_file)
+        if isinstance(guid_map, GuidMap):
+            guid_map.mark_saved(*guid_map.changes())
+
+    def get_token(self, name):
+        try:
+            return self._load(self.state_file).get(name)
+        except Exception:
+            return None
+
+    def set_token(self, name, value):
+        try:
+            data = self._load(self.state_file)
+        except Exception:
+            data = {}
+        if value is None:
+            data.pop(name, None)
+        else:
+            data[name] = value
+        self._dump(data, self.state_file)
+
+    def _read_journal(self):
+        entries = {}
+        try:
+            with open(self.journal_file) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-append; that entry was never sent.
+                        continue
+                    if record.get("done"):
+                        entries.pop(record["seq"], None)
+                    else:
+                        entries[record["seq"]] = record
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def journal_append(self, entries):
+        pending = self._read_journal()
+        seq = max(pending, default=0)
+        with open(self.journal_file, "a") as f:
+            for entry in entries:
+                seq += 1
+                entry["seq"] = seq
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return entries
+
+    def journal_remove(self, seqs):
+        if not seqs:
+            return
+        with open(self.journal_file, "a") as f:
+            f.writelines(json.dumps({"seq": seq, "done": True}) + "\n" for seq in seqs)
+        if not self._read_journal():
+            os.remove(self.journal_file)
+
+    def journal_pending(self):
+        return sorted(self._read_journal().values(), key=lambda entry: entry["seq"])
+
+    def close(self):
+        pass
+
+
+class SqliteStateStore:
+    """
+    State backend keeping the GUID map and sync tokens in one SQLite database in WAL mode.
+
+    GUID mappings are upserted per row and tokens can be committed in the same transaction
+    as the mappings they cover, as can journal entries. On first open, existing TOML state
+    is migrated once.
+    """
+    SCHEMA_VERSION = 6
+
+    def __init__(self, path="calsync.db", legacy_map_file="event_map.toml", legacy_state_file="sync_state.toml"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._on_commit = []
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate(legacy_map_file, legacy_state_file)
+
+    def _migrate(self, legacy_map_file, legacy_state_file):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= self.SCHEMA_VERSION:
+            return
+        with self.transaction():
+            if version < 1:
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS guid_map (guid TEXT PRIMARY KEY, event_id TEXT NOT NULL)"
+                )
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)"
+                )
+            if version < 2:
+                self.conn.execute("ALTER TABLE guid_map ADD COLUMN body_hash TEXT")
+            if version < 3:
+                self.conn.execute("ALTER TABLE guid_map ADD COLUMN google_etag TEXT")
+            if version < 4:
+                self.conn.execute("ALTER TABLE guid_map ADD COLUMN event_end TEXT")
+            if version < 5:
+                self.conn.execute("CREATE TABLE IF NOT EXISTS journal (seq INTEGER PRIMARY KEY, entry TEXT NOT NULL)")
+            if version < 6:
+                self.conn.execute("ALTER TABLE guid_map ADD COLUMN apple_href TEXT")
+            if version < 1:
+                self._import_toml(legacy_map_file, legacy_state_file)
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _import_toml(self, legacy_map_file, legacy_state_file):
+        legacy = TomlStateStore(legacy_map_file, legacy_state_file)
+        guid_map = legacy.load_guid_map()
+        if guid_map:
+            logging.info(f"Migrating {len(guid_map)} GUID mappings from {legacy_map_file} to {self.path}")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO guid_map (guid, event_id, body_hash, google_etag, event_end, apple_href) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                ((guid, event_id, guid_map.hashes.get(guid), guid_map.etags.get(guid), guid_map.ends.get(guid),
+                  guid_map.hrefs.get(guid))
+                 for guid, event_id in guid_map.items())
+            )
+        for name in ("g_sync_token", "apple_sync_token"):
+            token = legacy.get_token(name)
+            if token:
+                logging.info(f"Migrating {name} from {legacy_state_file} to {self.path}")
+                self._write_token(name, token)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group writes into one atomic commit. Nested transactions join the outermost one.
+        """
+        with self._lock:
+            if self._depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute("ROLLBACK")
+                    self._on_commit = []
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.conn.execute("COMMIT")
+                callbacks, self._on_commit = self._on_commit, []
+                for callback in callbacks:
+                    callback()
+
+    def load_guid_map(self):
+        guid_map = GuidMap()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT guid, event_id, body_hash, google_etag, event_end, apple_href FROM guid_map"
+            )
+            for guid, event_id, body_hash, google_etag, event_end, apple_href in rows:
+                dict.__setitem__(guid_map, guid, event_id)
+                if body_hash:
+                    guid_map.hashes[guid] = body_hash
+                if google_etag:
+                    guid_map.etags[guid] = google_etag
+                if event_end is not None:
+                    guid_map.ends[guid] = event_end
+                if apple_href:
+                    guid_map.hrefs[guid] = apple_href
+        return guid_map
+
+    def save_guid_map(self, guid_map):
+        with self.transaction():
+            if isinstance(guid_map, GuidMap):
+                upserts, deletes = guid_map.changes()
+                self._on_commit.append(lambda: guid_map.mark_saved(upserts, deletes))
+            else:
+                self.conn.execute("DELETE FROM guid_map")
+                upserts, deletes = guid_map, ()
+            hashes = getattr(guid_map, "hashes", {})
+            etags = getattr(guid_map, "etags", {})
+            ends = getattr(guid_map, "ends", {})
+            hrefs = getattr(guid_map, "hrefs", {})
+            self.conn.executemany(
+                "INSERT INTO guid_map (guid, event_id, body_hash, google_etag, event_end, apple_href) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(guid) DO UPDATE SET event_id = excluded.event_id, body_hash = excluded.body_hash, "
+                "google_etag = excluded.google_etag, event_end = excluded.event_end, apple_href = excluded.apple_href",
+                ((guid, event_id, hashes.get(guid), etags.get(guid), ends.get(guid), hrefs.get(guid))
+                 for guid, event_id in upserts.items())
+            )
+            self.conn.executemany("DELETE FROM guid_map WHERE guid = ?", ((guid,) for guid in deletes))
+
+    def get_token(self, name):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM sync_state WHERE key = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_token(self, name, value):
+        with self.transaction():
+            self._write_token(name, value)
+
+    def _write_token(self, name, value):
+        if value is None:
+            self.conn.execute("DELETE FROM sync_state WHERE key = ?", (name,))
+        else:
+            self.conn.execute(
+                "INSERT INTO sync_state (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (name, value)
+            )
+
+    def journal_append(self, entries):
+        """
+        Record planned Google mutations (JSON-serializable dicts) before they are sent;
+        each entry gets its journal sequence number under "seq".
+        """
+        with self.transaction():
+            for entry in entries:
+                cursor = self.conn.execute("INSERT INTO journal (entry) VALUES (?)", (json.dumps(entry),))
+                entry["seq"] = cursor.lastrowid
+        return entries
+
+    def journal_remove(self, seqs):
+        with self.transaction():
+            self.conn.executemany("DELETE FROM journal WHERE seq = ?", ((seq,) for seq in seqs))
+
+    def journal_pending(self):
+        """Journal entries whose mutations were not confirmed, oldest first."""
+        with self._lock:
+            rows = self.conn.execute("SELECT seq, entry FROM journal ORDER BY seq").fetchall()
+        return [dict(json.loads(entry), seq=seq) for seq, entry in rows]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def open_state_store(backend="sqlite", path="calsync.db", map_file="event_map.toml", state_file="sync_state.toml"):
+    """
+    Open the configured state backend ("sqlite" or "toml").
+    """
+    if backend == "toml":
+        return TomlStateStore(map_file, state_file)
+    if backend == "sqlite":
+        return SqliteStateStore(path, map_file, state_file)
+    raise ValueError(f"Unknown state backend: {backend!r}")
@@ -1,23 +1,49 @@
 from settings_utils import (
     get_g_sync_token, set_g_sync_token,
     get_apple_sync_token, set_apple_sync_token,
-    load_guid_map, save_guid_map
+    load_guid_map, save_guid_map, get_state_store
 )
 from apple_calendar import AppleCalendar
+import hashlib
+import json
 import logging
-from datetime import datetime, timedelta
+import threading
+from collections import Counter, deque
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from typing import Any
 from dateutil import parser
 from zoneinfo import ZoneInfo
-from google_calendar import GoogleCalendar
+from google_calendar import GoogleCalendar, GoogleEventRecord
+from ics_extract import NotAnEvent, UnsupportedICS, extract_vevent, vevent_fields
+from metrics import metrics
+from ratelimit import is_permanent
+from recurrence import Recurrence, parse_time
 from apple_calendar import AppleCalendar
 
 class CalendarSync:
-    def __init__(self, apple_calendar: AppleCalendar, google_calendar: GoogleCalendar, config):
+    def __init__(self, apple_calendar: AppleCalendar, google_calendar: GoogleCalendar, config, state=None):
         self.apple_calendar = apple_calendar
         self.google_calendar = google_calendar
         self.config = config
+        self.state = state or get_state_store()
+        self.name = "default"
         self.local_tzinfo = ZoneInfo("UTC")
-        self.guid_map = load_guid_map()
+        self.guid_map = load_guid_map(self.state)
+        self.stats: Counter[str] = Counter()
+        # Journal entries of the Google mutations in flight, per GUID in send order.
+        self._in_flight: dict[str, deque[dict[str, Any]]] = {}
+        # Journal sequence numbers of the mutations completed since the last checkpoint.
+        self._completed: list[int] = []
+        # Journal entries of updates whose Google event was gone, to be created again.
+        self._vanished: list[dict[str, Any]] = []
+        # Sync window (start, end) for this run, or None without a horizon.
+        self._window = None
+        # GUIDs seen during a full pull of the window; mappings not seen are pruned.
+        self._seen = None
+        self._result_lock = threading.Lock()
+        self.new_g_sync_token = None
+        self._google_synced = False
         logging.debug(f"Initialized CalendarSync")
 
     @staticmethod
@@ -44,26 +70,23 @@ class CalendarSync:
     
     @staticmethod
     def transform_event(apple_event) -> dict:
-        vobj = apple_event.vobject_instance
-        vevent = getattr(vobj, 'vevent', None)
-        if vevent is None:
-            raise ValueError("No VEVENT found in vobject instance")
-
-        def get_text(field):
-            return str(getattr(vevent, field).value) if hasattr(vevent, field) else ""
-
-        summary    = get_text('summary')
-        description = get_text('description')
-        location   = get_text('location')
-        uid        = get_text('uid')
-        seq        = int(getattr(vevent, 'sequence').value) if hasattr(vevent, 'sequence') else 0
-
-        dtstart = getattr(vevent, 'dtstart').value if hasattr(vevent, 'dtstart') else None
-        dtend   = getattr(vevent, 'dtend').value if hasattr(vevent, 'dtend') else None
+        # AppleChange records arrive with their fields already extracted.
+        fields = getattr(apple_event, 'fields', None)
+        data = getattr(apple_event, 'data', None)
+        if fields is None and data:
+            try:
+                fields = extract_vevent(data)
+            except UnsupportedICS as e:
+                logging.debug(f"Falling back to vobject: {e}")
+        if fields is None:
+            fields = vevent_fields(apple_event.vobject_instance)
+        return CalendarSync.event_from_fields(fields)
 
-        is_all_day = False
-        if hasattr(vevent, 'dtstart') and getattr(vevent.dtstart, 'params', None):
-            is_all_day = vevent.dtstart.params.get('VALUE') == 'DATE'
+    @staticmethod
+    def event_from_fields(fields) -> dict:
+        """Build the Google event body from the VEVENT fields returned by ics_extract."""
+        dtstart = fields["dtstart"]
+        dtend = fields["dtend"]
 
         def to_rfc3339(dt):
             if isinstance(dt, datetime):
@@ -72,21 +95,15 @@ class CalendarSync:
                 return dt.astimezone(ZoneInfo("UTC")).isoformat()
             return None
 
-        if is_all_day:
-            start_date = dtstart.date() if isinstance(dtstart, datetime) else dtstart
-            if start_date is not None:
-                google_start = {"date": start_date.isoformat()}
-            else:
-                raise ValueError("start_date is None and cannot be converted to ISO format")
-
+        # VALUE=DATE (or a bare date value) makes dtstart a date rather than a datetime.
+        if isinstance(dtstart, date) and not isinstance(dtstart, datetime):
+            google_start = {"date": dtstart.isoformat()}
+            # DTEND is exclusive in iCalendar, as is Google's end date.
             if dtend:
                 end_date = dtend.date() if isinstance(dtend, datetime) else dtend
             else:
-                end_date = start_date
-            if end_date is not None:
-                google_end = {"date": (end_date + timedelta(days=1)).isoformat()}
-            else:
-                raise ValueError("end_date is None and cannot be incremented by timedelta")
+                end_date = dtstart + timedelta(days=1)
+            google_end = {"date": end_date.isoformat()}
         else:
             start_iso = to_rfc3339(dtstart)
             if start_iso is None:
@@ -99,140 +116,520 @@ class CalendarSync:
             google_end   = {"dateTime": end_iso,   "timeZone": "UTC"}
 
         event = {
-            "summary": summary,
-            "description": description,
-            "location": location,
+            "summary": fields["summary"],
+            "description": fields["description"],
+            "location": fields["location"],
             "start": google_start,
             "end": google_end,
-            "iCalUID": uid,
-            "sequence": seq,
+            "iCalUID": fields["uid"],
+            "sequence": fields["sequence"],
         }
 
-        if hasattr(vevent, 'rrule'):
-            r = vevent.rrule.value if hasattr(vevent.rrule, 'value') else vevent.rrule
+        r = fields["rrule"]
+        if r:
             event["recurrence"] = ["RRULE:" + str(r)] if isinstance(r, (str,)) else ["RRULE:" + rr for rr in r]
 
         return event
 
-    def google_sync(self):
-        """Handles only Google sync and returns (google_events, new_g_sync_token)."""
-        g_sync_token = get_g_sync_token("sync_state.toml")
-        google_events = []
-        new_g_sync_token = None
+    @staticmethod
+    def event_digest(event) -> str:
+        """Stable hash of a transformed event body, used to skip no-op updates."""
+        canonical = json.dumps(event, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def event_span(event):
+        """
+        Return (start, end) of a transformed event body as UTC datetimes. For a recurring
+        event, end is the end of its last occurrence, or None if the series never ends.
+        """
+        start, zone = parse_time(event["start"])
+        end = parse_time(event["end"])[0]
+        start, end = start.astimezone(ZoneInfo("UTC")), end.astimezone(ZoneInfo("UTC"))
+        if not event.get("recurrence"):
+            return start, end
         try:
-            if not g_sync_token:
-                logging.debug("No Google sync token found, performing initial full sync.")
-                next_page_token = None
-                while True:
-                    g_events = self.google_calendar.list_events(page_token=next_page_token)
-                    google_events.extend(g_events.get('items', []))
-                    next_page_token = g_events.get('nextPageToken')
-                    if not next_page_token:
-                        new_g_sync_token = g_events.get('nextSyncToken')
-                        if not new_g_sync_token:
-                            logging.error("No nextSyncToken returned after initial full sync.")
-                        break
-            else:
-                logging.debug(f"Using Google sync token: {g_sync_token}")
-                g_events = self.google_calendar.list_events(sync_token=g_sync_token)
-                next_page_token = None
-                first = True
-                while True:
-                    try:
-                        if first:
-                            first = False
-                        else:
-                            g_events = self.google_calendar.list_events(page_token=next_page_token)
-                        google_events.extend(g_events.get('items', []))
-                        logging.debug(f"Fetched {len(g_events.get('items', []))} Google events (incremental page).")
-                        next_page_token = g_events.get('nextPageToken')
-                        if not next_page_token:
-                            new_g_sync_token = g_events.get('nextSyncToken')
-                            if not new_g_sync_token:
-                                logging.error("No nextSyncToken returned after incremental sync.")
-                            break
-                    except Exception as e:
-                        logging.error(f"Error during Google incremental sync: {e}")
-                        if hasattr(e, 'resp') and getattr(e.resp, 'status', None) == 410:
-                            logging.warning("Google sync token expired, re-starting initial sync")
-                            set_g_sync_token(None)
-                            # Only re-run Google sync, not the whole sync
-                            return self.google_sync()
-                        else:
-                            raise
-        except Exception as e:
-            logging.error(f"Error during Google sync: {e}")
-            raise
-        return google_events, new_g_sync_token
+            recurrence = Recurrence(event["recurrence"], start, zone)
+            last = recurrence.last()
+        except ValueError as e:
+            logging.debug(f"Treating unparsable recurrence {event['recurrence']!r} as open-ended: {e}")
+            return start, None
+        if not recurrence.bounded:
+            return start, None
+        return start, end if last is None else max(end, last + (end - start))
+
+    @staticmethod
+    def in_window(span, window):
+        """True if an event span overlaps the (start, end) window; None bounds are open."""
+        start, end = span
+        window_start, window_end = window
+        return ((window_end is None or start < window_end)
+                and (window_start is None or end is None or end > window_start))
+
+    def google_sync(self):
+        """
+        Handles only Google sync, yielding pages of compact GoogleEventRecords.
+        Once the listing is exhausted its nextSyncToken is stored in self.new_g_sync_token.
+        With google_series, recurring events are listed as masters and exceptions instead
+        of one record per occurrence.
+        """
+        series = bool(self._setting("google_series", False))
+        g_sync_token = get_g_sync_token(self.state)
+        self.new_g_sync_token = None
+        if g_sync_token and self.state.get_token("google_index") != "complete":
+            # The token predates index tracking, so its incremental listings may miss events
+            # that insert dedup has to know about: list everything once.
+            logging.info("Rebuilding the Google event index with a full listing.")
+            g_sync_token = None
+        if not g_sync_token:
+            logging.debug("No Google sync token found, performing initial full sync.")
+            self.google_calendar.reset_index()
+        else:
+            logging.debug(f"Using Google sync token: {g_sync_token}")
+        next_page_token = None
+        while True:
+            try:
+                window = self._window if not g_sync_token else None
+                g_events = self.google_calendar.list_events(
+                    single_events=not series,
+                    page_token=next_page_token,
+                    sync_token=g_sync_token,
+                    fields=GoogleEventRecord.FIELDS,
+                    time_min=window[0] if window else None,
+                    time_max=window[1] if window else None
+                )
+            except Exception as e:
+                if g_sync_token and hasattr(e, 'resp') and getattr(e.resp, 'status', None) == 410:
+                    logging.warning("Google sync token expired, re-starting initial sync")
+                    metrics.inc("calsync_retries_total", reason="google_sync_token_expired")
+                    set_g_sync_token(None, self.state)
+                    # Only re-run Google sync, not the whole sync
+                    yield from self.google_sync()
+                    return
+                logging.error(f"Error during Google sync: {e}")
+                raise
+            records = [GoogleEventRecord.from_item(item) for item in g_events.get('items', [])]
+            next_page_token = g_events.get('nextPageToken')
+            page_sync_token = g_events.get('nextSyncToken')
+            # Drop the raw page before handing the records on.
+            del g_events
+            logging.debug(f"Fetched {len(records)} Google events ({'incremental' if g_sync_token else 'full'} page).")
+            yield records
+            if not next_page_token:
+                # A full listing indexes every event, and an incremental one every event
+                # created since the full listing its token continues (the ones before are
+                # mapped). Inserts then need no lookup on Google. A windowed listing leaves
+                # events outside the window out, but only events inside it are inserted.
+                self.google_calendar.ical_index_complete = True
+                self.new_g_sync_token = page_sync_token
+                if not page_sync_token:
+                    logging.error(f"No nextSyncToken returned after {'incremental' if g_sync_token else 'initial full'} sync.")
+                return
 
     def sync(self):
+        """Run one sync pass and return the counts of inserted/updated/deleted/skipped/failed events."""
+        with metrics.timer("calsync_phase_seconds", phase="total", pair=self.name):
+            self._sync()
+        for result, count in self.stats.items():
+            metrics.inc("calsync_events_total", count, pair=self.name, result=result)
+        logging.info(self.summary())
+        logging.debug("Sync process complete.")
+        return self.stats
+
+    def _sync(self):
         logging.debug("Starting sync process.")
-        # --- Google: Initial and incremental sync using syncToken ---
-        google_events, new_g_sync_token = self.google_sync()
-        logging.debug(f"Total Google events fetched: {len(google_events)}")
+        self.stats = Counter()
+        self._window = self._horizon()
+        self._check_horizon_setting()
+        self._check_google_listing_setting()
+        # Google is listed lazily, before the first mutation (see _sync_google).
+        self._google_synced = False
+        self.new_g_sync_token = None
+        self._resume_journal(self.guid_map)
 
         # --- Apple: CalDAV incremental sync using sync-token, with batching ---
-        apple_token = get_apple_sync_token()
+        apple_token = get_apple_sync_token(self.state)
         logging.debug(f"Starting Apple sync with token: {apple_token}")
-        apple_cal = self.apple_calendar
+        unseen = []
         while True:
+            # A full pull with a horizon only fetches the window, so it also tells which
+            # mapped events have left it.
+            self._seen = set() if apple_token is None and self._window is not None else None
             try:
-                added, changed, removed, new_apple_token = apple_cal.changes(sync_token=apple_token)
-                logging.debug(f"Apple batch: added={len(added)}, changed={len(changed)}, removed={len(removed)}")
+                with metrics.timer("calsync_phase_seconds", phase="apple_changes", pair=self.name):
+                    new_apple_token, changes = self._apple_changes(apple_token)
             except Exception as e:
                 logging.error("Apple sync error", exc_info=e)
                 if 'invalid-sync-token' in str(e):
                     logging.warning("Apple sync token invalid, performing full sync.")
+                    metrics.inc("calsync_retries_total", reason="apple_sync_token_invalid")
                     apple_token = None
                     continue
                 raise
 
             guid_map = self.guid_map
-            self._process_apple_batch(added, changed, removed, guid_map)
-            save_guid_map(guid_map)
+            has_changes = False
+            # Changes are planned and sent in windows of apple_window records, which bounds
+            # how many Apple events and Google bodies are held at once.
+            window = max(1, int(self._setting("apple_window", 500)))
+            changes = iter(changes)
+            while batch := list(islice(changes, window)):
+                logging.debug(f"Apple batch: {len(batch)} changes")
+                has_changes = True
+                with metrics.timer("calsync_phase_seconds", phase="apple_process", pair=self.name):
+                    self._process_apple_changes(batch, guid_map)
+            if self._seen is not None:
+                unseen = [guid for guid in guid_map if guid not in self._seen]
+                self._seen = None
+            # Commit the mappings together with the Apple token that covers them.
+            with metrics.timer("calsync_phase_seconds", phase="save_state", pair=self.name), \
+                    self.state.transaction():
+                save_guid_map(guid_map, self.state)
+                if new_apple_token and not self.stats['failed']:
+                    set_apple_sync_token(new_apple_token, self.state)
+                    logging.debug(f"Saved Apple sync token: {new_apple_token}")
 
             # If no new token or no changes, we're done
-            if not new_apple_token or (not added and not changed and not removed):
+            if not new_apple_token or not has_changes:
                 break
             apple_token = new_apple_token
 
-        # Persist sync token
-        if apple_token:
-            set_apple_sync_token(apple_token, "sync_state.toml")
-            logging.debug(f"Saved Apple sync token: {apple_token}")
+        if self._window is not None:
+            with metrics.timer("calsync_phase_seconds", phase="horizon", pair=self.name):
+                self._maintain_horizon(guid_map, unseen)
 
-        # Only set Google sync token after successful Apple mapping
-        if new_g_sync_token:
-            set_g_sync_token(new_g_sync_token, "sync_state.toml")
-            logging.debug(f"Updated Google sync token: {new_g_sync_token}")
-        logging.debug("Sync process complete.")
+        if self.stats['failed']:
+            # Keep the previous tokens so the failed changes are picked up again next run.
+            logging.warning(f"{self.stats['failed']} Google mutations failed; not advancing sync tokens.")
+        elif self.new_g_sync_token:
+            # Only set Google sync token after successful Apple mapping
+            with self.state.transaction():
+                set_g_sync_token(self.new_g_sync_token, self.state)
+                # Every token saved from here on continues a full listing (see google_sync).
+                self.state.set_token("google_index", "complete")
+            logging.debug(f"Updated Google sync token: {self.new_g_sync_token}")
+
+    def _sync_google(self):
+        """
+        Index Google events with an initial or incremental sync-token listing, at most once
+        per run. Only needed before sending mutations, so a run without Apple changes never
+        talks to Google (or loads its client libraries).
+        """
+        if self._google_synced:
+            return
+        self._google_synced = True
+        google_event_count = 0
+        with metrics.timer("calsync_phase_seconds", phase="google_sync", pair=self.name):
+            for records in self.google_sync():
+                self.google_calendar.index_events(records)
+                google_event_count += len(records)
+        logging.debug(f"Total Google events fetched: {google_event_count}")
+
+    def summary(self):
+        stats = self.stats
+        return (f"Sync summary: {stats['inserted']} inserted, {stats['updated']} updated, "
+                f"{stats['deleted']} deleted, {stats['pruned']} pruned, {stats['skipped']} unchanged skipped, "
+                f"{stats['failed']} failed, {stats['rejected']} rejected")
+
+    def _setting(self, key, default=None):
+        """Read a value from the [sync] section of the settings."""
+        section = self.config.get("sync") if self.config else None
+        if not section:
+            return default
+        return section.get(key, default)
+
+    def _horizon(self):
+        """
+        Return the sync window (start, end) from the horizon_past_days/horizon_future_days
+        settings, or None when neither is set. Bounds fall on UTC midnight so the window
+        moves once a day; an unset side is None (unbounded).
+        """
+        past = self._setting("horizon_past_days")
+        future = self._setting("horizon_future_days")
+        if past is None and future is None:
+            return None
+        today = datetime.combine(datetime.now(ZoneInfo("UTC")).date(), time(), ZoneInfo("UTC"))
+        return (today - timedelta(days=int(past)) if past is not None else None,
+                today + timedelta(days=int(future)) if future is not None else None)
 
-    def _process_apple_batch(self, added, changed, removed, guid_map):
+    def _check_horizon_setting(self):
+        """Start over with full syncs when the horizon settings changed since the last run."""
+        setting = None
+        if self._window is not None:
+            setting = f"{self._setting('horizon_past_days')}:{self._setting('horizon_future_days')}"
+        if self.state.get_token("horizon") == setting:
+            return
+        logging.info("Sync horizon changed, performing full sync.")
+        with self.state.transaction():
+            set_g_sync_token(None, self.state)
+            set_apple_sync_token(None, self.state)
+            self.state.set_token("horizon_end", None)
+            self.state.set_token("horizon", setting)
+
+    def _check_google_listing_setting(self):
+        """
+        Drop the Google sync token when google_series changed since the last run: a token
+        only continues a listing made with the same singleEvents mode.
+        """
+        setting = "series" if self._setting("google_series", False) else None
+        if self.state.get_token("google_listing") == setting:
+            return
+        logging.info("Google listing mode changed, performing a full Google listing.")
+        with self.state.transaction():
+            set_g_sync_token(None, self.state)
+            self.state.set_token("google_listing", setting)
+
+    def _maintain_horizon(self, guid_map, unseen):
+        """
+        Move the window forward: mirror events that entered it since the last run and prune
+        mappings whose events ended before it (or were missing from a full pull).
+        """
+        window_start, window_end = self._window
+        stored_end = self.state.get_token("horizon_end")
+        if window_end is not None and stored_end and datetime.fromisoformat(stored_end) < window_end:
+            # Unchanged events never show up in the sync report, so query the newly covered days.
+            entering = self.apple_calendar.events_in_range(datetime.fromisoformat(stored_end), window_end,
+                                                           **self._apple_chunking())
+            self._process_apple_changes(entering, guid_map)
+        expired = set(unseen)
+        if window_start is not None:
+            expired.update(guid for guid, end in guid_map.ends.items()
+                           if end and datetime.fromisoformat(end) <= window_start)
+        expired.intersection_update(guid_map)
+        if expired:
+            logging.info(f"Pruning {len(expired)} Google events outside the sync horizon")
+            self._dispatch([self._prune_entry(guid, guid_map) for guid in sorted(expired)], guid_map)
+        with self.state.transaction():
+            save_guid_map(guid_map, self.state)
+            if not self.stats['failed']:
+                self.state.set_token("horizon_end", window_end.isoformat() if window_end else None)
+
+    def _apple_changes(self, apple_token):
+        """Return (new_token, changes), an iterator of AppleChanges, using the configured fetch mode."""
+        if apple_token is None and self._window is not None:
+            return self.apple_calendar.changes_in_range(*self._window, **self._apple_chunking())
+        if self._setting("apple_fetch", "sync") == "multiget":
+            return self.apple_calendar.changes_in_chunks(sync_token=apple_token, **self._apple_chunking())
+        return self.apple_calendar.changes(sync_token=apple_token)
+
+    def _apple_chunking(self):
+        return {"chunk_size": int(self._setting("apple_chunk_size", 100)),
+                "max_workers": int(self._setting("apple_fetch_workers", 4))}
+
+    def _handle_google_result(self, op, guid, response, error):
+        """Apply the outcome of one Google mutation to the guid_map. Called from worker threads."""
+        with self._result_lock:
+            in_flight = self._in_flight.get(guid)
+            entry = in_flight.popleft() if in_flight else {}
+            if in_flight is not None and not in_flight:
+                del self._in_flight[guid]
+            if "seq" in entry:
+                self._completed.append(entry["seq"])
+            status = getattr(getattr(error, 'resp', None), 'status', None)
+            if error is not None and op == 'update' and status in (404, 410) and entry.get("body"):
+                # Deleted on Google behind our back: create it again (see _restore_vanished).
+                logging.info(f"Google event {entry['event_id']} for Apple GUID {guid} is gone, re-creating it")
+                self.guid_map.pop(guid, None)
+                self.google_calendar.unindex_event(entry["event_id"])
+                restore = {key: value for key, value in entry.items() if key not in ("seq", "event_id")}
+                self._vanished.append(dict(restore, op='insert', restore=True))
+                return
+            if error is not None and not (op == 'delete' and status in (404, 410)):
+                if is_permanent(error):
+                    # Retrying cannot help, so do not hold the sync tokens for it: the event
+                    # is sent again once it changes on Apple.
+                    logging.error(f"Google rejected the {op} for Apple GUID {guid}, skipping it: {error}")
+                    self.stats['rejected'] += 1
+                else:
+                    self.stats['failed'] += 1
+                return
+            if op == 'insert':
+                self.guid_map[guid] = response['id']
+                self.stats['inserted'] += 1
+                logging.debug(f"Inserted Google event {response['id']} for new GUID {guid}")
+            elif op == 'update':
+                self.stats['updated'] += 1
+            elif op == 'delete':
+                # An event already gone from Google counts as deleted.
+                self.guid_map.pop(guid, None)
+                self.stats['pruned' if entry.get("prune") else 'deleted'] += 1
+            if guid in self.guid_map:
+                if entry.get("hash") is not None:
+                    self.guid_map.set_hash(guid, entry["hash"])
+                if entry.get("end") is not None:
+                    self.guid_map.set_end(guid, entry["end"])
+                if entry.get("href"):
+                    self.guid_map.set_href(guid, entry["href"])
+            if op != 'delete' and response and response.get('etag') and guid in self.guid_map:
+                # Lets `verify` spot events edited on Google by comparing etags.
+                self.guid_map.set_etag(guid, response['etag'])
+
+    def _process_apple_changes(self, changes, guid_map):
+        self._dispatch(self._plan_apple_changes(changes, guid_map), guid_map)
+
+    def _run_mutations(self, plan):
+        """Call plan(mutations) with the configured batch or concurrent sender, or None to send serially."""
+        self._sync_google()
+        max_workers = int(self._setting("max_workers", 1))
+        batch_size = int(self._setting("batch_size", 50))
+        if max_workers > 1:
+            mutations = self.google_calendar.concurrent(self._handle_google_result, max_workers)
+        elif batch_size > 1:
+            mutations = self.google_calendar.batch(self._handle_google_result, batch_size)
+        else:
+            plan(None)
+            return
+        with mutations:
+            plan(mutations)
+
+    def _dispatch(self, entries, guid_map):
+        """
+        Send planned Google mutations (see _plan_apple_changes) write-ahead: they are journaled
+        before the first one is sent, and every checkpoint_every mutations the GUID map is
+        saved together with the removal of the journal entries that completed. A sync that
+        is interrupted resumes the rest from the journal (see _resume_journal).
+        """
+        if not entries:
+            return
+        self.state.journal_append(entries)
+        every = max(1, int(self._setting("checkpoint_every", 250)))
+
+        def send_all(mutations):
+            for count, entry in enumerate(entries, 1):
+                self._send(entry, mutations)
+                if count % every == 0:
+                    self._checkpoint(guid_map)
+
+        self._run_mutations(send_all)
+        self._checkpoint(guid_map)
+        self._restore_vanished(guid_map)
+
+    def _restore_vanished(self, guid_map):
+        """Create the events whose update found them deleted on Google, one at a time."""
+        with self._result_lock:
+            vanished, self._vanished = self._vanished, []
+        if not vanished:
+            return
+        self.state.journal_append(vanished)
+        for entry in vanished:
+            self._send(entry, None)
+        self._checkpoint(guid_map)
+
+    def _send(self, entry, mutations):
+        """Queue one journaled mutation, or send it right away if mutations is None."""
+        op, guid = entry["op"], entry["guid"]
+        with self._result_lock:
+            self._in_flight.setdefault(guid, deque()).append(entry)
+        if mutations is not None:
+            if op == 'insert':
+                mutations.insert(entry["body"], guid)
+            elif op == 'update':
+                mutations.update(entry["event_id"], entry["body"], guid)
+            else:
+                mutations.delete(entry["event_id"], guid)
+            return
         google_calendar = self.google_calendar
-        for apple_event in added + changed:
-            v = apple_event.vobject_instance
-            comp = getattr(v, 'vevent', None)
-            if comp and hasattr(comp, 'uid'):
-                guid = comp.uid.value
+        try:
+            if op == 'insert' and entry.get("restore"):
+                response = google_calendar.restore_event(entry["body"])
+            elif op == 'insert':
+                response = google_calendar.insert_event(entry["body"], guid)
+            elif op == 'update':
+                response = google_calendar.update_event(entry["event_id"], entry["body"])
             else:
+                google_calendar.delete_event(entry["event_id"])
+                response = None
+        except Exception as e:
+            logging.error(f"Google {op} failed for Apple GUID {guid}: {e}")
+            self._handle_google_result(op, guid, None, e)
+        else:
+            self._handle_google_result(op, guid, response, None)
+
+    def _checkpoint(self, guid_map):
+        """Save the GUID map and drop the journal entries of the mutations applied to it."""
+        # Worker threads update the map under the result lock, so hold it while saving.
+        with self._result_lock, self.state.transaction():
+            completed, self._completed = self._completed, []
+            save_guid_map(guid_map, self.state)
+            self.state.journal_remove(completed)
+
+    def _resume_journal(self, guid_map):
+        """
+        Finish the mutations an interrupted sync journaled but did not confirm. Each is
+        sent again on its own: inserts look up the iCalUID on Google first (or use the
+        idempotent events.import), so one that did reach Google becomes an update instead
+        of a duplicate, and deletes of events already gone count as done.
+        """
+        entries = self.state.journal_pending()
+        if not entries:
+            return
+        logging.info(f"Resuming {len(entries)} Google mutations from an interrupted sync")
+        self._sync_google()
+        for entry in entries:
+            if entry["op"] == 'insert' and entry["guid"] in guid_map:
+                entry = dict(entry, op='update', event_id=guid_map[entry["guid"]])
+            elif entry["op"] == 'update' and entry["guid"] not in guid_map:
+                entry = dict(entry, op='insert')
+            self._send(entry, None)
+        self._checkpoint(guid_map)
+        self._restore_vanished(guid_map)
+
+    def _prune_entry(self, guid, guid_map):
+        """Plan the deletion of the Google copy of an event that is outside the sync horizon."""
+        logging.debug(f"Pruning Google event {guid_map[guid]} for GUID {guid} outside the sync horizon")
+        return {"op": "delete", "guid": guid, "event_id": guid_map[guid], "prune": True}
+
+    def _plan_apple_changes(self, changes, guid_map):
+        """Return the Google mutations needed for a window of AppleChanges, as journal entries."""
+        entries = []
+        guids_by_href = None
+        for change in changes:
+            if change.status == "removed":
+                guid = change.uid
+                if guid is None:
+                    if guids_by_href is None:
+                        guids_by_href = {href: guid for guid, href in guid_map.hrefs.items()}
+                    guid = guids_by_href.get(change.href)
+                if guid in guid_map:
+                    logging.debug(f"Deleting Google event {guid_map[guid]} for removed GUID {guid}")
+                    entries.append({"op": "delete", "guid": guid, "event_id": guid_map[guid]})
+                continue
+            try:
+                g_event_body = self.transform_event(change)
+            except NotAnEvent:
                 logging.info("Skipping non-VEVENT")
                 continue
+            guid = g_event_body["iCalUID"]
+            if not guid:
+                logging.info("Skipping VEVENT without UID")
+                continue
             logging.debug(f"Processing Apple GUID: {guid}")
-            g_event_body = self.transform_event(apple_event)
+            event_end = None
+            if self._window is not None:
+                span = self.event_span(g_event_body)
+                if not self.in_window(span, self._window):
+                    if guid in guid_map:
+                        entries.append(self._prune_entry(guid, guid_map))
+                    else:
+                        logging.debug(f"Skipping GUID {guid} outside the sync horizon")
+                    continue
+                event_end = span[1].isoformat() if span[1] else ""
+                if self._seen is not None:
+                    self._seen.add(guid)
+            body_hash = self.event_digest(g_event_body)
+            if guid in guid_map and guid_map.hashes.get(guid) == body_hash:
+                logging.debug(f"Skipping unchanged Google event {guid_map[guid]} for GUID {guid}")
+                if event_end is not None and guid_map.ends.get(guid) != event_end:
+                    guid_map.set_end(guid, event_end)
+                if change.href and guid_map.hrefs.get(guid) != change.href:
+                    guid_map.set_href(guid, change.href)
+                self.stats['skipped'] += 1
+                continue
+            entry = {"guid": guid, "body": g_event_body, "hash": body_hash, "end": event_end, "href": change.href}
             if guid in guid_map:
                 logging.debug(f"Updating Google event {guid_map[guid]} for GUID {guid}")
-                google_calendar.update_event(guid_map[guid], g_event_body)
+                entry.update(op="update", event_id=guid_map[guid])
             else:
-                created = google_calendar.insert_event(g_event_body, guid)
-                guid_map[guid] = created['id']
-                logging.debug(f"Inserted Google event {created['id']} for new GUID {guid}")
-
-        for apple_event in removed:
-            v = apple_event.vobject_instance
-            comp = getattr(v, 'vevent', None)
-            guid = getattr(comp, 'uid', None)
-            if guid:
-                guid = guid.value
-                if guid in guid_map:
-                    logging.debug(f"Deleting Google event {guid_map[guid]} for removed GUID {guid}")
-                    google_calendar.delete_event(guid_map[guid])
+                entry["op"] = "insert"
+            entries.append(entry)
+        return entries
@@ -0,0 +1,63 @@
+"""Fixtures that run CalendarSync against the fake CalDAV and Google servers of benchmarks/."""
+import pytest
+from google.oauth2.credentials import Credentials
+
+import google_calendar
+from apple_calendar import AppleCalendar
+from benchmarks.bench_sync import CALENDAR_ID
+from benchmarks.fake_caldav import FakeCalDAVServer
+from benchmarks.fake_google import FakeGoogleCalendarServer
+from ratelimit import google_scheduler
+from state_store import open_state_store
+from sync import CalendarSync
+
+
+@pytest.fixture(autouse=True)
+def fast_scheduler():
+    """No pacing and near-instant retries, restored afterwards."""
+    base_delay = google_scheduler.base_delay
+    google_scheduler.configure(rate=0, max_retries=3)
+    google_scheduler.base_delay = 0.001
+    yield
+    google_scheduler.base_delay = base_delay
+    google_scheduler.configure(rate=10, burst=60, max_retries=5)
+
+
+@pytest.fixture
+def caldav():
+    server = FakeCalDAVServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def google_server():
+    """The fake Google server; tests may replace it with a subclass before calling make_sync."""
+    server = FakeGoogleCalendarServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def make_sync(caldav, google_server, tmp_path, monkeypatch):
+    """
+    Return make_sync(settings=None, backend="sqlite", server=None): a CalendarSync on a state
+    store in tmp_path. Calling it again reopens the same state, like a new process would.
+    """
+    load_document = google_calendar._discovery_document
+    opened = []
+
+    def make(settings=None, backend="sqlite", server=None):
+        server = server or google_server
+        monkeypatch.setattr(google_calendar, "_discovery_document", lambda: dict(load_document(), rootUrl=server.url))
+        state = open_state_store(backend, str(tmp_path / "calsync.db"), str(tmp_path / "event_map.toml"),
+                                 str(tmp_path / "sync_state.toml"))
+        opened.append(state)
+        apple = AppleCalendar("test@example.com", "test", caldav.url, state=state)
+        google = google_calendar.GoogleCalendar(None, CALENDAR_ID, creds=Credentials(token="test"))
+        return CalendarSync(apple, google, settings if settings is not None else {"sync": {}}, state=state)
+
+    yield make
+    for state in opened:
+        state.close()
+
@@ -0,0 +1,38 @@
+"""AppleCalendar against the fake CalDAV server."""
+from collections import Counter
+
+import pytest
+
+
+@pytest.fixture
+def apple_calendar(caldav, make_sync, monkeypatch):
+    """An AppleCalendar opened from the calendar URL cached by an earlier run; rediscovery fails the test."""
+    make_sync()
+    apple_calendar = make_sync().apple_calendar
+    assert apple_calendar.from_cache
+
+    def rediscover(rediscover=False):
+        raise AssertionError("calendar rediscovered")
+
+    monkeypatch.setattr(apple_calendar, "_discover", rediscover)
+    return apple_calendar
+
+
+def test_event_by_uid(caldav, apple_calendar):
+    caldav.populate(3)
+    assert "UID:bench-1" in apple_calendar.event_by_uid("bench-1").data
+    assert apple_calendar.event_by_uid("unknown") is None
+
+
+def test_events_in_range_fetches_objects_in_chunks(caldav, apple_calendar):
+    caldav.populate(250)
+    before = caldav.snapshot()[0]
+    changes = apple_calendar.events_in_range(None, None, chunk_size=100)
+    first = next(changes)
+    calls = caldav.snapshot()[0] - before
+    assert calls == Counter({"REPORT calendar-query": 1, "REPORT calendar-multiget": 1})
+
+    uids = [first.uid] + [change.uid for change in changes]
+    assert sorted(uids) == sorted(f"bench-{idx}" for idx in range(250))
+    assert caldav.snapshot()[0] - before == Counter({"REPORT calendar-query": 1, "REPORT calendar-multiget": 3})
+    assert first.etag
@@ -0,0 +1,75 @@
+"""Google insert paths must neither create duplicate events nor delete events that are not duplicates."""
+from collections import Counter
+
+import pytest
+
+from benchmarks.fake_google import FakeGoogleCalendarServer, _error
+
+
+class LostBatchResponse(FakeGoogleCalendarServer):
+    """Applies the first batch request, then answers it with 503 as if the response was lost."""
+    failures = 1
+
+    def _batch(self, content_type, body):
+        result = super()._batch(content_type, body)
+        if self.failures:
+            self.failures -= 1
+            return _error(503, "backendError", "Backend Error")
+        return result
+
+
+class LostInsertResponse(FakeGoogleCalendarServer):
+    """Applies every insert, but answers every other one with 503."""
+    inserts = 0
+
+    def _create(self, body, upsert=False):
+        result = super()._create(body, upsert)
+        if not upsert:
+            self.inserts += 1
+            if self.inserts % 2 == 0:
+                return _error(503, "backendError", "Backend Error")
+        return result
+
+
+@pytest.fixture
+def server(request):
+    server = request.param().start()
+    yield server
+    server.stop()
+
+
+@pytest.mark.parametrize("server", [LostBatchResponse, LostInsertResponse], indirect=True)
+def test_batch_inserts_are_retried_without_duplicates(server, make_sync):
+    google_calendar = make_sync(server=server).google_calendar
+    google_calendar.ical_index_complete = True
+    results = []
+    with google_calendar.batch(lambda op, guid, response, error: results.append((guid, error)), 10) as batch:
+        for idx in range(6):
+            batch.insert({"summary": f"event {idx}", "iCalUID": f"uid-{idx}"}, f"uid-{idx}")
+
+    assert sorted(guid for guid, error in results if error is None) == [f"uid-{idx}" for idx in range(6)]
+    uids = Counter(event["iCalUID"] for event in server.events.values() if event["status"] != "cancelled")
+    assert uids == Counter(f"uid-{idx}" for idx in range(6))
+
+
+@pytest.mark.parametrize("server", [LostInsertResponse], indirect=True)
+def test_serial_insert_is_retried_as_import(server, make_sync):
+    google_calendar = make_sync(server=server).google_calendar
+    google_calendar.ical_index_complete = True
+    for idx in range(4):
+        google_calendar.insert_event({"summary": f"event {idx}", "iCalUID": f"uid-{idx}"}, f"uid-{idx}")
+    assert len([event for event in server.events.values() if event["status"] != "cancelled"]) == 4
+
+
+def test_duplicate_lookup_keeps_edited_occurrences(google_server, make_sync):
+    google_calendar = make_sync().google_calendar
+    with google_server._lock:
+        google_server._store({"id": "series_20250101T090000Z", "iCalUID": "uid-1", "status": "confirmed",
+                              "recurringEventId": "series", "summary": "moved occurrence"})
+        google_server._store({"id": "series", "iCalUID": "uid-1", "status": "confirmed",
+                              "recurrence": ["RRULE:FREQ=DAILY;COUNT=3"], "summary": "series"})
+        google_server._store({"id": "copy", "iCalUID": "uid-1", "status": "confirmed", "summary": "copy"})
+
+    assert google_calendar.existing_event_id("uid-1") == "series"
+    assert google_server.events["series_20250101T090000Z"]["status"] == "confirmed"
+    assert google_server.events["copy"]["status"] == "cancelled"
@@ -0,0 +1,21 @@
+"""GoogleCalendar credential handling."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+from google_calendar import GoogleCalendar
+
+
+@pytest.mark.parametrize("expires_in, refreshed", [(3600, False), (60, True), (-60, True)])
+def test_credentials_are_refreshed_within_the_margin(tmp_path, monkeypatch, expires_in, refreshed):
+    # google-auth keeps the expiry as naive UTC.
+    expiry = (datetime.now(timezone.utc) + timedelta(seconds=expires_in)).replace(tzinfo=None)
+    creds = Credentials(token="test", refresh_token="refresh", expiry=expiry)
+    refreshes = []
+    monkeypatch.setattr(Credentials, "refresh", lambda self, request: refreshes.append(request))
+    google_calendar = GoogleCalendar(None, "primary", token_path=str(tmp_path / "token.json"), creds=creds)
+
+    google_calendar.refresh_credentials(margin=300)
+    assert bool(refreshes) is refreshed
+    assert (tmp_path / "token.json").exists() is refreshed
@@ -0,0 +1,136 @@
+"""Sync horizon: which events are mirrored, and which Google copies are pruned as the window moves."""
+from collections import Counter
+from datetime import datetime, timezone
+
+import pytest
+
+import sync
+from benchmarks.fake_caldav import VTIMEZONE
+from sync import CalendarSync
+
+UTC = timezone.utc
+WINDOW = (datetime(2025, 6, 5, tzinfo=UTC), datetime(2025, 7, 15, tzinfo=UTC))
+
+
+def berlin(uid, start, end, rrule=None):
+    """ICS for an event with Europe/Berlin (UTC+2 in summer) start and end, or dates if given as YYYYMMDD."""
+    def line(name, value):
+        return f"{name};VALUE=DATE:{value}" if len(value) == 8 else f"{name};TZID=Europe/Berlin:{value}"
+
+    lines = ["BEGIN:VEVENT", f"UID:{uid}", "DTSTAMP:20250101T000000Z", f"SUMMARY:{uid}",
+             line("DTSTART", start), line("DTEND", end)] + ([f"RRULE:{rrule}"] if rrule else []) + ["END:VEVENT"]
+    return ("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//calsync//test//EN\r\n" + VTIMEZONE
+            + "\r\n".join(lines) + "\r\nEND:VCALENDAR\r\n")
+
+
+# With the clock at 2025-06-15 12:00 UTC, horizon_past_days=10 and horizon_future_days=30
+# give the window [2025-06-05, 2025-07-15) UTC.
+EVENTS = {
+    "ends-at-start": berlin("ends-at-start", "20250605T010000", "20250605T020000"),
+    "ends-after-start": berlin("ends-after-start", "20250605T010000", "20250605T020100"),
+    "starts-at-end": berlin("starts-at-end", "20250715T020000", "20250715T030000"),
+    "starts-before-end": berlin("starts-before-end", "20250715T015900", "20250715T030000"),
+    "all-day-before": berlin("all-day-before", "20250604", "20250605"),
+    "all-day-first": berlin("all-day-first", "20250605", "20250606"),
+    "series-ended": berlin("series-ended", "20250501T110000", "20250501T120000", "FREQ=WEEKLY;COUNT=2"),
+    "series-running": berlin("series-running", "20250501T110000", "20250501T120000", "FREQ=WEEKLY;COUNT=10"),
+    "series-endless": berlin("series-endless", "20240101T110000", "20240101T120000", "FREQ=WEEKLY"),
+}
+IN_WINDOW = {"ends-after-start", "starts-before-end", "all-day-first", "series-running", "series-endless"}
+
+
+class _ClockType(type):
+    def __instancecheck__(cls, value):
+        return isinstance(value, datetime)
+
+
+class Clock(datetime, metaclass=_ClockType):
+    """datetime whose now() is set by the test; stands in for sync.datetime, isinstance checks included."""
+    current = datetime(2025, 6, 15, 12, tzinfo=UTC)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current.astimezone(tz)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(sync, "datetime", Clock)
+    monkeypatch.setattr(Clock, "current", datetime(2025, 6, 15, 12, tzinfo=UTC))
+    return Clock
+
+
+@pytest.fixture
+def calendar(caldav):
+    for uid, ics in EVENTS.items():
+        caldav.put(uid, ics=ics)
+    return caldav
+
+
+def live_uids(server):
+    return Counter(event["iCalUID"] for event in server.events.values() if event["status"] != "cancelled")
+
+
+def horizon(past=10, future=30, **extra):
+    return {"sync": dict({"horizon_past_days": past, "horizon_future_days": future}, **extra)}
+
+
+@pytest.mark.parametrize("span, expected", [
+    ((datetime(2025, 6, 4, tzinfo=UTC), WINDOW[0]), False),
+    ((datetime(2025, 6, 4, tzinfo=UTC), datetime(2025, 6, 5, 0, 1, tzinfo=UTC)), True),
+    ((WINDOW[1], datetime(2025, 7, 16, tzinfo=UTC)), False),
+    ((datetime(2025, 7, 14, 23, 59, tzinfo=UTC), WINDOW[1]), True),
+    ((datetime(2020, 1, 1, tzinfo=UTC), None), True),
+])
+def test_in_window_boundaries(span, expected):
+    assert CalendarSync.in_window(span, WINDOW) is expected
+    assert CalendarSync.in_window(span, (None, None))
+
+
+def test_event_span_of_all_day_and_recurring_events():
+    all_day = {"start": {"date": "2025-06-05"}, "end": {"date": "2025-06-06"}}
+    assert CalendarSync.event_span(all_day) == (datetime(2025, 6, 5, tzinfo=UTC), datetime(2025, 6, 6, tzinfo=UTC))
+    weekly = {"start": {"dateTime": "2025-03-24T09:00:00+01:00", "timeZone": "Europe/Berlin"},
+              "end": {"dateTime": "2025-03-24T10:00:00+01:00", "timeZone": "Europe/Berlin"},
+              "recurrence": ["RRULE:FREQ=WEEKLY;COUNT=2"]}
+    # The second occurrence is after the DST change, so it starts an hour earlier in UTC.
+    assert CalendarSync.event_span(weekly) == (datetime(2025, 3, 24, 8, tzinfo=UTC), datetime(2025, 3, 31, 8, tzinfo=UTC))
+    assert CalendarSync.event_span(dict(weekly, recurrence=["RRULE:FREQ=WEEKLY"]))[1] is None
+    assert CalendarSync.event_span(dict(weekly, recurrence=["RRULE:FREQ=SOMETIMES"]))[1] is None
+
+
+def test_only_events_in_the_window_are_mirrored(calendar, google_server, make_sync, clock):
+    calendar_sync = make_sync(horizon())
+    stats = calendar_sync.sync()
+    assert stats["inserted"] == len(IN_WINDOW)
+    assert set(live_uids(google_server)) == IN_WINDOW
+    assert calendar_sync.sync() == Counter()
+
+
+def test_moving_window_prunes_ended_and_mirrors_entering_events(calendar, google_server, make_sync, clock):
+    calendar_sync = make_sync(horizon())
+    calendar_sync.sync()
+    clock.current = datetime(2025, 6, 25, 12, tzinfo=UTC)
+
+    stats = calendar_sync.sync()
+    # [2025-06-15, 2025-07-25): the 5 June events ended, the 15 July one entered.
+    assert stats["pruned"] == 2 and stats["inserted"] == 1
+    assert set(live_uids(google_server)) == {"starts-before-end", "starts-at-end", "series-running", "series-endless"}
+    assert set(calendar_sync.guid_map) == set(live_uids(google_server))
+    assert calendar_sync.sync() == Counter()
+
+
+def test_changing_the_horizon_setting_resyncs(calendar, google_server, make_sync, clock):
+    make_sync(horizon()).sync()
+
+    stats = make_sync(horizon(future=5)).sync()
+    assert stats["pruned"] == 1
+    assert "starts-before-end" not in live_uids(google_server)
+
+    # Without a horizon everything is mirrored; pruned events come back despite their
+    # deleted Google copies keeping the iCalUID.
+    calendar_sync = make_sync({"sync": {}})
+    stats = calendar_sync.sync()
+    assert stats["rejected"] == 0 and stats["failed"] == 0
+    assert live_uids(google_server) == Counter(list(EVENTS))
+    assert calendar_sync.sync() == Counter()
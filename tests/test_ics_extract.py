@@ -0,0 +1,67 @@
+"""
+Differential tests: extract_vevent must read every fixture exactly like the vobject
+path (vevent_fields), or refuse it with UnsupportedICS so the sync falls back to vobject.
+"""
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+import vobject
+
+from ics_extract import NotAnEvent, UnsupportedICS, extract_vevent, vevent_fields
+from sync import CalendarSync
+
+FIXTURES = sorted((Path(__file__).parent / "fixtures" / "ics").glob("*.ics"))
+# Fixtures the fast path must hand to vobject rather than guess at.
+UNSUPPORTED = {"unescaped_comma.ics"}
+NOT_EVENTS = {"todo.ics"}
+
+
+def read(path):
+    with open(path, newline="") as f:
+        return f.read()
+
+
+def test_corpus_covers_the_tricky_cases():
+    names = {path.name for path in FIXTURES}
+    assert {"all_day.ics", "tzid.ics", "folded.ics", "escaped.ics", "valarm.ics",
+            "rrule_exdate.ics", "recurrence_id.ics"} <= names
+
+
+@pytest.mark.parametrize("path", FIXTURES, ids=lambda path: path.name)
+def test_extract_vevent_matches_vobject(path):
+    text = read(path)
+    if path.name in NOT_EVENTS:
+        with pytest.raises(NotAnEvent):
+            extract_vevent(text)
+        with pytest.raises(NotAnEvent):
+            vevent_fields(vobject.readOne(text))
+        return
+    expected = vevent_fields(vobject.readOne(text))
+    if path.name in UNSUPPORTED:
+        with pytest.raises(UnsupportedICS):
+            extract_vevent(text)
+        return
+
+    actual = extract_vevent(text)
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        assert actual[key] == value, key
+        if isinstance(value, datetime):
+            # Equal instants are not enough: the wall time and offset must match too.
+            assert actual[key].utcoffset() == value.utcoffset(), key
+            assert actual[key].replace(tzinfo=None) == value.replace(tzinfo=None), key
+    assert CalendarSync.event_from_fields(actual) == CalendarSync.event_from_fields(expected)
+
+
+def test_valarm_properties_do_not_leak_into_the_event():
+    fields = extract_vevent(read(Path(__file__).parent / "fixtures" / "ics" / "valarm.ics"))
+    assert fields["summary"] == "Dentist"
+    assert fields["description"] == "Bring the card"
+    assert fields["uid"] == "valarm-1@example.com"
+
+
+def test_first_vevent_wins_over_recurrence_id_override():
+    fields = extract_vevent(read(Path(__file__).parent / "fixtures" / "ics" / "recurrence_id.ics"))
+    assert fields["summary"] == "Team lunch"
+    assert fields["rrule"] == "FREQ=WEEKLY;COUNT=10"
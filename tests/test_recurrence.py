@@ -0,0 +1,124 @@
+"""RecurrenceIndex.occurrences against hand-computed expansions of Google series."""
+from datetime import datetime, timezone
+
+from google_calendar import GoogleCalendar, GoogleEventRecord
+from recurrence import Occurrence, RecurrenceIndex
+
+UTC = timezone.utc
+MARCH = (datetime(2024, 3, 1, tzinfo=UTC), datetime(2024, 4, 1, tzinfo=UTC))
+
+
+def record(**item):
+    return GoogleEventRecord.from_item(item)
+
+
+def new_york(value):
+    return {"dateTime": value, "timeZone": "America/New_York"}
+
+
+def weekly_index():
+    """Weekly 9:00-10:00 New York meeting across the 2024-03-10 DST change."""
+    index = RecurrenceIndex()
+    index.add(record(id="s1", start=new_york("2024-03-04T09:00:00-05:00"), end=new_york("2024-03-04T10:00:00-05:00"),
+                     recurrence=["RRULE:FREQ=WEEKLY;COUNT=4"]))
+    return index
+
+
+def exception(original, **item):
+    return record(id=f"s1_{original:%Y%m%dT%H%M%SZ}", recurringEventId="s1",
+                  originalStartTime={"dateTime": original.isoformat()}, **item)
+
+
+def test_occurrences_keep_local_time_across_dst():
+    starts = [occurrence.start for occurrence in weekly_index().occurrences("s1", *MARCH)]
+    assert starts == [datetime(2024, 3, 4, 14, tzinfo=UTC), datetime(2024, 3, 11, 13, tzinfo=UTC),
+                      datetime(2024, 3, 18, 13, tzinfo=UTC), datetime(2024, 3, 25, 13, tzinfo=UTC)]
+
+
+def test_occurrence_ids_and_ends():
+    first = weekly_index().occurrences("s1", *MARCH)[0]
+    start = datetime(2024, 3, 4, 14, tzinfo=UTC)
+    assert first == Occurrence("s1_20240304T140000Z", start, datetime(2024, 3, 4, 15, tzinfo=UTC), start)
+
+
+def test_window_includes_occurrences_that_overlap_its_start():
+    occurrences = weekly_index().occurrences("s1", datetime(2024, 3, 4, 14, 30, tzinfo=UTC), MARCH[1])
+    assert occurrences[0].event_id == "s1_20240304T140000Z"
+    assert len(occurrences) == 4
+
+
+def test_cancelled_occurrence_is_dropped():
+    index = weekly_index()
+    index.add(exception(datetime(2024, 3, 11, 13, tzinfo=UTC), status="cancelled"))
+    ids = [occurrence.event_id for occurrence in index.occurrences("s1", *MARCH)]
+    assert ids == ["s1_20240304T140000Z", "s1_20240318T130000Z", "s1_20240325T130000Z"]
+
+
+def test_moved_occurrence_keeps_its_original_start():
+    index = weekly_index()
+    original = datetime(2024, 3, 18, 13, tzinfo=UTC)
+    index.add(exception(original, status="confirmed", start=new_york("2024-03-19T15:00:00-04:00"),
+                        end=new_york("2024-03-19T16:00:00-04:00")))
+    occurrences = index.occurrences("s1", *MARCH)
+    assert len(occurrences) == 4
+    assert occurrences[2] == Occurrence("s1_20240318T130000Z", datetime(2024, 3, 19, 19, tzinfo=UTC),
+                                        datetime(2024, 3, 19, 20, tzinfo=UTC), original)
+
+
+def test_occurrence_moved_out_of_the_window_is_dropped():
+    index = weekly_index()
+    index.add(exception(datetime(2024, 3, 25, 13, tzinfo=UTC), status="confirmed",
+                        start=new_york("2024-04-05T09:00:00-04:00"), end=new_york("2024-04-05T10:00:00-04:00")))
+    assert len(index.occurrences("s1", *MARCH)) == 3
+
+
+def test_all_day_occurrences_use_date_ids():
+    index = RecurrenceIndex()
+    index.add(record(id="s2", start={"date": "2024-01-01"}, end={"date": "2024-01-02"},
+                     recurrence=["RRULE:FREQ=DAILY;COUNT=3"]))
+    occurrences = index.occurrences("s2", datetime(2024, 1, 1, tzinfo=UTC), datetime(2024, 2, 1, tzinfo=UTC))
+    assert [occurrence.event_id for occurrence in occurrences] == ["s2_20240101", "s2_20240102", "s2_20240103"]
+
+
+def test_new_exception_invalidates_cached_window():
+    index = weekly_index()
+    cached = index.occurrences("s1", *MARCH)
+    cached.clear()
+    assert len(index.occurrences("s1", *MARCH)) == 4
+    index.add(exception(datetime(2024, 3, 4, 14, tzinfo=UTC), status="cancelled"))
+    assert len(index.occurrences("s1", *MARCH)) == 3
+
+
+def test_unknown_cancelled_or_unparsable_series_returns_none():
+    index = weekly_index()
+    assert index.occurrences("nope", *MARCH) is None
+    index.add(record(id="bad", start={"date": "2024-03-01"}, end={"date": "2024-03-02"},
+                     recurrence=["RRULE:FREQ=SOMETIMES"]))
+    assert index.occurrences("bad", *MARCH) is None
+    index.add(record(id="s1", status="cancelled"))
+    assert index.occurrences("s1", *MARCH) is None
+
+
+def test_instances_builds_the_index_on_first_use_and_after_series_changes(monkeypatch):
+    calendar = GoogleCalendar(None, "cal", creds=object())
+    master = {"id": "s1", "start": new_york("2024-03-04T09:00:00-05:00"),
+              "end": new_york("2024-03-04T10:00:00-05:00"), "recurrence": ["RRULE:FREQ=WEEKLY;COUNT=4"]}
+    listings = []
+
+    def list_events(**kwargs):
+        listings.append(kwargs)
+        return {"items": [master]}
+
+    monkeypatch.setattr(calendar, "list_events", list_events)
+    calendar.index_events([record(id="s1", iCalUID="u1", recurrence=master["recurrence"])])
+    assert listings == []
+    assert len(calendar.instances("s1", *MARCH)) == 4
+    assert len(calendar.instances("s1", *MARCH)) == 4
+    assert len(listings) == 1 and listings[0]["single_events"] is False
+
+    calendar.index_events([record(id="other", iCalUID="u2")])
+    calendar.instances("s1", *MARCH)
+    assert len(listings) == 1
+    calendar.index_events([record(id="s1_20240304T140000Z", iCalUID="u1", recurringEventId="s1")])
+    calendar.instances("s1", *MARCH)
+    assert len(listings) == 2
@@ -0,0 +1,148 @@
+"""SQLite state store: migration from the TOML files, schema upgrades and rollback."""
+import sqlite3
+
+import pytest
+import toml
+
+from state_store import GuidMap, SqliteStateStore, TomlStateStore
+
+# The statements that took a database from version N-1 to N.
+SCHEMA = {
+    1: ["CREATE TABLE guid_map (guid TEXT PRIMARY KEY, event_id TEXT NOT NULL)",
+        "CREATE TABLE sync_state (key TEXT PRIMARY KEY, value TEXT)"],
+    2: ["ALTER TABLE guid_map ADD COLUMN body_hash TEXT"],
+    3: ["ALTER TABLE guid_map ADD COLUMN google_etag TEXT"],
+    4: ["ALTER TABLE guid_map ADD COLUMN event_end TEXT"],
+    5: ["CREATE TABLE journal (seq INTEGER PRIMARY KEY, entry TEXT NOT NULL)"],
+    6: ["ALTER TABLE guid_map ADD COLUMN apple_href TEXT"],
+}
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "calsync.db"), str(tmp_path / "event_map.toml"), str(tmp_path / "sync_state.toml")
+
+
+def old_database(path, version):
+    """Create a database as a calsync with the given schema version left it, with one mapping and a token."""
+    conn = sqlite3.connect(path)
+    for step in range(1, version + 1):
+        for statement in SCHEMA[step]:
+            conn.execute(statement)
+    conn.execute("INSERT INTO guid_map (guid, event_id) VALUES ('uid-old', 'event-old')")
+    conn.execute("INSERT INTO sync_state (key, value) VALUES ('g_sync_token', 'old-token')")
+    conn.execute(f"PRAGMA user_version = {version}")
+    conn.commit()
+    conn.close()
+
+
+def legacy_toml(map_file, state_file):
+    guid_map = GuidMap({"uid-1": "event-1", "uid-2": "event-2"}, hashes={"uid-1": "hash-1"},
+                       etags={"uid-1": '"etag-1"'}, ends={"uid-1": "2025-06-01T00:00:00+00:00", "uid-2": ""},
+                       hrefs={"uid-2": "/calendars/test/uid-2.ics"})
+    legacy = TomlStateStore(map_file, state_file)
+    legacy.save_guid_map(guid_map)
+    legacy.set_token("g_sync_token", "google-token")
+    legacy.set_token("apple_sync_token", "apple-token")
+    return guid_map
+
+
+def test_toml_state_is_migrated_once(paths):
+    expected = legacy_toml(*paths[1:])
+    store = SqliteStateStore(*paths)
+    guid_map = store.load_guid_map()
+    assert guid_map == expected
+    assert (guid_map.hashes, guid_map.etags, guid_map.ends, guid_map.hrefs) == \
+           (expected.hashes, expected.etags, expected.ends, expected.hrefs)
+    assert store.get_token("g_sync_token") == "google-token"
+    assert store.get_token("apple_sync_token") == "apple-token"
+    del guid_map["uid-1"]
+    store.save_guid_map(guid_map)
+    store.close()
+
+    # The TOML files are left alone and not imported again.
+    assert toml.load(paths[1])["guid_map"] == dict(expected)
+    store = SqliteStateStore(*paths)
+    assert store.load_guid_map() == {"uid-2": "event-2"}
+    store.close()
+
+
+def test_new_database_without_toml_state(paths):
+    store = SqliteStateStore(*paths)
+    assert store.load_guid_map() == {}
+    assert store.get_token("g_sync_token") is None
+    assert store.conn.execute("PRAGMA user_version").fetchone()[0] == SqliteStateStore.SCHEMA_VERSION
+    store.close()
+
+
+@pytest.mark.parametrize("version", range(1, SqliteStateStore.SCHEMA_VERSION))
+def test_older_schema_is_upgraded_keeping_its_data(paths, version):
+    old_database(paths[0], version)
+    legacy_toml(*paths[1:])
+    store = SqliteStateStore(*paths)
+    assert store.conn.execute("PRAGMA user_version").fetchone()[0] == SqliteStateStore.SCHEMA_VERSION
+    # Only a database created from scratch imports the TOML files.
+    guid_map = store.load_guid_map()
+    assert guid_map == {"uid-old": "event-old"}
+    assert store.get_token("g_sync_token") == "old-token"
+
+    guid_map["uid-new"] = "event-new"
+    guid_map.set_hash("uid-new", "hash")
+    guid_map.set_etag("uid-new", '"etag"')
+    guid_map.set_end("uid-new", "")
+    guid_map.set_href("uid-new", "/calendars/test/uid-new.ics")
+    store.save_guid_map(guid_map)
+    store.journal_append([{"op": "delete", "guid": "uid-old"}])
+    store.close()
+
+    store = SqliteStateStore(*paths)
+    guid_map = store.load_guid_map()
+    assert guid_map == {"uid-old": "event-old", "uid-new": "event-new"}
+    assert (guid_map.hashes, guid_map.etags, guid_map.ends, guid_map.hrefs) == (
+        {"uid-new": "hash"}, {"uid-new": '"etag"'}, {"uid-new": ""}, {"uid-new": "/calendars/test/uid-new.ics"})
+    assert store.journal_pending() == [{"op": "delete", "guid": "uid-old", "seq": 1}]
+    store.close()
+
+
+def test_failed_upgrade_leaves_the_old_schema(paths):
+    old_database(paths[0], 2)
+    conn = sqlite3.connect(paths[0])
+    # A column the version 4 step adds already exists, so that step fails.
+    conn.execute("ALTER TABLE guid_map ADD COLUMN event_end TEXT")
+    conn.commit()
+    conn.close()
+
+    with pytest.raises(sqlite3.OperationalError):
+        SqliteStateStore(*paths)
+    conn = sqlite3.connect(paths[0])
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 2
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(guid_map)")]
+    assert columns == ["guid", "event_id", "body_hash", "event_end"]
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'journal'").fetchone() is None
+    conn.close()
+
+
+def test_failed_transaction_is_rolled_back(paths):
+    store = SqliteStateStore(*paths)
+    guid_map = store.load_guid_map()
+    guid_map["uid-1"] = "event-1"
+    store.save_guid_map(guid_map)
+
+    guid_map["uid-2"] = "event-2"
+    del guid_map["uid-1"]
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.save_guid_map(guid_map)
+            with store.transaction():
+                store.set_token("g_sync_token", "token")
+                store.journal_append([{"op": "insert", "guid": "uid-2"}])
+            raise RuntimeError("sync failed")
+
+    assert store.load_guid_map() == {"uid-1": "event-1"}
+    assert store.get_token("g_sync_token") is None
+    assert store.journal_pending() == []
+    # The rolled back changes are still pending in the map and go out with the next save.
+    store.save_guid_map(guid_map)
+    assert store.load_guid_map() == {"uid-2": "event-2"}
+    assert guid_map.changes() == ({}, set())
+    store.close()
@@ -0,0 +1,48 @@
+"""Verifier against the fake CalDAV and Google servers."""
+from verify import Verifier
+
+
+def live_uids(server):
+    return sorted(event["iCalUID"] for event in server.events.values() if event["status"] != "cancelled")
+
+
+def test_event_deleted_on_google_is_missing_even_without_stored_etag(caldav, google_server, make_sync):
+    caldav.populate(5)
+    calendar_sync = make_sync()
+    calendar_sync.sync()
+    # Mappings written before etags were recorded.
+    calendar_sync.guid_map.etags.clear()
+    google_server._delete(calendar_sync.guid_map["bench-1"])
+
+    verifier = Verifier(calendar_sync)
+    stats = verifier.verify()
+    assert verifier.drift == [("missing", "bench-1")]
+    assert stats["stale"] == 4
+
+    stats = Verifier(calendar_sync).verify(repair=True)
+    assert stats["repaired"] == 1
+    assert live_uids(google_server) == [f"bench-{idx}" for idx in range(5)]
+    verifier = Verifier(calendar_sync)
+    verifier.verify()
+    assert verifier.drift == []
+
+
+def test_modified_and_duplicate_events_are_repaired(caldav, google_server, make_sync):
+    caldav.populate(3)
+    calendar_sync = make_sync()
+    calendar_sync.sync()
+    with google_server._lock:
+        edited = dict(google_server.events[calendar_sync.guid_map["bench-0"]], summary="edited on Google")
+        google_server._store(edited)
+        google_server._store(dict(google_server.events[calendar_sync.guid_map["bench-2"]], id="copy"))
+
+    verifier = Verifier(calendar_sync)
+    verifier.verify()
+    assert sorted(verifier.drift) == [("duplicate", "bench-2"), ("modified", "bench-0")]
+
+    Verifier(calendar_sync).verify(repair=True)
+    assert live_uids(google_server) == ["bench-0", "bench-1", "bench-2"]
+    assert google_server.events[calendar_sync.guid_map["bench-0"]]["summary"] == "Bench event bench-0 rev 0"
+    verifier = Verifier(calendar_sync)
+    verifier.verify()
+    assert verifier.drift == []
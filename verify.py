@@ -0,0 +1,220 @@
+"""
+Drift detection between an Apple calendar and its Google mirror.
+
+The etags Google returned for our own mutations (kept in the GUID map) are compared
+with a compact listing of the Google calendar. Only UIDs whose etag changed are fetched
+in full from both calendars and compared by their normalized event bodies, and only
+real differences become repair mutations.
+"""
+import logging
+from collections import Counter
+from typing import Any
+
+from dateutil import parser
+
+from google_calendar import GoogleEventRecord
+from metrics import metrics
+from settings_utils import save_guid_map
+from sync import CalendarSync
+
+# Fields of a listed Google event that make up the body calsync pushes.
+BODY_FIELDS = ("items(id,iCalUID,etag,status,recurringEventId,summary,description,location,"
+               "start,end,sequence,recurrence),nextPageToken")
+
+
+def normalize_google_event(item):
+    """
+    Rebuild the body CalendarSync.transform_event would have produced from a Google event,
+    so its event_digest can be compared with the Apple side.
+    """
+    def normalize_time(value):
+        if "date" in value:
+            return {"date": value["date"]}
+        dt = parser.isoparse(value["dateTime"])
+        return {"dateTime": CalendarSync.to_rfc(dt), "timeZone": "UTC"}
+
+    event = {
+        "summary": item.get("summary", ""),
+        "description": item.get("description", ""),
+        "location": item.get("location", ""),
+        "start": normalize_time(item.get("start", {})),
+        "end": normalize_time(item.get("end", {})),
+        "iCalUID": item.get("iCalUID"),
+        "sequence": item.get("sequence", 0),
+    }
+    if item.get("recurrence"):
+        event["recurrence"] = list(item["recurrence"])
+    return event
+
+
+class Verifier:
+    """
+    Compares one sync pair's Google calendar with what calsync last pushed there and,
+    with repair=True, fixes the differences with the fewest Google mutations.
+
+    Drift kinds: "missing" (mapped event gone from Google), "modified" (Google content
+    differs from Apple), "deleted" (event gone from Apple but still on Google),
+    "duplicate" (extra Google copy of a mapped UID). Entries whose content matches but
+    whose stored etag is outdated or missing are "stale": they are not drift, and their
+    bookkeeping is brought up to date even without repair.
+    """
+    # Above this many UIDs to inspect, pull whole calendars instead of single objects.
+    BULK_THRESHOLD = 50
+
+    def __init__(self, calendar_sync: CalendarSync):
+        self.calendar_sync = calendar_sync
+        self.google_calendar = calendar_sync.google_calendar
+        self.apple_calendar = calendar_sync.apple_calendar
+        self.guid_map = calendar_sync.guid_map
+        self.stats: Counter[str] = Counter()
+        self.drift: list[tuple[str, Any]] = []
+
+    def _google_records(self):
+        """Map each mapped UID to its Google record, and collect other copies of mapped UIDs."""
+        records, duplicates = {}, []
+        page_token = None
+        while True:
+            page = self.google_calendar.list_events(
+                single_events=False, show_deleted=False, page_token=page_token, fields=GoogleEventRecord.FIELDS
+            )
+            for item in page.get("items", []):
+                record = GoogleEventRecord.from_item(item)
+                uid = record.iCalUID
+                if record.status == "cancelled" or record.recurringEventId or uid not in self.guid_map:
+                    continue
+                if self.guid_map[uid] == record.id:
+                    if uid in records:
+                        duplicates.append(records[uid])
+                    records[uid] = record
+                elif uid in records:
+                    duplicates.append(record)
+                else:
+                    records[uid] = record
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                break
+        # A UID may have been listed under another id before its mapped event showed up.
+        duplicates = [r for r in duplicates if records[r.iCalUID].id != r.id]
+        return records, duplicates
+
+    def _google_bodies(self, records):
+        """Return UID -> normalized Google body for the given records."""
+        if len(records) <= self.BULK_THRESHOLD:
+            return {uid: normalize_google_event(self.google_calendar.get_event(record.id))
+                    for uid, record in records.items()}
+        ids = {record.id: uid for uid, record in records.items()}
+        bodies = {}
+        page_token = None
+        while True:
+            page = self.google_calendar.list_events(
+                single_events=False, show_deleted=False, page_token=page_token, fields=BODY_FIELDS
+            )
+            for item in page.get("items", []):
+                if item["id"] in ids:
+                    bodies[ids[item["id"]]] = normalize_google_event(item)
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                return bodies
+
+    def _apple_bodies(self, uids):
+        """Return UID -> transformed Apple body, with None for UIDs no longer on Apple."""
+        bodies = dict.fromkeys(uids)
+        if len(uids) <= self.BULK_THRESHOLD:
+            objects = (self.apple_calendar.event_by_uid(uid) for uid in uids)
+            objects = (obj for obj in objects if obj is not None)
+        else:
+            # A full pull lists no removed objects.
+            _, objects = self.apple_calendar.changes_in_chunks(sync_token=None)
+        for obj in objects:
+            try:
+                body = CalendarSync.transform_event(obj)
+            except ValueError as e:
+                logging.debug(f"Skipping Apple object during verify: {e}")
+                continue
+            if body["iCalUID"] in bodies:
+                bodies[body["iCalUID"]] = body
+        return bodies
+
+    def verify(self, repair=False):
+        """Check the pair for drift; returns the stats Counter. Found drift is in self.drift."""
+        self.stats = Counter()
+        self.drift = []
+        guid_map = self.guid_map
+        with metrics.timer("calsync_phase_seconds", phase="verify", pair=self.calendar_sync.name):
+            records, duplicates = self._google_records()
+            # Mappings without a stored etag (older state) are only checked for presence.
+            suspects = [uid for uid in guid_map
+                        if uid not in records or guid_map.etags.get(uid) != records[uid].etag]
+            self.stats['checked'] = len(guid_map)
+            logging.info(f"Verify: {len(suspects)} of {len(guid_map)} events missing or changed, comparing them")
+
+            apple_bodies = self._apple_bodies(suspects) if suspects else {}
+            google_bodies = self._google_bodies({uid: records[uid] for uid in suspects if uid in records})
+            for uid in suspects:
+                apple_body = apple_bodies.get(uid)
+                google_body = google_bodies.get(uid)
+                if apple_body is None:
+                    kind = "deleted" if uid in records else "stale"
+                elif google_body is None:
+                    kind = "missing"
+                elif CalendarSync.event_digest(apple_body) != CalendarSync.event_digest(google_body):
+                    kind = "modified"
+                else:
+                    kind = "stale"
+                if kind == "stale":
+                    # Only our bookkeeping is out of date; fix it so the next run skips this UID.
+                    self.stats['stale'] += 1
+                    self._repair(kind, uid, apple_body, records.get(uid))
+                    continue
+                self._record(kind, uid)
+                if repair:
+                    self._repair(kind, uid, apple_body, records.get(uid))
+            for record in duplicates:
+                self._record("duplicate", record.iCalUID)
+                if repair:
+                    self._delete(record.id)
+            if repair or self.stats['stale']:
+                with self.calendar_sync.state.transaction():
+                    save_guid_map(guid_map, self.calendar_sync.state)
+        return self.stats
+
+    def _record(self, kind, uid):
+        self.drift.append((kind, uid))
+        self.stats[kind] += 1
+
+    def _repair(self, kind, uid, apple_body, record):
+        google_calendar = self.google_calendar
+        guid_map = self.guid_map
+        if kind == "deleted" or (kind == "stale" and apple_body is None):
+            # Gone from Apple: drop the mirror and the mapping.
+            if record is not None:
+                self._delete(record.id)
+            del guid_map[uid]
+            return
+        if kind == "missing":
+            # The deleted Google copy keeps its iCalUID, so events.insert would fail with 409.
+            response = google_calendar.restore_event(apple_body)
+        elif kind == "modified":
+            response = google_calendar.update_event(record.id, apple_body)
+        else:
+            response = {"id": record.id, "etag": record.etag}
+        guid_map[uid] = response["id"]
+        guid_map.set_hash(uid, CalendarSync.event_digest(apple_body))
+        if response.get("etag"):
+            guid_map.set_etag(uid, response["etag"])
+        if kind != "stale":
+            self.stats['repaired'] += 1
+
+    def _delete(self, event_id):
+        try:
+            self.google_calendar.delete_event(event_id)
+        except Exception as e:
+            if getattr(getattr(e, 'resp', None), 'status', None) not in (404, 410):
+                raise
+        self.stats['repaired'] += 1
+
+    def summary(self):
+        stats = self.stats
+        return (f"Verify summary: {stats['checked']} checked, "
+                f"{stats['missing']} missing, {stats['modified']} modified, {stats['deleted']} deleted, "
+                f"{stats['duplicate']} duplicate, {stats['repaired']} repaired, {stats['stale']} stale entries updated")